@@ -0,0 +1,21 @@
+#!/usr/bin/env bash
+
+# A streaming replica of the database service, to test the read replica
+# routing locally. The first start copies the primary with pg_basebackup.
+
+set -u
+set -e
+
+until pg_isready -h database -U "$POSTGRES_USER"
+do
+	echo "Waiting for the primary..."
+	sleep 2
+done
+
+if [ ! -s "$PGDATA/PG_VERSION" ]; then
+	PGPASSWORD="$POSTGRES_PASSWORD" pg_basebackup \
+		-h database -U "$POSTGRES_USER" -D "$PGDATA" -X stream -R
+	chmod 700 "$PGDATA"
+fi
+
+exec postgres
@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+
+# Run by the entrypoint of the postgres image when the database is created:
+# allow the streaming replica of docker-compose to connect.
+
+set -u
+set -e
+
+echo "host replication all all md5" >> "$PGDATA/pg_hba.conf"
@@ -13,9 +13,12 @@ docker-compose -p iotsignals_load run api /deploy/docker-wait.sh
 docker-compose -p iotsignals_load run api /deploy/docker-migrate.sh
 docker-compose -p iotsignals_load run api python /app/make_paritions.py
 
-# Run the load test
-docker-compose -p iotsignals_load up locust
+# Run the load test, it fails when one of the SLOs in locustfile.py was missed
+status=0
+docker-compose -p iotsignals_load run --rm locust || status=$?
 
 # Remove remaining docker containers
 docker-compose -p iotsignals_load down
 docker-compose -p iotsignals_load rm -f
+
+exit ${status}
@@ -8,3 +8,9 @@ cd /app/
 
 yes yes | python manage.py migrate --noinput
 
+# the shards of the passages, see src/passage/sharding.py
+IFS=',' read -ra SHARD_HOSTS <<< "${DATABASE_SHARD_HOSTS:-}"
+for n in "${!SHARD_HOSTS[@]}"
+do
+	yes yes | python manage.py migrate --noinput --database "shard_$((n + 1))"
+done
@@ -0,0 +1,18 @@
+#!/usr/bin/env bash
+
+set -u   # crash on missing env variables
+set -e   # stop on any error
+
+# start with fresh metrics, see src/metrics.py
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+	rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+	mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+fi
+
+# run the ASGI entry point, see src/iotsignals/asgi.py
+cd /app/
+exec uvicorn iotsignals.asgi:application \
+	--host 0.0.0.0 \
+	--port "${ASGI_PORT:-8002}" \
+	--workers "${ASGI_WORKERS:-4}" \
+	--no-access-log
@@ -0,0 +1,32 @@
+#!/usr/bin/env bash
+# Run the locust scenarios of locustfile.py headless and check their SLOs.
+# Writes loadtest.html, loadtest_*.csv and the verdict loadtest_slo.csv to
+# LOADTEST_REPORT_DIR, and exits with 1 when an SLO was missed.
+
+set -u   # crash on missing env variables
+set -e   # stop on any error
+
+DIR="$(dirname $0)"
+
+HOST=${LOADTEST_HOST:-http://api:8001}
+USERS=${LOADTEST_USERS:-250}
+SPAWN_RATE=${LOADTEST_SPAWN_RATE:-25}
+RUN_TIME=${LOADTEST_RUN_TIME:-2m}
+REPORT_DIR=${LOADTEST_REPORT_DIR:-/opt/reports}
+LOCUSTFILE=${LOCUSTFILE:-${DIR}/../../locustfile.py}
+
+mkdir -p "${REPORT_DIR}"
+
+# Extra arguments are passed on, e.g. the names of the scenarios to run
+status=0
+locust -f "${LOCUSTFILE}" --host="${HOST}" --headless --only-summary \
+	--users "${USERS}" --spawn-rate "${SPAWN_RATE}" --run-time "${RUN_TIME}" \
+	--csv "${REPORT_DIR}/loadtest" --html "${REPORT_DIR}/loadtest.html" \
+	--slo-report "${REPORT_DIR}/loadtest_slo.csv" "$@" || status=$?
+
+if [ "${status}" -eq 0 ]; then
+	echo "Load test PASSED, report: ${REPORT_DIR}/loadtest.html"
+else
+	echo "Load test FAILED, see ${REPORT_DIR}/loadtest_slo.csv and ${REPORT_DIR}/loadtest.html"
+fi
+exit "${status}"
@@ -3,6 +3,12 @@
 set -u   # crash on missing env variables
 set -e   # stop on any error
 
+# start with fresh metrics, see src/metrics.py
+if [ -n "${PROMETHEUS_MULTIPROC_DIR:-}" ]; then
+	rm -rf "${PROMETHEUS_MULTIPROC_DIR}"
+	mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+fi
+
 # run uwsgi
 cd /app/
 exec uwsgi
@@ -0,0 +1,42 @@
+from django.http import QueryDict
+from passage.views import PassageViewSet
+from writers import CSVExport
+
+
+def test_csv_serializer(benchmark, export_rows):
+    def export():
+        return sum(len(line) for line in CSVExport.serializer(iter(export_rows)))
+
+    assert benchmark(export) > 0
+
+
+def test_csv_export_count(benchmark, export_rows):
+    # Including the metrics and tracing of CSVExport.export
+    def export():
+        lines = CSVExport.count(CSVExport.serializer(iter(export_rows)), 'benchmark')
+        return sum(len(line) for line in lines)
+
+    assert benchmark(export) > 0
+
+
+def test_export_query(benchmark):
+    params = QueryDict('year=2021&week=22')
+
+    def build():
+        return str(PassageViewSet.get_export_queryset(params).query)
+
+    assert 'passage_passagehouraggregation' in benchmark(build)
+
+
+def test_export_query_last_week(benchmark):
+    def build():
+        return str(PassageViewSet.get_export_queryset(QueryDict()).query)
+
+    assert 'passage_passagehouraggregation' in benchmark(build)
+
+
+def test_export_taxi_query(benchmark):
+    def build():
+        return str(PassageViewSet.get_export_taxi_queryset().query)
+
+    assert 'taxi_indicator' in benchmark(build)
@@ -0,0 +1,34 @@
+"""
+The decoding cost and payload size of the passage in JSON, MessagePack and
+CBOR. The size is in the extra_info of the benchmark (--benchmark-json).
+"""
+import io
+
+import pytest
+from contrib.rest_framework.parsers import CBORParser, MessagePackParser
+from contrib.rest_framework.renderers import CBORRenderer, MessagePackRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+FORMATS = {
+    'json': (JSONParser, JSONRenderer),
+    'msgpack': (MessagePackParser, MessagePackRenderer),
+    'cbor': (CBORParser, CBORRenderer),
+}
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_parse(benchmark, camel_message, name):
+    parser, renderer = FORMATS[name]
+    body = renderer().render(camel_message)
+    benchmark.extra_info['bytes'] = len(body)
+
+    data = benchmark(lambda: parser().parse(io.BytesIO(body)))
+    assert data == camel_message
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_render(benchmark, message, name):
+    parser, renderer = FORMATS[name]
+    body = benchmark(renderer().render, message)
+    benchmark.extra_info['bytes'] = len(body)
@@ -0,0 +1,120 @@
+"""
+Inserts into and scans of a day of passages, with the B-tree indexes on
+passage_at and created_at of before passage_indexes, and with its BRIN
+indexes. The day of the query plan dataset is copied into a scratch table,
+which is like a partition, with the indexes of each strategy.
+"""
+from datetime import datetime, time, timedelta
+
+import pytest
+from django.db import connection
+from passage import query_plans
+from passage.management.commands.passage_hour_aggregation import (
+    Command as HourAggregationCommand,
+)
+
+DAY = query_plans.DATASET_START
+ROWS = 100000
+TABLE = 'bench_passage'
+
+STRATEGIES = {
+    'btree': [
+        f'CREATE INDEX ON {TABLE} (passage_at)',
+        f'CREATE INDEX ON {TABLE} (created_at)',
+    ],
+    'brin': [
+        f'CREATE INDEX ON {TABLE} USING brin (passage_at) WITH (autosummarize = on)',
+        f'CREATE INDEX ON {TABLE} USING brin (created_at) WITH (autosummarize = on)',
+    ],
+}
+
+SQL_COUNT_HOUR = f"""
+    SELECT camera_id, count(*) FROM {TABLE}
+    WHERE passage_at >= %s AND passage_at < %s
+    GROUP BY camera_id
+"""
+
+
+@pytest.fixture(scope='module')
+def dataset(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        query_plans.load_dataset(days=1, rows_per_day=ROWS)
+
+
+def create_table(cursor):
+    cursor.execute(
+        f'CREATE TABLE {TABLE} (LIKE passage_passage INCLUDING DEFAULTS, '
+        f'PRIMARY KEY (id, passage_at))'
+    )
+
+
+def create_indexes(strategy, cursor):
+    for statement in STRATEGIES[strategy]:
+        cursor.execute(statement)
+
+
+def copy_day(cursor):
+    cursor.execute(
+        f'INSERT INTO {TABLE} SELECT * FROM passage_passage '
+        f'WHERE passage_at >= %s AND passage_at < %s ORDER BY passage_at',
+        [DAY, DAY + timedelta(days=1)],
+    )
+    return cursor.rowcount
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_insert(benchmark, dataset, strategy):
+    def setup():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+            create_table(cursor)
+            create_indexes(strategy, cursor)
+        return (), {}
+
+    def insert():
+        with connection.cursor() as cursor:
+            return copy_day(cursor)
+
+    rows = benchmark.pedantic(insert, setup=setup, rounds=5)
+    assert rows == ROWS
+    benchmark.extra_info['rows_per_second'] = round(ROWS / benchmark.stats['median'])
+
+
+@pytest.fixture
+def table(dataset, strategy):
+    # The indexes after the copy, so the BRIN ranges are all summarized
+    with connection.cursor() as cursor:
+        create_table(cursor)
+        copy_day(cursor)
+        create_indexes(strategy, cursor)
+        cursor.execute(f'ANALYZE {TABLE}')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_scan_hour(benchmark, table, strategy):
+    # An hour of the evening rush
+    params = [datetime.combine(DAY, time(17)), datetime.combine(DAY, time(18))]
+
+    def scan():
+        with connection.cursor() as cursor:
+            cursor.execute(SQL_COUNT_HOUR, params)
+            return cursor.fetchall()
+
+    assert benchmark(scan)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_scan_day(benchmark, table, strategy):
+    # The select of the hour aggregation, on the scratch table
+    select = HourAggregationCommand()._get_select_query(DAY)
+    select = select.replace('FROM passage_passage', f'FROM {TABLE}')
+
+    def scan():
+        with connection.cursor() as cursor:
+            cursor.execute(select)
+            return cursor.fetchall()
+
+    assert benchmark(scan)
@@ -0,0 +1,55 @@
+import uuid
+
+import pytest
+from passage.case_converters import to_snakecase
+from passage.serializers import PassageDetailSerializer, TracedGeometryField
+
+
+def test_to_snakecase(benchmark):
+    assert benchmark(to_snakecase, 'europeseVoertuigcategorieToevoeging') == (
+        'europese_voertuigcategorie_toevoeging'
+    )
+
+
+def test_key_conversion(benchmark, camel_message):
+    # As in PassageViewSet.create
+    def convert():
+        return {to_snakecase(k): v for k, v in camel_message.items()}
+
+    assert 'camera_locatie' in benchmark(convert)
+
+
+def test_geometry_to_internal_value(benchmark, message):
+    field = TracedGeometryField()
+    point = benchmark(field.to_internal_value, message['camera_locatie'])
+    assert point.coords == (4.945936, 52.301221)
+
+
+def test_geometry_to_representation(benchmark, message):
+    field = TracedGeometryField()
+    point = field.to_internal_value(message['camera_locatie'])
+    assert benchmark(field.to_representation, point)['type'] == 'Point'
+
+
+def test_serializer_validation(benchmark, message):
+    def validate():
+        serializer = PassageDetailSerializer(data=message)
+        serializer.is_valid(raise_exception=True)
+        return serializer
+
+    assert benchmark(validate).validated_data['merk'] == 'SPYKER'
+
+
+def test_serializer_representation(benchmark, passages):
+    assert benchmark(lambda: PassageDetailSerializer(passages[0]).data)['id']
+
+
+@pytest.mark.django_db
+def test_serializer_create(benchmark, message):
+    def setup():
+        data = dict(message, id=str(uuid.uuid4()))
+        serializer = PassageDetailSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return (serializer,), {}
+
+    benchmark.pedantic(lambda serializer: serializer.save(), setup=setup, rounds=200)
@@ -0,0 +1,85 @@
+"""
+Compare a benchmark run with the baseline, exits with 1 on regressions.
+
+    pytest benchmarks --benchmark-json=/tmp/benchmark.json
+    python -m benchmarks.compare /tmp/benchmark.json --threshold 10
+
+The medians are compared, as they are less sensitive to the occasional
+hiccup than the means. Timings depend on the machine, record a baseline on
+the machine the comparisons are made on with --save.
+"""
+import argparse
+import json
+import os
+import sys
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def load(path):
+    with open(path) as f:
+        return {b['fullname']: b['stats']['median'] for b in json.load(f)['benchmarks']}
+
+
+def save(current_path, baseline_path):
+    """Store the run as baseline, without the timings of the separate rounds."""
+    with open(current_path) as f:
+        run = json.load(f)
+    for benchmark in run['benchmarks']:
+        benchmark['stats'].pop('data', None)
+    with open(baseline_path, 'w') as f:
+        json.dump(run, f, indent=2)
+        f.write('\n')
+
+
+def compare(baseline, current, threshold):
+    """Return the report lines and the names of the regressed benchmarks."""
+    lines = []
+    regressions = []
+    for name, median in sorted(current.items()):
+        if name not in baseline:
+            lines.append(f'{name}: {median * 1e6:.1f} us (no baseline)')
+            continue
+
+        change = (median - baseline[name]) / baseline[name] * 100
+        line = (
+            f'{name}: {baseline[name] * 1e6:.1f} -> {median * 1e6:.1f} us '
+            f'({change:+.1f}%)'
+        )
+        if change > threshold:
+            regressions.append(name)
+            line += ' REGRESSION'
+        lines.append(line)
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('current', help='JSON output of the benchmark run')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=10,
+        help='Slowdown of the median (in percent) that counts as a regression',
+    )
+    parser.add_argument(
+        '--save', action='store_true', help='Store the run as the new baseline'
+    )
+    args = parser.parse_args(argv)
+
+    if args.save:
+        save(args.current, args.baseline)
+        return 0
+
+    baseline, current = load(args.baseline), load(args.current)
+    lines, regressions = compare(baseline, current, args.threshold)
+    print('\n'.join(lines))
+    if regressions:
+        print(f'{len(regressions)} regressions over {args.threshold}%')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
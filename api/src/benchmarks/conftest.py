@@ -0,0 +1,77 @@
+import copy
+import datetime
+
+import factory.random
+import pytest
+from django.utils import timezone
+from passage.case_converters import to_camelcase
+from passage.tests.factories import PassageFactory
+
+# locustfile.create_message(), with a fixed id and timestamps
+MESSAGE = {
+    "id": "5ad2a8d9-7a2a-4cc4-a6a4-3a84d4c2a7b1",
+    "passage_at": "2021-06-01T12:00:00+02:00",
+    "created_at": "2021-06-01T12:00:01+02:00",
+    "version": "1",
+    "straat": None,
+    "rijrichting": 1,
+    "rijstrook": 2,
+    "camera_id": "00856ef3-c6f5-4194-9531-a3267839674a",
+    "camera_naam": "Muntbergweg (s111) nabij afrit (A9) uit oost - Rijstrook 2",
+    "camera_kijkrichting": 337.5,
+    "camera_locatie": {"type": "Point", "coordinates": [4.945936, 52.301221]},
+    "kenteken_land": "NL",
+    "kenteken_nummer_betrouwbaarheid": 990,
+    "kenteken_land_betrouwbaarheid": 0,
+    "kenteken_karakters_betrouwbaarheid": None,
+    "indicatie_snelheid": None,
+    "automatisch_verwerkbaar": None,
+    "voertuig_soort": "Personenauto",
+    "merk": "SPYKER",
+    "inrichting": "stationwagen",
+    "datum_eerste_toelating": "2001-02-01",
+    "datum_tenaamstelling": "2001-02-02",
+    "toegestane_maximum_massa_voertuig": 4000,
+    "europese_voertuigcategorie": "M1",
+    "europese_voertuigcategorie_toevoeging": None,
+    "taxi_indicator": False,
+    "maximale_constructie_snelheid_bromsnorfiets": None,
+    "brandstoffen": [{"volgnr": 1, "brandstof": "Benzine", "euroklasse": "Euro 3"}],
+    "extra_data": None,
+    "diesel": None,
+    "gasoline": None,
+    "electric": None,
+    "versit_klasse": "LPABEUR3",
+}
+
+
+@pytest.fixture
+def message():
+    return copy.deepcopy(MESSAGE)
+
+
+@pytest.fixture
+def camel_message():
+    return {to_camelcase(k): v for k, v in MESSAGE.items()}
+
+
+@pytest.fixture(scope='session')
+def passages():
+    factory.random.reseed_random(20210601)
+    return PassageFactory.build_batch(
+        1000, passage_at=timezone.make_aware(datetime.datetime(2021, 6, 1, 12))
+    )
+
+
+@pytest.fixture(scope='session')
+def export_rows(passages):
+    """Rows like the ones of the hour aggregation export."""
+    return [
+        {
+            'camera_id': passage.camera_id,
+            'camera_naam': passage.camera_naam,
+            'bucket': passage.passage_at + datetime.timedelta(hours=i % 24),
+            'sum': passage.rijstrook * 100,
+        }
+        for i, passage in enumerate(passages)
+    ]
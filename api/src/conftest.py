@@ -5,3 +5,10 @@ from rest_framework.test import APIClient
 @pytest.fixture
 def api_client():
     return APIClient()
+
+
+@pytest.fixture(autouse=True)
+def single_database(settings):
+    # Replicas and shards don't see the rows of the transaction of a test
+    settings.DATABASE_REPLICAS = []
+    settings.DATABASE_SHARDS = []
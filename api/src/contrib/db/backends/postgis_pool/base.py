@@ -0,0 +1,50 @@
+"""
+The PostGIS backend with a connection pool per process.
+
+Closing a connection returns it to the pool, so use it with CONN_MAX_AGE 0:
+every request and every thread of a management command gets a connection
+from the pool, without connecting to the database again. The pool is set
+with POOL in the database settings, see pool.ConnectionPool:
+
+    'POOL': {'MAX_SIZE': 10, 'MAX_LIFETIME': 3600, 'CHECK_AFTER': 30, 'TIMEOUT': 10}
+"""
+from django.contrib.gis.db.backends.postgis.base import (
+    DatabaseWrapper as PostGISDatabaseWrapper,
+)
+
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        self.pool = get_pool(
+            self.alias,
+            conn_params,
+            **{key.lower(): value for key, value in options.items()},
+        )
+        connection = self.pool.getconn()
+
+        # Like the postgresql backend
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,12 @@
+from django.db.backends.postgresql.creation import (
+    DatabaseCreation as PostgreSQLDatabaseCreation,
+)
+
+from .pool import close_idle_connections
+
+
+class DatabaseCreation(PostgreSQLDatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # The returned connections are still connected to the test database
+        close_idle_connections()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,189 @@
+import logging
+import os
+import threading
+import time
+import weakref
+
+import psycopg2
+from metrics import DB_POOL_CONNECTIONS
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+log = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    A pool of psycopg2 connections, shared by the threads of a process.
+
+    A connection that has been idle for check_after seconds is checked with
+    a SELECT 1 before it's handed out, and connections older than
+    max_lifetime are closed instead of being reused. Connections that are
+    never returned don't count against max_size once they're garbage
+    collected.
+    """
+
+    def __init__(
+        self,
+        conn_params,
+        alias='default',
+        max_size=10,
+        max_lifetime=3600,
+        check_after=30,
+        timeout=10,
+    ):
+        self.conn_params = dict(conn_params, connection_factory=PooledConnection)
+        self.alias = alias
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        # Most recently returned last, so the same few connections stay warm
+        self.idle = []
+        self.in_use = weakref.WeakSet()
+        self.connecting = 0
+        self.pid = os.getpid()
+
+    @property
+    def size(self):
+        return len(self.idle) + len(self.in_use) + self.connecting
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = self._checkout(deadline)
+            if conn is None:
+                return self._connect()
+            if self.is_usable(conn):
+                return conn
+            DB_POOL_CONNECTIONS.labels(self.alias, 'broken').inc()
+            self.discard(conn)
+
+    def _checkout(self, deadline):
+        """Take an idle connection, or reserve room for a new one and return None."""
+        with self.condition:
+            if self.pid != os.getpid():
+                # Forked, the connections belong to the parent. Don't close
+                # them, that would end the sessions of the parent as well.
+                self.reset()
+            while not self.idle and self.size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    DB_POOL_CONNECTIONS.labels(self.alias, 'timeout').inc()
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout}s'
+                        f' ({self.max_size} connections in use)'
+                    )
+                self.condition.wait(remaining)
+            if self.idle:
+                conn = self.idle.pop()
+                self.in_use.add(conn)
+                return conn
+            self.connecting += 1
+            return None
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(**self.conn_params)
+        except Exception:
+            with self.condition:
+                self.connecting -= 1
+                self.condition.notify()
+            raise
+        DB_POOL_CONNECTIONS.labels(self.alias, 'opened').inc()
+        with self.condition:
+            self.connecting -= 1
+            self.in_use.add(conn)
+        return conn
+
+    def is_usable(self, conn):
+        if conn.closed or self.is_expired(conn):
+            return False
+        if time.monotonic() - conn.returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not conn.autocommit:
+                conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def is_expired(self, conn):
+        return time.monotonic() - conn.created_at > self.max_lifetime
+
+    def putconn(self, conn):
+        """Return a connection, it's closed when it's broken or too old."""
+        keep = not conn.closed
+        if keep and self.is_expired(conn):
+            DB_POOL_CONNECTIONS.labels(self.alias, 'recycled').inc()
+            keep = False
+        if keep and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            # e.g. closed in a failed transaction
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        with self.condition:
+            self.in_use.discard(conn)
+            if keep and self.pid == os.getpid():
+                conn.returned_at = time.monotonic()
+                self.idle.append(conn)
+            self.condition.notify()
+        if not keep:
+            close(conn)
+
+    def discard(self, conn):
+        with self.condition:
+            self.in_use.discard(conn)
+            self.condition.notify()
+        close(conn)
+
+    def close_idle(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            close(conn)
+
+
+def close(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        log.debug('Closing a pooled connection failed', exc_info=True)
+
+
+def get_pool(alias, conn_params, **options):
+    """Return the pool of the connection parameters, one per process."""
+    key = (alias, tuple(sorted((k, str(v)) for k, v in conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(conn_params, alias=alias, **options)
+        return _pools[key]
+
+
+def close_idle_connections():
+    """Close the idle connections of all pools, e.g. before dropping a database."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
@@ -0,0 +1,32 @@
+"""
+Server side prepared statements.
+
+A statement is prepared the first time it's executed on a connection, after
+that only its name and parameters are sent, and Postgres skips parsing and
+planning. A prepared statement lasts as long as the connection, which with
+the pooled backend (see backends/postgis_pool) is up to POOL MAX_LIFETIME.
+
+Not for use behind pgbouncer in transaction mode, the next transaction can
+be on a server connection that doesn't have the statement.
+"""
+import threading
+import weakref
+
+# The names of the statements prepared on each psycopg2 connection
+_prepared = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def execute_prepared(cursor, name, sql, params):
+    """Execute sql, with $1, $2, .. placeholders, as the prepared statement `name`."""
+    connection = cursor.db.connection
+    with _lock:
+        prepared = _prepared.setdefault(connection, set())
+
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} AS {sql}')
+        # Not undone by a rollback, the statement stays until DEALLOCATE
+        prepared.add(name)
+
+    placeholders = ', '.join(['%s'] * len(params))
+    cursor.execute(f'EXECUTE {name} ({placeholders})', params)
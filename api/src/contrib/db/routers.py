@@ -0,0 +1,123 @@
+"""
+Routing of reads to the read-only replicas of the default database.
+
+The replicas are the aliases in DATABASE_REPLICAS. Everything goes to the
+primary, except the reads within use_replica(): those go to a replica that
+is no more than DATABASE_REPLICA_MAX_LAG seconds behind, or to the primary
+when there is none. The lag of a replica is checked at most once every
+DATABASE_REPLICA_CHECK_INTERVAL seconds per process.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from metrics import DB_REPLICA_READS
+
+log = logging.getLogger(__name__)
+
+# Nothing to replay means the replica is up to date, even when the last
+# transaction it replayed is old because nothing was written since. Only
+# while it is streaming: the receive LSN of a replica that lost the primary
+# stands still, so replay always catches up with it. Otherwise the age of
+# the last replayed transaction is the lag, and NULL (nothing replayed) is
+# unavailable. The status of the WAL receiver needs pg_read_all_stats.
+SQL_REPLICA_LAG = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        AND EXISTS (SELECT FROM pg_stat_wal_receiver WHERE status = 'streaming')
+        THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+_local = threading.local()
+# alias: (checked at, lag in seconds or None when it can't be reached)
+_lags = {}
+
+
+def replica_lag(alias):
+    """Return the replication lag of a replica in seconds, None when it's down."""
+    now = time.monotonic()
+    checked_at, lag = _lags.get(alias, (None, None))
+    if checked_at is not None:
+        if now - checked_at < settings.DATABASE_REPLICA_CHECK_INTERVAL:
+            return lag
+
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(SQL_REPLICA_LAG)
+            lag = cursor.fetchone()[0]
+        if lag is None:
+            log.warning('Replica %s has not replayed anything', alias)
+        else:
+            lag = float(lag)
+    except DatabaseError:
+        log.warning('Replica %s is not available', alias, exc_info=True)
+        connections[alias].close_if_unusable_or_obsolete()
+        lag = None
+
+    _lags[alias] = (now, lag)
+    return lag
+
+
+def choose_replica():
+    """Return the alias of a replica that is recent enough, or of the primary."""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.DATABASE_REPLICA_MAX_LAG:
+            DB_REPLICA_READS.labels(alias).inc()
+            return alias
+
+    if replicas:
+        log.warning(
+            'No replica within %ss of the primary, reading from the primary',
+            settings.DATABASE_REPLICA_MAX_LAG,
+        )
+    DB_REPLICA_READS.labels(DEFAULT_DB_ALIAS).inc()
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_replica():
+    """
+    Route the reads of the ORM within the block to a replica, and return its
+    alias for raw queries. Also a decorator: @use_replica().
+
+    Querysets that are evaluated after the block, like streamed exports,
+    have to be bound with queryset.using(alias).
+    """
+    previous = getattr(_local, 'alias', None)
+    # Nested blocks read from the same database
+    _local.alias = previous or choose_replica()
+    try:
+        yield _local.alias
+    finally:
+        _local.alias = previous
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return getattr(_local, 'alias', None)
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema of the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,70 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from contrib.db.backends.postgis_pool.pool import ConnectionPool, PoolTimeout
+from django.db import connection
+
+
+@pytest.fixture
+def pool():
+    pool = ConnectionPool(
+        connection.get_connection_params(), max_size=2, check_after=30, timeout=0.2
+    )
+    yield pool
+    pool.close_idle()
+
+
+@pytest.mark.django_db
+class TestConnectionPool:
+    def test_reuse(self, pool):
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert pool.size == 1
+
+    def test_timeout(self, pool):
+        pool.getconn(), pool.getconn()
+        with pytest.raises(PoolTimeout):
+            pool.getconn()
+
+    def test_wait_for_returned(self, pool):
+        first, _ = pool.getconn(), pool.getconn()
+        threading.Timer(0.05, pool.putconn, [first]).start()
+        assert pool.getconn() is first
+
+    def test_recycle_expired(self, pool):
+        conn = pool.getconn()
+        conn.created_at -= pool.max_lifetime + 1
+        pool.putconn(conn)
+        assert conn.closed
+        assert pool.size == 0
+
+    def test_rollback_on_return(self, pool):
+        conn = pool.getconn()
+        conn.cursor().execute('SELECT 1')
+        pool.putconn(conn)
+        assert pool.getconn().get_transaction_status() == 0
+
+    def test_broken(self, pool):
+        broken = pool.getconn()
+        pool.putconn(broken)
+        broken.returned_at = time.monotonic() - pool.check_after
+        # A connection closed by the server fails the check and is replaced
+        with connection.cursor() as cursor:
+            pid = broken.get_backend_pid()
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        conn = pool.getconn()
+        assert conn is not broken
+        assert broken.closed
+        assert pool.size == 1
+
+    def test_forked(self, pool):
+        conn = pool.getconn()
+        pool.putconn(conn)
+        with mock.patch('os.getpid', return_value=pool.pid + 1):
+            assert pool.getconn() is not conn
+        # The connection of the parent isn't closed
+        assert not conn.closed
+        conn.close()
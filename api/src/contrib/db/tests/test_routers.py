@@ -0,0 +1,93 @@
+from unittest import mock
+
+import pytest
+from contrib.db import routers
+from contrib.db.routers import ReplicaRouter, choose_replica, replica_lag, use_replica
+from django.db import DatabaseError
+from passage.models import Passage
+
+
+@pytest.fixture
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica_1', 'replica_2']
+    settings.DATABASE_REPLICA_MAX_LAG = 30
+    settings.DATABASE_REPLICA_CHECK_INTERVAL = 5
+    with mock.patch.dict(routers._lags, clear=True):
+        yield settings.DATABASE_REPLICAS
+
+
+@pytest.fixture
+def lags():
+    lags = {}
+    with mock.patch('contrib.db.routers.replica_lag', side_effect=lags.get):
+        yield lags
+
+
+def test_no_replicas(lags):
+    assert choose_replica() == 'default'
+
+
+def test_choose_replica(replicas, lags):
+    lags.update(replica_1=1, replica_2=0)
+    assert {choose_replica() for _ in range(50)} == {'replica_1', 'replica_2'}
+
+    # Too far behind or down
+    lags.update(replica_1=31, replica_2=None)
+    assert choose_replica() == 'default'
+
+
+def test_replica_lag(replicas):
+    connection = mock.MagicMock()
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (2.5,)
+
+    with mock.patch('contrib.db.routers.connections', {'replica_1': connection}):
+        with mock.patch('time.monotonic', return_value=100):
+            assert replica_lag('replica_1') == 2.5
+            cursor.fetchone.return_value = (3,)
+            assert replica_lag('replica_1') == 2.5
+
+        with mock.patch('time.monotonic', return_value=106):
+            cursor.execute.side_effect = DatabaseError
+            assert replica_lag('replica_1') is None
+            connection.close_if_unusable_or_obsolete.assert_called_once()
+
+        with mock.patch('time.monotonic', return_value=112):
+            # Not streaming and nothing replayed
+            cursor.execute.side_effect = None
+            cursor.fetchone.return_value = (None,)
+            assert replica_lag('replica_1') is None
+
+
+def test_replica_lag_streaming():
+    # The shortcut of an up to date replica only holds while it streams
+    shortcut = routers.SQL_REPLICA_LAG.split('THEN 0')[1]
+    assert "status = 'streaming'" in shortcut
+
+
+def test_use_replica(replicas, lags):
+    router = ReplicaRouter()
+    lags.update(replica_1=0)
+
+    assert router.db_for_read(Passage) is None
+    with use_replica() as using:
+        assert using == 'replica_1'
+        assert router.db_for_read(Passage) == 'replica_1'
+        assert router.db_for_write(Passage) == 'default'
+        # Nested blocks stay on the same replica
+        lags.update(replica_1=None, replica_2=0)
+        with use_replica():
+            assert router.db_for_read(Passage) == 'replica_1'
+    assert router.db_for_read(Passage) is None
+
+    @use_replica()
+    def read():
+        return router.db_for_read(Passage)
+
+    assert read() == 'replica_2'
+
+
+def test_allow_migrate(replicas):
+    router = ReplicaRouter()
+    assert router.allow_migrate('replica_1', 'passage') is False
+    assert router.allow_migrate('default', 'passage') is None
@@ -0,0 +1,41 @@
+import cbor2
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def check_keys(data):
+    """Map keys are strings, like in JSON, the views expect nothing else."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if not isinstance(key, str):
+                raise ValueError(f'map key {key!r} is not a string')
+            check_keys(value)
+    elif isinstance(data, list):
+        for value in data:
+            check_keys(value)
+    return data
+
+
+class MessagePackParser(BaseParser):
+    """Parse a MessagePack body into the same data as JSONParser would."""
+
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return check_keys(msgpack.unpackb(stream.read(), raw=False))
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CBORParser(BaseParser):
+    """Parse a CBOR body into the same data as JSONParser would."""
+
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return check_keys(cbor2.loads(stream.read()))
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
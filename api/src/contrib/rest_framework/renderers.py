@@ -0,0 +1,50 @@
+import cbor2
+import msgpack
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Values that aren't native to the format, like Decimal or UUID, are encoded
+# as JSONRenderer would, so the clients get the same data in every format
+_json_encoder = JSONEncoder()
+
+
+def _default(obj):
+    return _json_encoder.default(obj)
+
+
+def _native(data):
+    """
+    Return the data with the values JSON has no type for encoded as JSON
+    would. CBOR has types for some of them, like datetime and UUID.
+    """
+    if isinstance(data, dict):
+        return {key: _native(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_native(value) for value in data]
+    if data is None or isinstance(data, (str, int, float)):
+        return data
+    return _native(_default(data))
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class CBORRenderer(BaseRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(_native(data))
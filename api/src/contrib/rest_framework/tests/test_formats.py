@@ -0,0 +1,61 @@
+import io
+import json
+import uuid
+from decimal import Decimal
+
+import cbor2
+import msgpack
+import pytest
+from contrib.rest_framework.parsers import CBORParser, MessagePackParser
+from contrib.rest_framework.renderers import CBORRenderer, MessagePackRenderer
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+MESSAGE = {
+    'id': '5ad2a8d9-7a2a-4cc4-a6a4-3a84d4c2a7b1',
+    'passageAt': '2021-06-01T12:00:00+02:00',
+    'cameraKijkrichting': 337.5,
+    'cameraLocatie': {'type': 'Point', 'coordinates': [4.945936, 52.301221]},
+    'straat': None,
+    'taxiIndicator': False,
+    'brandstoffen': [{'volgnr': 1, 'brandstof': 'Benzine'}],
+}
+
+FORMATS = [
+    (MessagePackParser, MessagePackRenderer, msgpack.packb, msgpack.unpackb),
+    (CBORParser, CBORRenderer, cbor2.dumps, cbor2.loads),
+]
+
+
+@pytest.mark.parametrize('parser, renderer, dumps, loads', FORMATS)
+def test_parse(parser, renderer, dumps, loads):
+    assert parser().parse(io.BytesIO(dumps(MESSAGE))) == MESSAGE
+
+
+@pytest.mark.parametrize('parser, renderer, dumps, loads', FORMATS)
+def test_parse_error(parser, renderer, dumps, loads):
+    with pytest.raises(ParseError):
+        parser().parse(io.BytesIO(dumps(MESSAGE)[:-3]))
+
+
+@pytest.mark.parametrize(
+    'parser, body',
+    [
+        (MessagePackParser, msgpack.packb({b'passageAt': 1}, use_bin_type=True)),
+        (MessagePackParser, msgpack.packb({'cameraLocatie': {b'type': 'Point'}})),
+        (CBORParser, cbor2.dumps({1: 2})),
+        (CBORParser, cbor2.dumps({'cameraLocatie': {b'type': 'Point'}})),
+    ],
+)
+def test_parse_key_error(parser, body):
+    # Only strings, like JSON
+    with pytest.raises(ParseError, match='is not a string'):
+        parser().parse(io.BytesIO(body))
+
+
+@pytest.mark.parametrize('parser, renderer, dumps, loads', FORMATS)
+def test_render_like_json(parser, renderer, dumps, loads):
+    data = dict(MESSAGE, id=uuid.UUID(MESSAGE['id']), massa=Decimal('1500.5'))
+    expected = json.loads(JSONRenderer().render(data))
+    assert loads(renderer().render(data)) == expected
+    assert renderer().render(None) == b''
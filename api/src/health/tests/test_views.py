@@ -0,0 +1,43 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+from passage.tests.factories import PassageFactory
+
+
+@pytest.mark.django_db
+class TestCheckData:
+    URL = '/status/data'
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.clear()
+        yield
+        cache.clear()
+
+    @override_settings(HEALTH_DATA_MIN_ROWS=3)
+    def test_enough_data(self, api_client):
+        PassageFactory.create_batch(3)
+        response = api_client.get(self.URL)
+        assert response.status_code == 200
+
+    @override_settings(HEALTH_DATA_MIN_ROWS=3)
+    def test_too_few_items(self, api_client):
+        PassageFactory.create_batch(2)
+        response = api_client.get(self.URL)
+        assert response.status_code == 500
+
+    @override_settings(HEALTH_DATA_MIN_ROWS=3)
+    def test_catalog_estimate(self, api_client):
+        with mock.patch('health.views.estimate_row_count', return_value=3):
+            response = api_client.get(self.URL)
+        assert response.status_code == 200
+
+    @override_settings(HEALTH_DATA_MIN_ROWS=3)
+    def test_cached(self, api_client):
+        PassageFactory.create_batch(2)
+        assert api_client.get(self.URL).status_code == 500
+
+        PassageFactory.create()
+        assert api_client.get(self.URL).status_code == 500
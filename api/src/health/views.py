@@ -1,8 +1,17 @@
 import logging
+from datetime import timedelta
 
+from contrib.db.routers import use_replica
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
-from django.db import connection
+from django.db import connection, connections
+from django.utils import timezone
+from metrics import render
+from passage.partitions import estimate_row_count
+from passage.sharding import is_sharded, scatter
+from passage.staging import StagingCollector
+from passage.statements import is_staged
 
 try:
     # noinspection PyUnresolvedReferences
@@ -41,11 +50,47 @@ def health(request):
     return HttpResponse("Connectivity OK", content_type="text/plain", status=200)
 
 
+def count_recent_rows():
+    """
+    Count the rows of the last HEALTH_DATA_LOOKBACK_DAYS, up to HEALTH_DATA_MIN_ROWS.
+
+    The catalog estimate is used when it is high enough, otherwise a count
+    limited to the minimum number of rows is done on the newest partitions
+    only. Either way the cost does not grow with the size of the table. Both
+    are read from a replica, when there is one that is recent enough, or
+    from every shard.
+    """
+    min_rows = settings.HEALTH_DATA_MIN_ROWS
+    since = timezone.now() - timedelta(days=settings.HEALTH_DATA_LOOKBACK_DAYS)
+
+    def count(using):
+        estimate = estimate_row_count(since.date(), using=connections[using])
+        if estimate >= min_rows:
+            return estimate
+        recent = model.objects.using(using).filter(passage_at__gte=since)
+        return recent[:min_rows].count()
+
+    if is_sharded():
+        return sum(scatter(count))
+    with use_replica() as using:
+        return count(using)
+
+
 def check_data(request):
+    count = cache.get_or_set(
+        'health:check_data', count_recent_rows, settings.HEALTH_CACHE_SECONDS
+    )
 
-    if model.objects.all().count() < 20000:
+    if count < settings.HEALTH_DATA_MIN_ROWS:
         return HttpResponse(
             "Too few items in the database", content_type="text/plain", status=500
         )
 
     return HttpResponse("Data OK", content_type="text/plain", status=200)
+
+
+def metrics(request):
+    # The staging table is only read when it's used
+    collectors = [StagingCollector()] if is_staged() else []
+    content_type, content = render(collectors)
+    return HttpResponse(content, content_type=content_type, status=200)
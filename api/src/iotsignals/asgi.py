@@ -0,0 +1,24 @@
+"""
+ASGI config for iotsignals project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+The JSON passage POSTs are handled by the async ingest of passage/ingest.py,
+everything else by the WSGI application, in a thread. Run it with an ASGI
+server, e.g.:
+
+    uvicorn iotsignals.asgi:application --host 0.0.0.0 --port 8002
+"""
+
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'iotsignals.settings')
+
+# Sets up Django, before the ingest imports the models
+wsgi_application = get_wsgi_application()
+
+from passage.ingest import AsyncIngest  # noqa: E402 isort:skip
+
+application = AsyncIngest(WsgiToAsgi(wsgi_application))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
+import json
 import os
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
@@ -32,6 +33,22 @@ ALLOWED_HOSTS = ['*']
 
 # Application definition
 HEALTH_MODEL = 'passage.Passage'
+# The data check needs at least this many passages in the lookback window
+HEALTH_DATA_MIN_ROWS = int(os.getenv('HEALTH_DATA_MIN_ROWS', 20000))
+HEALTH_DATA_LOOKBACK_DAYS = int(os.getenv('HEALTH_DATA_LOOKBACK_DAYS', 7))
+# Health results are cached per process, so probes don't all hit the database
+HEALTH_CACHE_SECONDS = int(os.getenv('HEALTH_CACHE_SECONDS', 30))
+
+# The timestamp check only looks at the partitions of the lookback window
+PASSAGE_TIMESTAMP_LOOKBACK_DAYS = int(os.getenv('PASSAGE_TIMESTAMP_LOOKBACK_DAYS', 2))
+PASSAGE_TIMESTAMP_MAX_AGE_MINUTES = int(
+    os.getenv('PASSAGE_TIMESTAMP_MAX_AGE_MINUTES', 60)
+)
+
+# Every worker keeps the last seen passage per camera in memory and flushes
+# it to passage_camerafreshness with this interval
+PASSAGE_FRESHNESS_ENABLED = os.getenv('PASSAGE_FRESHNESS_ENABLED', 'true') == 'true'
+PASSAGE_FRESHNESS_FLUSH_SECONDS = int(os.getenv('PASSAGE_FRESHNESS_FLUSH_SECONDS', 10))
 
 INSTALLED_APPS += [
     'health',
@@ -68,20 +85,147 @@ ROOT_URLCONF = "iotsignals.urls"
 
 WSGI_APPLICATION = "iotsignals.wsgi.application"
 
+# The pooled backend returns closed connections to a pool per process, so
+# Django can close them after every request (CONN_MAX_AGE 0).
+DATABASE_POOL_ENABLED = os.getenv("DATABASE_POOL_ENABLED", "true") == "true"
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.contrib.gis.db.backends.postgis",
+        "ENGINE": (
+            "contrib.db.backends.postgis_pool"
+            if DATABASE_POOL_ENABLED
+            else "django.contrib.gis.db.backends.postgis"
+        ),
         "NAME": os.getenv("DATABASE_NAME", "iotsignals"),
         "USER": os.getenv("DATABASE_USER", "iotsignals"),
         "PASSWORD": os.getenv("DATABASE_PASSWORD", "insecure"),
         "HOST": os.getenv("DATABASE_HOST", "database"),
-        "CONN_MAX_AGE": 20,
+        "CONN_MAX_AGE": 0 if DATABASE_POOL_ENABLED else 20,
         "PORT": os.getenv("DATABASE_PORT", "5432"),
+        "POOL": {
+            "MAX_SIZE": int(os.getenv("DATABASE_POOL_MAX_SIZE", 10)),
+            "MAX_LIFETIME": int(os.getenv("DATABASE_POOL_MAX_LIFETIME", 3600)),
+            "CHECK_AFTER": int(os.getenv("DATABASE_POOL_CHECK_AFTER", 30)),
+            "TIMEOUT": int(os.getenv("DATABASE_POOL_TIMEOUT", 10)),
+        },
     },
 }
 
+# Read-only replicas of the default database, a comma separated list of
+# host[:port] with the database and credentials of the primary. Exports,
+# aggregation reads and data checks read from them, see contrib/db/routers.py.
+DATABASE_REPLICA_HOSTS = os.getenv("DATABASE_REPLICA_HOSTS", "")
+# Seconds, so a replica that can't be reached doesn't hold up a request for
+# the TCP timeout at every check
+DATABASE_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DATABASE_REPLICA_CONNECT_TIMEOUT", 2))
+DATABASE_REPLICAS = []
+for n, replica in enumerate(filter(None, DATABASE_REPLICA_HOSTS.split(",")), 1):
+    alias = f"replica_{n}"
+    host, _, port = replica.strip().partition(":")
+    DATABASES[alias] = dict(
+        DATABASES["default"],
+        HOST=host,
+        PORT=port or DATABASES["default"]["PORT"],
+        OPTIONS={"connect_timeout": DATABASE_REPLICA_CONNECT_TIMEOUT},
+        TEST={"MIRROR": "default"},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+# Databases that store a share of the passages, by camera, next to default.
+# A comma separated list of host[:port], like the replicas. PASSAGE_SHARD_MAP
+# is a JSON object of camera ids and the alias of their shard, the other
+# cameras are spread by hash, see passage/sharding.py.
+DATABASE_SHARD_HOSTS = os.getenv("DATABASE_SHARD_HOSTS", "")
+DATABASE_SHARDS = []
+for n, shard in enumerate(filter(None, DATABASE_SHARD_HOSTS.split(",")), 1):
+    alias = f"shard_{n}"
+    host, _, port = shard.strip().partition(":")
+    DATABASES[alias] = dict(
+        DATABASES["default"], HOST=host, PORT=port or DATABASES["default"]["PORT"]
+    )
+    DATABASE_SHARDS.append(alias)
+PASSAGE_SHARD_MAP = json.loads(os.getenv("PASSAGE_SHARD_MAP", "{}"))
+
+DATABASE_ROUTERS = [
+    "passage.sharding.PassageShardRouter",
+    "contrib.db.routers.ReplicaRouter",
+]
+# Replicas further behind the primary are skipped, checked every interval
+DATABASE_REPLICA_MAX_LAG = float(os.getenv("DATABASE_REPLICA_MAX_LAG", 30))
+DATABASE_REPLICA_CHECK_INTERVAL = float(os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", 5))
+
+# The passage INSERT as a server side prepared statement, see contrib/db/prepared.py
+DATABASE_PREPARED_STATEMENTS = (
+    os.getenv("DATABASE_PREPARED_STATEMENTS", "true") == "true"
+)
+
 SHELL_PLUS_PRINT_SQL_TRUNCATE = 10000
 
+# Profiling, see middleware/profiling.py. Requests with a signed X-Profile
+# header are always profiled.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false') == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/tmp/profiles')
+PROFILING_TRACEMALLOC = os.getenv('PROFILING_TRACEMALLOC', 'false') == 'true'
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 3600))
+
+# SQL accounting, see sql_accounting.py
+SQL_SLOW_QUERY_MS = int(os.getenv('SQL_SLOW_QUERY_MS', 1000))
+SQL_SLOW_QUERY_EXPLAIN = os.getenv('SQL_SLOW_QUERY_EXPLAIN', 'false') == 'true'
+SQL_SERVER_TIMING = os.getenv('SQL_SERVER_TIMING', 'true') == 'true'
+
+# Tracing, see tracing.py. Slow requests are always kept.
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false') == 'true'
+TRACING_SAMPLE_RATE = float(os.getenv('TRACING_SAMPLE_RATE', 0.001))
+TRACING_LATENCY_THRESHOLD_MS = int(os.getenv('TRACING_LATENCY_THRESHOLD_MS', 500))
+TRACING_DIR = os.getenv('TRACING_DIR', '/tmp/traces')
+
+# Capture of passage POSTs for replay, see middleware/capture.py
+CAPTURE_ENABLED = os.getenv('CAPTURE_ENABLED', 'false') == 'true'
+CAPTURE_SAMPLE_RATE = float(os.getenv('CAPTURE_SAMPLE_RATE', 1))
+CAPTURE_DIR = os.getenv('CAPTURE_DIR', '/tmp/capture')
+CAPTURE_MAX_BYTES = int(os.getenv('CAPTURE_MAX_BYTES', 100 * 1024 * 1024))
+CAPTURE_MAX_FILES = int(os.getenv('CAPTURE_MAX_FILES', 48))
+
+# Admission control of the ingest and exports, see middleware/admission.py.
+# The in flight limits are per worker, 0 disables the queue and latency checks.
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'false') == 'true'
+ADMISSION_MAX_LISTEN_QUEUE = int(os.getenv('ADMISSION_MAX_LISTEN_QUEUE', 50))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 8))
+ADMISSION_MAX_EXPORTS = int(os.getenv('ADMISSION_MAX_EXPORTS', 1))
+ADMISSION_DB_LATENCY_MS = int(os.getenv('ADMISSION_DB_LATENCY_MS', 250))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+ADMISSION_EXPORT_RETRY_AFTER = int(os.getenv('ADMISSION_EXPORT_RETRY_AFTER', 60))
+
+# Response compression, see middleware/compression.py. The default minimum
+# size is about one packet, smaller responses gain nothing from compression.
+COMPRESSION_ENCODINGS = os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1400))
+COMPRESSION_BLOCK_SIZE = int(os.getenv('COMPRESSION_BLOCK_SIZE', 64 * 1024))
+
+# Compressed request bodies, see middleware/decompression.py. By default the
+# limit of Django on uncompressed bodies, DATA_UPLOAD_MAX_MEMORY_SIZE.
+REQUEST_MAX_DECOMPRESSED_SIZE = int(
+    os.getenv('REQUEST_MAX_DECOMPRESSED_SIZE', 2.5 * 1024 * 1024)
+)
+
+# The async ingest of the ASGI entry point, see passage/ingest.py. The pools
+# are per process, and shared by all the passages in flight.
+ASYNC_INGEST_POOL_SIZE = int(os.getenv('ASYNC_INGEST_POOL_SIZE', 20))
+ASYNC_INGEST_POOL_TIMEOUT = int(os.getenv('ASYNC_INGEST_POOL_TIMEOUT', 10))
+
+# 'staging' inserts new passages into the UNLOGGED passage_passage_staging
+# table, which passage_merge_staging merges into passage_passage. A crash of
+# the database loses the staged passages, see the README.
+PASSAGE_INGEST_MODE = os.getenv('PASSAGE_INGEST_MODE', 'direct')
+PASSAGE_STAGING_MERGE_INTERVAL = float(os.getenv('PASSAGE_STAGING_MERGE_INTERVAL', 5))
+PASSAGE_STAGING_BATCH_SIZE = int(os.getenv('PASSAGE_STAGING_BATCH_SIZE', 50000))
+
+# Days of partitions (up to today) that keep a B-tree on passage_at, older
+# ones only have the BRIN indexes, see passage/indexes.py
+PASSAGE_BTREE_DAYS = int(os.getenv('PASSAGE_BTREE_DAYS', 2))
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.1/topics/i18n/
 TIME_ZONE = 'Europe/Amsterdam'
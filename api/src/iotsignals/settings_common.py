@@ -39,7 +39,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'middleware.gzip.UWSGIGZipMiddleware',
+    'middleware.metrics.MetricsMiddleware',
+    'middleware.tracing.TracingMiddleware',
+    'middleware.admission.AdmissionMiddleware',
+    'middleware.decompression.RequestDecompressionMiddleware',
+    'middleware.profiling.ProfilingMiddleware',
+    'middleware.sql.SQLAccountingMiddleware',
+    'middleware.capture.CaptureMiddleware',
+    'middleware.compression.CompressionMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
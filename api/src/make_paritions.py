@@ -8,34 +8,36 @@ import logging
 
 PTABLE = "passage_passage"
 PARTITIONS_TO_ADD = 6
-conn = None
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.DEBUG)
 
-# add 7 partitions in advance if needed (range is a day)
-try:
-    dbparam = {
-        'host': environ['DATABASE_HOST'],
-        'dbname': environ['DATABASE_NAME'],
-        'user': environ['DATABASE_USER'],
-        'password': environ['DATABASE_PASSWORD']
-        }
-    conn = psycopg2.connect(**dbparam)
-except Exception as e:
-    print(e)
-    log.error(e)
-    log.error("Database connection Failed!")
-    exit(-1)
-
-
 SQL_VERSION = """
     SELECT Substr(setting, 1, strpos(setting, '.')-1)::smallint as version
     FROM pg_settings
     WHERE name = 'server_version';
 """
 
-try:
+
+def connect(host):
+    try:
+        address, _, port = host.strip().partition(':')
+        dbparam = {
+            'host': address,
+            'port': port or environ.get('DATABASE_PORT', '5432'),
+            'dbname': environ['DATABASE_NAME'],
+            'user': environ['DATABASE_USER'],
+            'password': environ['DATABASE_PASSWORD']
+            }
+        return psycopg2.connect(**dbparam)
+    except Exception as e:
+        print(e)
+        log.error(e)
+        log.error("Database connection Failed!")
+        exit(-1)
+
+
+def add_partitions(conn):
     # check pg version?, we need 10+ for partitions and 11+ for
     # indexes within the partitions
     cur = conn.cursor()
@@ -61,9 +63,19 @@ try:
         cur.execute(SQL_CREATE_PARTITION)
 
     conn.commit()
-except Exception as e:
-    print(e)
-    log.error(e)
-finally:
-    if conn is not None:
+
+
+# add 7 partitions in advance if needed (range is a day), on the database and
+# on every shard of the passages (see src/passage/sharding.py)
+hosts = [environ['DATABASE_HOST']]
+hosts += filter(None, environ.get('DATABASE_SHARD_HOSTS', '').split(','))
+
+for host in hosts:
+    conn = connect(host)
+    try:
+        add_partitions(conn)
+    except Exception as e:
+        print(e)
+        log.error(e)
+    finally:
         conn.close()
@@ -0,0 +1,143 @@
+"""
+Prometheus metrics of the ingest, export and aggregation hot paths.
+
+uWSGI runs several worker processes, set PROMETHEUS_MULTIPROC_DIR to a
+directory shared by the workers (and the management commands) to have
+/status/metrics report the totals of all processes. The directory has to be
+emptied when the application starts, see deploy/docker-run.sh.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+REQUEST_DURATION = Histogram(
+    'iotsignals_request_duration_seconds',
+    'Request latency per view and action',
+    ['view', 'action', 'method'],
+)
+REQUESTS = Counter(
+    'iotsignals_requests_total',
+    'Requests per view, action and status code',
+    ['view', 'action', 'method', 'status'],
+)
+
+PASSAGE_CREATE_PHASE_DURATION = Histogram(
+    'iotsignals_passage_create_phase_seconds',
+    'Time spent per phase of PassageViewSet.create',
+    ['phase'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+PASSAGE_DUPLICATES = Counter(
+    'iotsignals_passage_duplicates_total', 'Passages posted with an existing id'
+)
+PASSAGE_VALIDATION_ERRORS = Counter(
+    'iotsignals_passage_validation_errors_total', 'Passages rejected by validation'
+)
+
+EXPORT_ROWS = Counter('iotsignals_export_rows_total', 'Rows exported', ['export'])
+EXPORT_BYTES = Counter('iotsignals_export_bytes_total', 'Bytes exported', ['export'])
+
+AGGREGATION_DURATION = Histogram(
+    'iotsignals_aggregation_duration_seconds',
+    'Duration of the aggregation queries per command and step',
+    ['command', 'step'],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+)
+AGGREGATION_ROWS = Counter(
+    'iotsignals_aggregation_rows_total',
+    'Rows deleted and inserted by the aggregation commands',
+    ['command', 'step'],
+)
+
+DB_QUERIES = Histogram(
+    'iotsignals_request_db_queries',
+    'Database queries per request',
+    ['view', 'action'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+DB_DURATION = Histogram(
+    'iotsignals_request_db_seconds',
+    'Database time per request',
+    ['view', 'action'],
+)
+COMMAND_DB_QUERIES = Counter(
+    'iotsignals_command_db_queries_total',
+    'Database queries of the management commands',
+    ['command'],
+)
+COMMAND_DB_DURATION = Counter(
+    'iotsignals_command_db_seconds_total',
+    'Database time of the management commands',
+    ['command'],
+)
+DB_POOL_CONNECTIONS = Counter(
+    'iotsignals_db_pool_connections_total',
+    'Connections opened, recycled (max lifetime), broken or timed out in the pool',
+    ['alias', 'event'],
+)
+DB_REPLICA_READS = Counter(
+    'iotsignals_db_replica_reads_total',
+    'Blocks of reads per database, the primary when no replica was recent enough',
+    ['alias'],
+)
+ADMISSION_REJECTED = Counter(
+    'iotsignals_admission_rejected_total',
+    'Requests rejected by the admission control, per class and reason',
+    ['class', 'reason'],
+)
+REQUEST_BODY_BYTES = Counter(
+    'iotsignals_request_body_bytes_total',
+    'Bytes of the compressed request bodies, before and after decompression',
+    ['encoding', 'stage'],
+)
+# The depth and lag of the staging table are read when the metrics are
+# scraped, see passage.staging.StagingCollector
+PASSAGE_STAGING_MERGED = Counter(
+    'iotsignals_passage_staging_merged_total',
+    'Staged passages merged into passage_passage, inserted or dropped as duplicate',
+    ['alias', 'result'],
+)
+
+
+@contextmanager
+def timed(histogram):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def get_registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render(collectors=()):
+    """
+    Return the content type and body of the metrics exposition, with the
+    metrics of the collectors, which are collected by this process only.
+    """
+    content = generate_latest(get_registry())
+    if collectors:
+        registry = CollectorRegistry()
+        for collector in collectors:
+            registry.register(collector)
+        content += generate_latest(registry)
+    return CONTENT_TYPE_LATEST, content
@@ -0,0 +1,178 @@
+"""
+Admission control of the ingest and the exports.
+
+When a worker is overloaded it's better to answer a passage POST right away
+with a 503 and a Retry-After, than to let it wait in the listen queue until
+the camera times out and sends it again. With ADMISSION_ENABLED a request
+is rejected when:
+
+- the uWSGI listen queue is longer than ADMISSION_MAX_LISTEN_QUEUE, the
+  requests that wait for a worker;
+- the worker already handles ADMISSION_MAX_IN_FLIGHT passages, or
+  ADMISSION_MAX_EXPORTS exports (only when it runs threads);
+- the database time of the recent passages of the worker is above
+  ADMISSION_DB_LATENCY_MS. Exports are rejected outright, passages with a
+  chance that grows to 90% at twice the target, so the latency is still
+  measured and the shedding stops when the database recovers. Without
+  passages the average halves every LATENCY_HALF_LIFE seconds, so a worker
+  that only gets exports after a slow burst admits them again.
+
+The health checks and the other views are never rejected.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from metrics import ADMISSION_REJECTED
+
+from .metrics import get_view_labels
+
+try:
+    import uwsgi
+except ImportError:
+    # Not running in uWSGI, e.g. runserver or the tests
+    uwsgi = None
+
+INGEST = 'ingest'
+EXPORT = 'export'
+
+CLASSES = {
+    ('PassageViewSet', 'create'): INGEST,
+    ('PassageViewSet', 'export'): EXPORT,
+    ('PassageViewSet', 'export_taxi'): EXPORT,
+}
+
+# Weight of the last request in the database latency average
+LATENCY_ALPHA = 0.2
+# Seconds without a passage in which the average halves
+LATENCY_HALF_LIFE = 10
+MAX_SHED_RATE = 0.9
+
+
+def listen_queue():
+    if uwsgi is None:
+        return 0
+    return uwsgi.listen_queue()
+
+
+class AdmissionController:
+    """The requests in flight and the database latency of a worker."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {INGEST: 0, EXPORT: 0}
+        # Seconds, an exponentially weighted moving average
+        self.db_latency = 0.0
+        self.sampled_at = time.monotonic()
+
+    def limits(self):
+        return {
+            INGEST: settings.ADMISSION_MAX_IN_FLIGHT,
+            EXPORT: settings.ADMISSION_MAX_EXPORTS,
+        }
+
+    def latency(self):
+        """The database latency, decayed by the time since the last passage."""
+        idle = time.monotonic() - self.sampled_at
+        return self.db_latency * 0.5 ** (idle / LATENCY_HALF_LIFE)
+
+    def admit(self, kind):
+        """Return the reason to reject a request, or None after admitting it."""
+        max_queue = settings.ADMISSION_MAX_LISTEN_QUEUE
+        if max_queue and listen_queue() > max_queue:
+            return 'listen_queue'
+
+        target = settings.ADMISSION_DB_LATENCY_MS / 1000
+        latency = self.latency()
+        if target and latency > target:
+            if kind == EXPORT:
+                return 'db_latency'
+            shed_rate = min(MAX_SHED_RATE, (latency - target) / target)
+            if random.random() < shed_rate:
+                return 'db_latency'
+
+        with self.lock:
+            if self.in_flight[kind] >= self.limits()[kind]:
+                return 'in_flight'
+            self.in_flight[kind] += 1
+        return None
+
+    def release(self, kind, db_duration=None):
+        with self.lock:
+            self.in_flight[kind] -= 1
+            if kind == INGEST and db_duration is not None:
+                latency = self.latency()
+                self.db_latency = latency + LATENCY_ALPHA * (db_duration - latency)
+                self.sampled_at = time.monotonic()
+
+
+class Releasing:
+    """Streamed content that calls release() when the response is closed."""
+
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        if self.release is not None:
+            self.release()
+            self.release = None
+
+
+class AdmissionMiddleware:
+    """
+    Reject passages and exports with a 503 when the worker is overloaded.
+
+    Comes after the metrics and tracing middleware, so the rejections are
+    counted, and before the SQL accounting, whose database time it uses.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.controller = AdmissionController()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        kind = getattr(request, '_admission', None)
+        if kind is None:
+            return response
+
+        if response.streaming:
+            # An export is in flight until the response is closed, after it's
+            # streamed or when the client is gone
+            response.streaming_content = Releasing(
+                response.streaming_content, lambda: self.controller.release(kind)
+            )
+        else:
+            stats = getattr(request, '_sql_stats', None)
+            self.controller.release(kind, stats and stats.duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.ADMISSION_ENABLED:
+            return None
+        kind = CLASSES.get(get_view_labels(view_func, request.method))
+        if kind is None:
+            return None
+
+        reason = self.controller.admit(kind)
+        if reason is None:
+            request._admission = kind
+            return None
+
+        ADMISSION_REJECTED.labels(kind, reason).inc()
+        if kind == EXPORT:
+            retry_after = settings.ADMISSION_EXPORT_RETRY_AFTER
+        else:
+            retry_after = settings.ADMISSION_RETRY_AFTER
+        response = JsonResponse(
+            {'detail': 'The service is overloaded, try again later.'}, status=503
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
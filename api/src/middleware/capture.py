@@ -0,0 +1,138 @@
+"""
+Capture of incoming passages, to replay them later with their original
+timing, see passage/tests/replay.py.
+
+When CAPTURE_ENABLED is set a fraction CAPTURE_SAMPLE_RATE of the passage
+POSTs is appended to CAPTURE_DIR, one JSON object per line:
+
+    {"at": <unix time of arrival>, "path": "...", "content_type": "...",
+     "status": 201, "body": "<the request body>"}
+
+Bodies in a binary format, MessagePack or CBOR, are stored base64 encoded in
+"body_base64" instead of "body".
+
+Every worker writes its own files. A file is closed every hour, or when it
+reaches CAPTURE_MAX_BYTES, and only the newest CAPTURE_MAX_FILES files in
+CAPTURE_DIR are kept. The captures contain the passages as they were sent,
+so keep CAPTURE_DIR as private as the database.
+"""
+import base64
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from contrib.rest_framework.parsers import CBORParser, MessagePackParser
+from django.conf import settings
+
+from .metrics import get_view_labels
+
+log = logging.getLogger(__name__)
+
+BINARY_CONTENT_TYPES = {MessagePackParser.media_type, CBORParser.media_type}
+
+CAPTURED_VIEW = ('PassageViewSet', 'create')
+
+
+class CaptureWriter:
+    """Append JSON lines to hourly files of at most max_bytes each."""
+
+    def __init__(self, directory, max_bytes, max_files):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        # Opened on the first write, after uwsgi has forked the workers
+        self.file = None
+        self.hour = None
+        self.size = 0
+
+    def write(self, record):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self.lock:
+            now = datetime.now()
+            if (
+                self.file is None
+                or f'{now:%Y%m%d%H}' != self.hour
+                or self.size + len(line) > self.max_bytes
+            ):
+                self.rotate(now)
+            self.file.write(line)
+            self.file.flush()
+            self.size += len(line)
+
+    def rotate(self, now):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f'capture-{now:%Y%m%d-%H%M%S%f}-{os.getpid()}.jsonl'
+        )
+        self.file = open(path, 'a')
+        self.hour = f'{now:%Y%m%d%H}'
+        self.size = self.file.tell()
+        self.cleanup()
+
+    def cleanup(self):
+        # The names start with the time the file was opened
+        paths = sorted(glob.glob(os.path.join(self.directory, 'capture-*.jsonl')))
+        for path in paths[: -self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                # Already removed by another worker
+                pass
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+class CaptureMiddleware:
+    """Capture a sample of the passage POSTs when CAPTURE_ENABLED is set."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.writer = CaptureWriter(
+            settings.CAPTURE_DIR, settings.CAPTURE_MAX_BYTES, settings.CAPTURE_MAX_FILES
+        )
+
+    def __call__(self, request):
+        if not settings.CAPTURE_ENABLED:
+            return self.get_response(request)
+
+        request._capture_at = time.time()
+        response = self.get_response(request)
+
+        record = getattr(request, '_capture', None)
+        if record is not None:
+            record['status'] = response.status_code
+            try:
+                self.writer.write(record)
+            except OSError:
+                log.exception('Writing the capture failed')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            not settings.CAPTURE_ENABLED
+            or get_view_labels(view_func, request.method) != CAPTURED_VIEW
+            or random.random() >= settings.CAPTURE_SAMPLE_RATE
+        ):
+            return
+        # Read before the view, DRF consumes the stream otherwise
+        request._capture = {
+            'at': request._capture_at,
+            'path': request.path,
+            'content_type': request.content_type,
+        }
+        if request.content_type in BINARY_CONTENT_TYPES:
+            request._capture['body_base64'] = base64.b64encode(request.body).decode()
+        else:
+            request._capture['body'] = request.body.decode('utf-8', 'replace')
@@ -0,0 +1,182 @@
+"""
+Compression of the responses, with zstd, brotli or gzip.
+
+Only responses of a compressible content type and of at least
+COMPRESSION_MIN_SIZE bytes are compressed, so the small passage acks are
+sent as they are. Streamed responses, like the exports, are compressed
+while they are streamed, in blocks of COMPRESSION_BLOCK_SIZE bytes.
+Responses that already have a Content-Encoding (e.g. a compressed file)
+are passed through.
+
+The encoding is the first of COMPRESSION_ENCODINGS the client accepts. The
+levels favour speed: the exports are large, but the CPU is better spent on
+the ingest.
+"""
+import re
+import zlib
+
+import brotli
+import zstandard
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+COMPRESSIBLE_SUFFIXES = ('+json', '+xml')
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+
+class GzipEncoder:
+    def __init__(self):
+        # A gzip header and trailer instead of zlib's
+        wbits = 16 + zlib.MAX_WBITS
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+ENCODERS = {'zstd': ZstdEncoder, 'br': BrotliEncoder, 'gzip': GzipEncoder}
+
+# e.g. "gzip;q=0.8"
+CODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+def accepted_encodings(accept_encoding):
+    """Return the codings of an Accept-Encoding header, without those with q=0."""
+    accepted = set()
+    for coding in accept_encoding.lower().split(','):
+        match = CODING_RE.match(coding)
+        if match is None:
+            continue
+        name, q = match.groups()
+        try:
+            if q is not None and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name)
+    return accepted
+
+
+def choose_encoding(accept_encoding, encodings):
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in encodings:
+        if encoding in accepted or '*' in accepted:
+            return encoding
+    return None
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';')[0].strip().lower()
+    return (
+        content_type.startswith('text/')
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith(COMPRESSIBLE_SUFFIXES)
+    )
+
+
+def compress_stream(chunks, encoder, block_size):
+    """
+    Compress chunks in blocks of about block_size bytes. Every block is
+    flushed, so neither this nor the encoder holds more than a block.
+    """
+    block, size = [], 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= block_size:
+            yield encoder.compress(b''.join(block)) + encoder.flush()
+            block, size = [], 0
+    yield encoder.compress(b''.join(block)) + encoder.finish()
+
+
+class CompressionMiddleware:
+    """Compress the responses that are worth it, see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 304)
+            or response.has_header('Content-Encoding')
+            or 'no-transform' in response.get('Cache-Control', '')
+            or not is_compressible(response.get('Content-Type', ''))
+        ):
+            return response
+        min_size = settings.COMPRESSION_MIN_SIZE
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), settings.COMPRESSION_ENCODINGS
+        )
+        if encoding is None:
+            return response
+        encoder = ENCODERS[encoding]()
+
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoder, settings.COMPRESSION_BLOCK_SIZE
+            )
+            # The length isn't known until it's streamed
+            del response['Content-Length']
+        else:
+            content = encoder.compress(response.content) + encoder.finish()
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The representation changed, like django.middleware.gzip
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,85 @@
+"""
+Request bodies compressed with gzip or zstd (Content-Encoding).
+
+The body is decompressed before the view reads it, a chunk at a time, and a
+body that decompresses to more than REQUEST_MAX_DECOMPRESSED_SIZE bytes is
+rejected with a 413 as soon as it crosses the limit. A small compressed
+body can't make the worker allocate more than that, however well it
+compresses. The view, and the capture, get the decompressed body.
+
+Comes after the admission control, so a rejected request isn't
+decompressed first.
+"""
+import gzip
+import zlib
+from io import BytesIO
+
+import zstandard
+from django.conf import settings
+from django.http import JsonResponse
+from metrics import REQUEST_BODY_BYTES
+
+CHUNK_SIZE = 64 * 1024
+
+READERS = {
+    'gzip': lambda stream: gzip.GzipFile(fileobj=stream, mode='rb'),
+    'zstd': lambda stream: zstandard.ZstdDecompressor().stream_reader(stream),
+}
+ERRORS = (EOFError, OSError, zlib.error, zstandard.ZstdError)
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def decompress(stream, encoding, max_size):
+    """Read and decompress a stream, BodyTooLarge once it's over max_size."""
+    reader = READERS[encoding](stream)
+    chunks, size = [], 0
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            return b''.join(chunks)
+        size += len(chunk)
+        if size > max_size:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+
+
+def error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+class RequestDecompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return None
+        if encoding not in READERS:
+            return error(415, f'Unsupported Content-Encoding "{encoding}".')
+
+        max_size = settings.REQUEST_MAX_DECOMPRESSED_SIZE
+        try:
+            body = decompress(request, encoding, max_size)
+        except BodyTooLarge:
+            return error(413, f'The body decompresses to more than {max_size} bytes.')
+        except ERRORS:
+            return error(400, f'The body is not valid {encoding}.')
+
+        REQUEST_BODY_BYTES.labels(encoding, 'compressed').inc(
+            int(request.META.get('CONTENT_LENGTH') or 0)
+        )
+        REQUEST_BODY_BYTES.labels(encoding, 'decompressed').inc(len(body))
+
+        # Like HttpRequest.body, the parsers read the body from _stream
+        request._stream = BytesIO(body)
+        request._read_started = False
+        request.META['CONTENT_LENGTH'] = str(len(body))
+        del request.META['HTTP_CONTENT_ENCODING']
+        return None
@@ -0,0 +1,43 @@
+import time
+
+from metrics import REQUEST_DURATION, REQUESTS
+
+
+def get_view_labels(view_func, method):
+    """Return the (view, action) labels of a resolved view function."""
+    # DRF views keep their class, viewsets also the method -> action mapping
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return view_func.__name__, ''
+    actions = getattr(view_func, 'actions', None) or {}
+    return cls.__name__, actions.get(method.lower(), '')
+
+
+class MetricsMiddleware:
+    """
+    Measure the latency of every request per view and action.
+
+    Should be the first middleware, so the time spent in the other
+    middleware is included.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        view_func = getattr(request, '_metrics_view_func', None)
+        if view_func is None:
+            view, action = 'unknown', ''
+        else:
+            view, action = get_view_labels(view_func, request.method)
+
+        REQUEST_DURATION.labels(view, action, request.method).observe(duration)
+        REQUESTS.labels(view, action, request.method, response.status_code).inc()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_func = view_func
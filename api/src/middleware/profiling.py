@@ -0,0 +1,189 @@
+"""
+On demand profiling of requests.
+
+A request is profiled when PROFILING_ENABLED is set (for a fraction
+PROFILING_SAMPLE_RATE of the requests), or when it has a valid signed
+X-Profile header, see make_token(). The profiler is statistical: a thread
+samples the stack of the request thread every PROFILING_INTERVAL seconds, so
+the overhead doesn't depend on the number of function calls.
+
+For every profiled request two files are written to PROFILING_DIR, tagged
+with the view:
+
+- <name>.collapsed: collapsed stacks, for flamegraph.pl or speedscope
+- <name>.pstats: the same samples as pstats, for snakeviz or pstats.Stats
+
+With PROFILING_TRACEMALLOC set, a <name>.memory.txt is written as well, with
+the memory growth of the worker since its first profiled request.
+"""
+import logging
+import marshal
+import os
+import random
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+
+from .metrics import get_view_labels
+
+log = logging.getLogger(__name__)
+
+TOKEN_SALT = 'iotsignals.profiling'
+
+
+def make_token():
+    """Create a value for the X-Profile header, valid for PROFILING_TOKEN_MAX_AGE."""
+    return signing.dumps('profile', salt=TOKEN_SALT)
+
+
+def is_valid_token(token):
+    try:
+        signing.loads(token, salt=TOKEN_SALT, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def frame_key(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class Sampler(threading.Thread):
+    """Sample the stack of another thread at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_key(frame))
+                frame = frame.f_back
+            # The thread is gone, e.g. the request finished before stop()
+            if not stack:
+                continue
+            # Outermost frame first
+            self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        lines = []
+        for stack, count in self.samples.most_common():
+            frames = ';'.join(
+                f'{name} ({os.path.basename(filename)}:{line})'
+                for filename, line, name in stack
+            )
+            lines.append(f'{frames} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def pstats(self):
+        """Return the samples in the format of pstats.Stats.stats (in seconds)."""
+        tt = defaultdict(float)
+        ct = defaultdict(float)
+        calls = defaultdict(int)
+        callers = defaultdict(lambda: defaultdict(float))
+
+        for stack, count in self.samples.items():
+            duration = count * self.interval
+            tt[stack[-1]] += duration
+            for key in set(stack):
+                ct[key] += duration
+                calls[key] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                callers[callee][caller] += duration
+
+        return {
+            key: (
+                calls[key],
+                calls[key],
+                tt[key],
+                ct[key],
+                {
+                    caller: (calls[key], calls[key], duration, duration)
+                    for caller, duration in callers[key].items()
+                },
+            )
+            for key in ct
+        }
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.memory_baseline = None
+
+    def should_profile(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        if token:
+            return is_valid_token(token)
+        return (
+            settings.PROFILING_ENABLED
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+        )
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        sampler = Sampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+
+        try:
+            self.write(request, sampler)
+        except OSError:
+            log.exception('Writing the profile failed')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profiling_view = '.'.join(
+            filter(None, get_view_labels(view_func, request.method))
+        )
+
+    def write(self, request, sampler):
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        view = getattr(request, '_profiling_view', 'unknown')
+        name = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{view}'
+        path = os.path.join(settings.PROFILING_DIR, name)
+
+        with open(f'{path}.collapsed', 'w') as f:
+            f.write(sampler.collapsed())
+        with open(f'{path}.pstats', 'wb') as f:
+            marshal.dump(sampler.pstats(), f)
+
+        if settings.PROFILING_TRACEMALLOC:
+            self.write_memory(path)
+
+    def write_memory(self, path):
+        if not tracemalloc.is_tracing():
+            # The first profiled request starts tracing, later ones report
+            # the growth since then.
+            tracemalloc.start()
+            self.memory_baseline = tracemalloc.take_snapshot()
+            return
+
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self.memory_baseline, 'lineno')
+        current, peak = tracemalloc.get_traced_memory()
+        with open(f'{path}.memory.txt', 'w') as f:
+            f.write(f'pid {os.getpid()}: current {current} bytes, peak {peak} bytes\n')
+            for stat in stats[:50]:
+                f.write(f'{stat}\n')
@@ -0,0 +1,61 @@
+from django.conf import settings
+from metrics import DB_DURATION, DB_QUERIES
+from sql_accounting import QueryStats, track_queries
+
+from .metrics import get_view_labels
+
+
+class SQLAccountingMiddleware:
+    """
+    Count the queries and database time of every request.
+
+    The totals are exported per view and action, and returned to the client
+    in a Server-Timing header when SQL_SERVER_TIMING is set. The queries of
+    a streaming response, like the iterator() of an export, run while the
+    content is sent: they are counted until the response is closed, and
+    there is no Server-Timing header, which is sent before them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with track_queries(stats):
+            response = self.get_response(request)
+        # For the admission control, see middleware/admission.py
+        request._sql_stats = stats
+
+        view_func = getattr(request, '_sql_view_func', None)
+        if view_func is None:
+            labels = ('unknown', '')
+        else:
+            labels = get_view_labels(view_func, request.method)
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                stats, labels, response.streaming_content
+            )
+            return response
+
+        self.observe(stats, labels)
+        if settings.SQL_SERVER_TIMING:
+            timing = f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+            if response.has_header('Server-Timing'):
+                timing = f'{response["Server-Timing"]}, {timing}'
+            response['Server-Timing'] = timing
+        return response
+
+    def stream(self, stats, labels, content):
+        try:
+            with track_queries(stats):
+                yield from content
+        finally:
+            self.observe(stats, labels)
+
+    def observe(self, stats, labels):
+        DB_QUERIES.labels(*labels).observe(stats.count)
+        DB_DURATION.labels(*labels).observe(stats.duration)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._sql_view_func = view_func
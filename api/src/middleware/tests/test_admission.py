@@ -0,0 +1,139 @@
+from unittest import mock
+
+import pytest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from middleware.admission import AdmissionMiddleware
+from sql_accounting import QueryStats
+
+
+class PassageViewSet:
+    pass
+
+
+def create(request):
+    return HttpResponse(status=201)
+
+
+create.cls = PassageViewSet
+create.actions = {'post': 'create'}
+
+
+def export(request):
+    return StreamingHttpResponse(iter([b'a;b\n']))
+
+
+export.cls = PassageViewSet
+export.actions = {'get': 'export'}
+
+
+def health(request):
+    return HttpResponse()
+
+
+class TestAdmissionMiddleware:
+    @pytest.fixture(autouse=True)
+    def admission_settings(self, settings):
+        settings.ADMISSION_ENABLED = True
+        settings.ADMISSION_MAX_LISTEN_QUEUE = 10
+        settings.ADMISSION_MAX_IN_FLIGHT = 2
+        settings.ADMISSION_MAX_EXPORTS = 1
+        settings.ADMISSION_DB_LATENCY_MS = 100
+        settings.ADMISSION_RETRY_AFTER = 1
+        settings.ADMISSION_EXPORT_RETRY_AFTER = 60
+
+    @pytest.fixture
+    def middleware(self):
+        def get_response(request):
+            response = middleware.process_view(request, request.view, (), {})
+            if response is None:
+                response = request.view(request)
+                request._sql_stats = QueryStats()
+                request._sql_stats.duration = request.db_duration
+            return response
+
+        middleware = AdmissionMiddleware(get_response)
+        return middleware
+
+    def request(self, middleware, view, db_duration=0.01):
+        method = 'post' if view is create else 'get'
+        request = getattr(RequestFactory(), method)('/')
+        request.view = view
+        request.db_duration = db_duration
+        return middleware(request)
+
+    def test_admit(self, middleware):
+        response = self.request(middleware, create)
+        assert response.status_code == 201
+        assert middleware.controller.in_flight == {'ingest': 0, 'export': 0}
+
+    def test_in_flight(self, middleware):
+        middleware.controller.in_flight['ingest'] = 2
+        response = self.request(middleware, create)
+        assert response.status_code == 503
+        assert response['Retry-After'] == '1'
+        assert middleware.controller.in_flight['ingest'] == 2
+
+    def test_streamed_export(self, middleware):
+        response = self.request(middleware, export)
+        assert response.status_code == 200
+        # In flight until the export has been sent
+        assert self.request(middleware, export).status_code == 503
+        assert b''.join(response.streaming_content) == b'a;b\n'
+        response.close()
+        assert middleware.controller.in_flight['export'] == 0
+        assert self.request(middleware, export).status_code == 200
+
+    def test_listen_queue(self, middleware):
+        with mock.patch('middleware.admission.listen_queue', return_value=11):
+            assert self.request(middleware, create).status_code == 503
+            response = self.request(middleware, export)
+            assert response.status_code == 503
+            assert response['Retry-After'] == '60'
+            # The health checks and the other views are never rejected
+            assert self.request(middleware, health).status_code == 200
+
+    def test_db_latency(self, middleware):
+        # None are shed, so every request is part of the average
+        with mock.patch('middleware.admission.random.random', return_value=1):
+            for _ in range(20):
+                self.request(middleware, create, db_duration=0.5)
+        assert middleware.controller.db_latency > 0.2
+
+        assert self.request(middleware, export).status_code == 503
+        statuses = [
+            self.request(middleware, create, db_duration=0.5).status_code
+            for _ in range(200)
+        ]
+        # Some passages are still admitted to measure the latency
+        assert 201 in statuses
+        assert statuses.count(503) > 100
+
+        # Until the database recovers
+        for _ in range(20):
+            middleware.controller.release('ingest', 0.01)
+            middleware.controller.in_flight['ingest'] += 1
+        assert self.request(middleware, create).status_code == 201
+
+    def test_db_latency_decay(self, middleware):
+        with mock.patch('middleware.admission.time.monotonic', return_value=100):
+            middleware.controller.sampled_at = 100
+            with mock.patch('middleware.admission.random.random', return_value=1):
+                for _ in range(20):
+                    self.request(middleware, create, db_duration=0.5)
+            assert self.request(middleware, export).status_code == 503
+
+        # Only exports and health checks follow, the latency goes down anyway
+        with mock.patch('middleware.admission.time.monotonic', return_value=110):
+            assert self.request(middleware, export).status_code == 503
+            assert self.request(middleware, health).status_code == 200
+        with mock.patch('middleware.admission.time.monotonic', return_value=130):
+            assert middleware.controller.latency() < 0.1
+            response = self.request(middleware, export)
+            assert response.status_code == 200
+            response.close()
+
+    def test_disabled(self, middleware, settings):
+        settings.ADMISSION_ENABLED = False
+        middleware.controller.in_flight['ingest'] = 2
+        assert self.request(middleware, create).status_code == 201
@@ -0,0 +1,101 @@
+import base64
+import json
+import time
+
+import msgpack
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+from middleware.capture import CaptureMiddleware, CaptureWriter
+
+
+class PassageViewSet:
+    pass
+
+
+def create(request):
+    # Like DRF, read the body in the view
+    request.body
+    return HttpResponse(status=201)
+
+
+create.cls = PassageViewSet
+create.actions = {'post': 'create'}
+
+
+def other(request):
+    return HttpResponse()
+
+
+class TestCaptureMiddleware:
+    @pytest.fixture(autouse=True)
+    def capture_settings(self, settings, tmp_path):
+        settings.CAPTURE_ENABLED = True
+        settings.CAPTURE_SAMPLE_RATE = 1
+        settings.CAPTURE_DIR = str(tmp_path)
+
+    def request(self, view, body, content_type='application/json'):
+        middleware = CaptureMiddleware(view)
+        request = RequestFactory().post(
+            '/v0/milieuzone/passage/', body, content_type=content_type
+        )
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware.get_response = get_response
+        response = middleware(request)
+        middleware.writer.close()
+        return response
+
+    def captures(self, tmp_path):
+        return [
+            json.loads(line)
+            for path in sorted(tmp_path.iterdir())
+            for line in path.read_text().splitlines()
+        ]
+
+    def test_capture(self, tmp_path):
+        before = time.time()
+        self.request(create, '{"id": "1"}')
+        self.request(create, '{"id": "2"}')
+
+        first, second = self.captures(tmp_path)
+        assert first['path'] == '/v0/milieuzone/passage/'
+        assert first['content_type'] == 'application/json'
+        assert first['status'] == 201
+        assert json.loads(first['body']) == {'id': '1'}
+        assert before <= first['at'] <= second['at'] <= time.time()
+
+    def test_capture_binary(self, tmp_path):
+        body = msgpack.packb({'id': '1'})
+        self.request(create, body, 'application/msgpack')
+
+        (capture,) = self.captures(tmp_path)
+        assert 'body' not in capture
+        assert base64.b64decode(capture['body_base64']) == body
+
+    def test_other_views(self, tmp_path):
+        self.request(other, '{}')
+        assert self.captures(tmp_path) == []
+
+    def test_disabled(self, settings, tmp_path):
+        settings.CAPTURE_ENABLED = False
+        self.request(create, '{}')
+        assert self.captures(tmp_path) == []
+
+    def test_sample_rate(self, settings, tmp_path):
+        settings.CAPTURE_SAMPLE_RATE = 0
+        self.request(create, '{}')
+        assert self.captures(tmp_path) == []
+
+
+def test_writer_rotation(tmp_path):
+    writer = CaptureWriter(str(tmp_path), max_bytes=100, max_files=2)
+    for n in range(5):
+        writer.write({'n': n, 'body': 'x' * 50})
+    writer.close()
+
+    paths = sorted(tmp_path.iterdir())
+    assert [json.loads(path.read_text())['n'] for path in paths] == [3, 4]
@@ -0,0 +1,90 @@
+import gzip
+
+import brotli
+import pytest
+import zstandard
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from middleware.compression import (
+    CompressionMiddleware,
+    accepted_encodings,
+    choose_encoding,
+)
+
+CSV = b''.join(b'camera-%d;2021-06-01 08:00;%d\n' % (n % 10, n) for n in range(2000))
+
+DECODERS = {
+    'gzip': gzip.decompress,
+    'br': brotli.decompress,
+    'zstd': lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data),
+}
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, deflate, br') == {'gzip', 'deflate', 'br'}
+    assert accepted_encodings('br;q=0, gzip;q=0.5, *;q=0.1') == {'gzip', '*'}
+    assert accepted_encodings('') == set()
+
+
+def test_choose_encoding():
+    encodings = ['zstd', 'br', 'gzip']
+    assert choose_encoding('gzip, br', encodings) == 'br'
+    assert choose_encoding('gzip, zstd', encodings) == 'zstd'
+    assert choose_encoding('identity', encodings) is None
+    assert choose_encoding('*', encodings) == 'zstd'
+
+
+class TestCompressionMiddleware:
+    @pytest.fixture(autouse=True)
+    def compression_settings(self, settings):
+        settings.COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+        settings.COMPRESSION_MIN_SIZE = 1400
+        settings.COMPRESSION_BLOCK_SIZE = 4096
+
+    def request(self, response, accept_encoding='gzip, br, zstd'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    @pytest.mark.parametrize('encoding', ['zstd', 'br', 'gzip'])
+    def test_compress(self, encoding):
+        response = self.request(HttpResponse(CSV, content_type='text/csv'), encoding)
+        assert response['Content-Encoding'] == encoding
+        assert response['Vary'] == 'Accept-Encoding'
+        assert int(response['Content-Length']) == len(response.content)
+        assert DECODERS[encoding](response.content) == CSV
+
+    def test_small(self):
+        response = self.request(HttpResponse(b'{"id": "1"}', status=201))
+        assert not response.has_header('Content-Encoding')
+        assert not response.has_header('Vary')
+
+    def test_not_compressible(self):
+        response = self.request(HttpResponse(CSV, content_type='image/png'))
+        assert not response.has_header('Content-Encoding')
+
+    def test_already_compressed(self):
+        content = gzip.compress(CSV)
+        response = HttpResponse(content, content_type='text/csv')
+        response['Content-Encoding'] = 'gzip'
+        response = self.request(response, 'zstd')
+        assert response['Content-Encoding'] == 'gzip'
+        assert response.content == content
+
+    def test_not_accepted(self):
+        response = self.request(HttpResponse(CSV, content_type='text/csv'), 'identity')
+        assert not response.has_header('Content-Encoding')
+        assert response['Vary'] == 'Accept-Encoding'
+        assert response.content == CSV
+
+    @pytest.mark.parametrize('encoding', ['zstd', 'br', 'gzip'])
+    def test_streaming(self, encoding):
+        lines = CSV.splitlines(keepends=True)
+        response = StreamingHttpResponse(iter(lines), content_type='text/csv')
+        response = self.request(response, encoding)
+        assert response['Content-Encoding'] == encoding
+        assert not response.has_header('Content-Length')
+
+        chunks = list(response.streaming_content)
+        # Compressed in blocks, not line by line
+        assert 1 < len(chunks) < len(lines) / 10
+        assert DECODERS[encoding](b''.join(chunks)) == CSV
@@ -0,0 +1,57 @@
+import gzip
+import json
+
+import pytest
+import zstandard
+from django.test import RequestFactory
+from middleware.decompression import RequestDecompressionMiddleware
+
+BODY = json.dumps([{'id': str(n), 'kenteken_land': 'NL'} for n in range(500)]).encode()
+
+ENCODERS = {
+    'gzip': gzip.compress,
+    'zstd': zstandard.ZstdCompressor().compress,
+}
+
+
+class TestRequestDecompressionMiddleware:
+    @pytest.fixture(autouse=True)
+    def decompression_settings(self, settings):
+        settings.REQUEST_MAX_DECOMPRESSED_SIZE = 64 * 1024
+
+    def request(self, data, encoding=None):
+        headers = {'HTTP_CONTENT_ENCODING': encoding} if encoding else {}
+        request = RequestFactory().post(
+            '/', data, content_type='application/json', **headers
+        )
+        middleware = RequestDecompressionMiddleware(lambda request: None)
+        return request, middleware.process_view(request, None, (), {})
+
+    @pytest.mark.parametrize('encoding', ['gzip', 'zstd'])
+    def test_decompress(self, encoding):
+        request, response = self.request(ENCODERS[encoding](BODY), encoding)
+        assert response is None
+        assert request.body == BODY
+        assert request.META['CONTENT_LENGTH'] == str(len(BODY))
+        assert 'HTTP_CONTENT_ENCODING' not in request.META
+
+    def test_uncompressed(self):
+        request, response = self.request(BODY)
+        assert response is None
+        assert request.body == BODY
+
+    @pytest.mark.parametrize('encoding', ['gzip', 'zstd'])
+    def test_too_large(self, encoding):
+        # Compresses to a few hundred bytes
+        data = ENCODERS[encoding](b' ' * 10 * 1024 * 1024)
+        request, response = self.request(data, encoding)
+        assert response.status_code == 413
+
+    def test_unsupported(self):
+        request, response = self.request(BODY, 'compress')
+        assert response.status_code == 415
+
+    @pytest.mark.parametrize('encoding', ['gzip', 'zstd'])
+    def test_invalid(self, encoding):
+        request, response = self.request(BODY, encoding)
+        assert response.status_code == 400
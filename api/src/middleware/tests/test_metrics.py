@@ -0,0 +1,34 @@
+from django.test import TestCase
+from prometheus_client import REGISTRY
+
+
+def get_requests(view, action, method, status):
+    labels = dict(view=view, action=action, method=method, status=str(status))
+    return REGISTRY.get_sample_value('iotsignals_requests_total', labels) or 0
+
+
+class TestMetricsMiddleware(TestCase):
+    def test_function_view(self):
+        before = get_requests('health', '', 'GET', 200)
+        response = self.client.get('/status/health')
+        assert response.status_code == 200
+        assert get_requests('health', '', 'GET', 200) == before + 1
+
+    def test_viewset_action(self):
+        before = get_requests('PassageViewSet', 'create', 'POST', 400)
+        response = self.client.post(
+            '/v0/milieuzone/passage/', '{}', content_type='application/json'
+        )
+        assert response.status_code == 400
+        assert get_requests('PassageViewSet', 'create', 'POST', 400) == before + 1
+
+    def test_not_found(self):
+        before = get_requests('unknown', '', 'GET', 404)
+        self.client.get('/does-not-exist/')
+        assert get_requests('unknown', '', 'GET', 404) == before + 1
+
+    def test_metrics_endpoint(self):
+        self.client.get('/status/health')
+        response = self.client.get('/status/metrics')
+        assert response.status_code == 200
+        assert b'iotsignals_request_duration_seconds_bucket' in response.content
@@ -0,0 +1,91 @@
+import pstats
+import time
+import tracemalloc
+
+import pytest
+from django.test import RequestFactory
+from middleware.profiling import ProfilingMiddleware, Sampler, make_token
+
+
+def busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def view(request):
+    busy(0.05)
+    return {}
+
+
+class TestProfilingMiddleware:
+    @pytest.fixture(autouse=True)
+    def profiling_settings(self, settings, tmp_path):
+        settings.PROFILING_DIR = str(tmp_path)
+        settings.PROFILING_INTERVAL = 0.001
+        settings.PROFILING_ENABLED = False
+        settings.PROFILING_TRACEMALLOC = False
+
+    def profile(self, request, tmp_path):
+        middleware = ProfilingMiddleware(view)
+        middleware.process_view(request, view, (), {})
+        middleware(request)
+        return sorted(tmp_path.iterdir())
+
+    def test_not_profiled(self, tmp_path):
+        assert self.profile(RequestFactory().get('/'), tmp_path) == []
+
+    def test_invalid_token(self, tmp_path):
+        request = RequestFactory().get('/', HTTP_X_PROFILE='forged')
+        assert self.profile(request, tmp_path) == []
+
+    def test_signed_header(self, tmp_path):
+        request = RequestFactory().get('/', HTTP_X_PROFILE=make_token())
+        collapsed, stats = self.profile(request, tmp_path)
+
+        assert collapsed.name.endswith('-view.collapsed')
+        assert 'busy (test_profiling.py' in collapsed.read_text()
+
+        stats = pstats.Stats(str(stats))
+        assert any(name == 'busy' for _, _, name in stats.stats)
+
+    def test_sample_rate(self, settings, tmp_path):
+        settings.PROFILING_ENABLED = True
+        settings.PROFILING_SAMPLE_RATE = 1
+        assert len(self.profile(RequestFactory().get('/'), tmp_path)) == 2
+
+    def test_tracemalloc(self, settings, tmp_path):
+        settings.PROFILING_TRACEMALLOC = True
+        middleware = ProfilingMiddleware(view)
+        try:
+            for _ in range(2):
+                middleware(RequestFactory().get('/', HTTP_X_PROFILE=make_token()))
+        finally:
+            tracemalloc.stop()
+
+        memory = list(tmp_path.glob('*.memory.txt'))
+        assert len(memory) == 1
+        assert memory[0].read_text().startswith('pid ')
+
+
+def test_sampler_no_thread():
+    # A thread id that isn't in sys._current_frames()
+    sampler = Sampler(-1, interval=0.001)
+    sampler.start()
+    time.sleep(0.02)
+    sampler.stop()
+
+    assert not sampler.samples
+    assert sampler.collapsed() == '\n'
+
+
+def test_sampler_pstats():
+    sampler = Sampler(0, interval=0.01)
+    a, b, c = ('a.py', 1, 'a'), ('b.py', 1, 'b'), ('c.py', 1, 'c')
+    sampler.samples.update({(a, b): 3, (a, b, c): 1, (a,): 1})
+
+    stats = sampler.pstats()
+    assert round(stats[a][2], 3) == 0.01  # self time
+    assert round(stats[a][3], 3) == 0.05  # cumulative time
+    assert round(stats[b][3], 3) == 0.04
+    assert round(stats[b][4][a][3], 3) == 0.04
@@ -0,0 +1,66 @@
+import logging
+
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from middleware.sql import SQLAccountingMiddleware
+from sql_accounting import QueryStats, track_queries
+
+
+def streaming_view(request):
+    def content():
+        for n in range(2):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT %s', [n])
+            yield str(n)
+
+    return StreamingHttpResponse(content())
+
+
+class TestQueryStats(TestCase):
+    def test_counts_queries(self):
+        with track_queries() as stats:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.execute('SELECT 2')
+        assert stats.count == 2
+        assert stats.duration > 0
+
+    def test_shared_stats(self):
+        stats = QueryStats()
+        for _ in range(2):
+            with track_queries(stats), connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        assert stats.count == 2
+
+    @override_settings(SQL_SLOW_QUERY_MS=0, SQL_SLOW_QUERY_EXPLAIN=True)
+    def test_slow_query_log(self):
+        with self.assertLogs('sql_accounting', logging.WARNING) as logs:
+            with track_queries(), connection.cursor() as cursor:
+                cursor.execute('SELECT %s', [42])
+        assert 'SELECT %s; params: [42]' in logs.output[0]
+        assert 'Result' in logs.output[0]
+
+
+class TestSQLAccountingMiddleware(TestCase):
+    def test_server_timing(self):
+        response = self.client.get('/status/health')
+        assert response.status_code == 200
+        assert response['Server-Timing'].startswith('db;dur=')
+        assert 'queries"' in response['Server-Timing']
+
+    @override_settings(SQL_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        response = self.client.get('/status/health')
+        assert not response.has_header('Server-Timing')
+
+    def test_streaming(self):
+        request = RequestFactory().get('/')
+        response = SQLAccountingMiddleware(streaming_view)(request)
+        assert request._sql_stats.count == 0
+
+        assert b''.join(response.streaming_content) == b'01'
+        response.close()
+        # The queries while the content was sent
+        assert request._sql_stats.count == 2
+        assert not response.has_header('Server-Timing')
@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+import tracing
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory
+from middleware.tracing import TracingMiddleware
+
+
+def view(request):
+    with tracing.span('work', items=3):
+        with tracing.span('inner'):
+            time.sleep(0.01)
+    return HttpResponse('ok')
+
+
+def streaming_view(request):
+    def content():
+        start = time.time_ns()
+        yield 'a'
+        tracing.add_span('stream', start, time.time_ns())
+
+    return StreamingHttpResponse(content())
+
+
+class TestTracingMiddleware:
+    @pytest.fixture(autouse=True)
+    def tracing_settings(self, settings, tmp_path):
+        settings.TRACING_ENABLED = True
+        settings.TRACING_DIR = str(tmp_path)
+        settings.TRACING_SAMPLE_RATE = 0
+        settings.TRACING_LATENCY_THRESHOLD_MS = 0
+
+    def traces(self, tmp_path):
+        return [
+            json.loads(line)
+            for path in sorted(tmp_path.iterdir())
+            for line in path.read_text().splitlines()
+        ]
+
+    def spans(self, trace):
+        return trace['resourceSpans'][0]['scopeSpans'][0]['spans']
+
+    def test_spans(self, tmp_path):
+        middleware = TracingMiddleware(view)
+        middleware.process_view(RequestFactory().get('/'), view, (), {})
+        middleware(RequestFactory().get('/'))
+
+        [trace] = self.traces(tmp_path)
+        root, work, inner = self.spans(trace)
+        assert root['kind'] == tracing.SPAN_KIND_SERVER
+        assert 'parentSpanId' not in root
+        assert work['name'] == 'work'
+        assert work['parentSpanId'] == root['spanId']
+        assert work['attributes'] == [{'key': 'items', 'value': {'intValue': '3'}}]
+        assert inner['parentSpanId'] == work['spanId']
+        assert {root['traceId'], work['traceId'], inner['traceId']} == {root['traceId']}
+        assert {'key': 'http.status_code', 'value': {'intValue': '200'}} in (
+            root['attributes']
+        )
+
+    def test_fast_requests_dropped(self, settings, tmp_path):
+        settings.TRACING_LATENCY_THRESHOLD_MS = 10000
+        TracingMiddleware(view)(RequestFactory().get('/'))
+        assert self.traces(tmp_path) == []
+
+    def test_sample_rate(self, settings, tmp_path):
+        settings.TRACING_LATENCY_THRESHOLD_MS = 10000
+        settings.TRACING_SAMPLE_RATE = 1
+        TracingMiddleware(view)(RequestFactory().get('/'))
+        assert len(self.traces(tmp_path)) == 1
+
+    def test_disabled(self, settings, tmp_path):
+        settings.TRACING_ENABLED = False
+        TracingMiddleware(view)(RequestFactory().get('/'))
+        assert self.traces(tmp_path) == []
+
+    def test_streaming(self, tmp_path):
+        response = TracingMiddleware(streaming_view)(RequestFactory().get('/'))
+        # The trace ends when the content has been sent
+        assert self.traces(tmp_path) == []
+        assert b''.join(response.streaming_content) == b'a'
+
+        [trace] = self.traces(tmp_path)
+        assert [span['name'] for span in self.spans(trace)][1:] == ['stream']
+
+
+def test_span_without_trace():
+    with tracing.span('nothing') as span:
+        assert span is None
@@ -0,0 +1,82 @@
+import logging
+import random
+import time
+
+import tracing
+from django.conf import settings
+
+from .metrics import get_view_labels
+
+log = logging.getLogger(__name__)
+
+
+class TracingMiddleware:
+    """
+    Trace requests when TRACING_ENABLED is set, see tracing.py.
+
+    A trace is kept when the request took longer than
+    TRACING_LATENCY_THRESHOLD_MS, or for a fraction TRACING_SAMPLE_RATE of
+    the other requests. For streaming responses the trace ends when the
+    content has been sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.TRACING_ENABLED:
+            return self.get_response(request)
+
+        trace = tracing.Trace(
+            f'{request.method} {request.path}',
+            **{'http.method': request.method, 'http.target': request.path},
+        )
+        with tracing.activate(trace):
+            try:
+                response = self.get_response(request)
+            except Exception:
+                self.finish(trace, 500)
+                raise
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                trace, response.streaming_content, response.status_code
+            )
+        else:
+            self.finish(trace, response.status_code)
+        return response
+
+    def stream(self, trace, content, status_code):
+        with tracing.activate(trace):
+            try:
+                yield from content
+            finally:
+                self.finish(trace, status_code)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = tracing.current_trace()
+        if trace is not None:
+            view, action = get_view_labels(view_func, request.method)
+            trace.root.name = '.'.join(filter(None, (view, action)))
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook
+        if tracing.current_trace() is not None:
+            start = time.time_ns()
+            response.add_post_render_callback(
+                lambda response: tracing.add_span('render', start, time.time_ns())
+            )
+        return response
+
+    def finish(self, trace, status_code):
+        trace.root.attributes['http.status_code'] = status_code
+        trace.root.finish()
+        if (
+            trace.duration_ms < settings.TRACING_LATENCY_THRESHOLD_MS
+            and random.random() >= settings.TRACING_SAMPLE_RATE
+        ):
+            return
+        try:
+            tracing.export(trace)
+        except OSError:
+            log.exception('Writing the trace failed')
@@ -0,0 +1,218 @@
+"""
+Raw passage extraction, fanned out over the daily partitions.
+
+Each partition is copied with its own COPY ... TO STDOUT query into a gzipped
+CSV shard. The partitions are processed concurrently by a bounded number of
+worker threads, each holding at most one database connection. A manifest in
+the output directory records the finished shards so an interrupted extraction
+can be resumed by running it again with the same parameters.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.db import connections
+from django.utils import timezone
+from psycopg2 import sql
+
+from .partitions import list_partitions, map_partitions
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# The fields of the raw data requests, see data_requests/20210701.sql
+DEFAULT_FIELDS = [
+    'id',
+    'passage_at',
+    'created_at',
+    'version',
+    'straat',
+    'rijrichting',
+    'rijstrook',
+    'camera_id',
+    'camera_naam',
+    'camera_kijkrichting',
+    'camera_locatie',
+    'kenteken_land',
+    'kenteken_nummer_betrouwbaarheid',
+    'kenteken_land_betrouwbaarheid',
+    'kenteken_karakters_betrouwbaarheid',
+    'automatisch_verwerkbaar',
+    'voertuig_soort',
+    'inrichting',
+    'toegestane_maximum_massa_voertuig',
+    'europese_voertuigcategorie',
+    'europese_voertuigcategorie_toevoeging',
+    'brandstoffen',
+    'extra_data',
+    'diesel',
+    'gasoline',
+    'electric',
+    'indicatie_snelheid',
+]
+
+
+class ExtractionError(Exception):
+    pass
+
+
+class PassageExtraction:
+    """Extract the raw passages between two dates into gzipped CSV shards."""
+
+    def __init__(
+        self,
+        output_dir,
+        from_date: date,
+        to_date: date,
+        camera_ids=None,
+        fields=None,
+        workers=4,
+        delimiter=';',
+        using='default',
+        progress=None,
+    ):
+        self.output_dir = output_dir
+        self.from_date = from_date
+        self.to_date = to_date
+        self.camera_ids = sorted(camera_ids or [])
+        self.fields = list(fields or DEFAULT_FIELDS)
+        self.workers = workers
+        self.delimiter = delimiter
+        self.using = using
+        self.progress = progress
+        self._manifest = None
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.output_dir, MANIFEST_NAME)
+
+    @property
+    def parameters(self):
+        return {
+            'from_date': self.from_date.isoformat(),
+            'to_date': self.to_date.isoformat(),
+            'camera_ids': self.camera_ids,
+            'fields': self.fields,
+            'delimiter': self.delimiter,
+        }
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'parameters': self.parameters, 'shards': {}}
+
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        if manifest['parameters'] != self.parameters:
+            raise ExtractionError(
+                f'{self.manifest_path} belongs to an extraction with other '
+                f'parameters: {manifest["parameters"]}'
+            )
+        return manifest
+
+    def _write_manifest(self):
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _is_done(self, partition):
+        shard = self._manifest['shards'].get(partition.name)
+        return (
+            shard is not None
+            and shard['status'] == 'done'
+            and os.path.exists(os.path.join(self.output_dir, shard['file']))
+        )
+
+    def get_query(self, partition):
+        query = sql.SQL('SELECT {fields} FROM {table}').format(
+            fields=sql.SQL(', ').join(map(sql.Identifier, self.fields)),
+            table=sql.Identifier(partition.name),
+        )
+        if self.camera_ids:
+            query = sql.SQL('{query} WHERE camera_id = ANY({camera_ids})').format(
+                query=query, camera_ids=sql.Literal(self.camera_ids)
+            )
+        return sql.SQL(
+            'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER, DELIMITER {delimiter})'
+        ).format(query=query, delimiter=sql.Literal(self.delimiter))
+
+    def _extract_partition(self, partition):
+        filename = f'{partition.name}.csv.gz'
+        path = os.path.join(self.output_dir, filename)
+        tmp_path = f'{path}.tmp'
+
+        with connections[self.using].cursor() as cursor:
+            query = self.get_query(partition).as_string(cursor.connection)
+            with gzip.open(tmp_path, 'wb') as f:
+                cursor.copy_expert(query, f)
+            rows = cursor.rowcount
+
+        os.replace(tmp_path, path)
+
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha256.update(chunk)
+
+        return {
+            'status': 'done',
+            'file': filename,
+            'day': partition.day.isoformat(),
+            'rows': rows,
+            'bytes': os.path.getsize(path),
+            'sha256': sha256.hexdigest(),
+            'finished_at': timezone.now().isoformat(),
+        }
+
+    def run(self):
+        """Extract all pending partitions and return the manifest."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._manifest = self.load_manifest()
+        self._write_manifest()
+
+        partitions = list_partitions(
+            self.from_date, self.to_date, using=connections[self.using]
+        )
+        pending = [p for p in partitions if not self._is_done(p)]
+        log.info(
+            f'Extracting {len(pending)} of {len(partitions)} partitions '
+            f'with {self.workers} workers'
+        )
+
+        failed = []
+        done = len(partitions) - len(pending)
+        results = map_partitions(
+            self._extract_partition, pending, self.workers, using=self.using
+        )
+        for partition, shard, exception in results:
+            if exception:
+                log.error(f'Extracting {partition.name} failed: {exception}')
+                shard = {'status': 'failed', 'error': str(exception)}
+                failed.append(partition.name)
+
+            done += 1
+            self._manifest['shards'][partition.name] = shard
+            self._write_manifest()
+
+            if self.progress:
+                self.progress(done, len(partitions), partition, shard)
+
+        if failed:
+            raise ExtractionError(
+                f'{len(failed)} partitions failed: {", ".join(sorted(failed))}. '
+                f'Run the extraction again to resume.'
+            )
+        return self._manifest
+
+    def run_async(self):
+        """Run the extraction in the background, returns a Future of the manifest."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.run)
+        executor.shutdown(wait=False)
+        return future
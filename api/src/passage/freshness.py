@@ -0,0 +1,141 @@
+"""
+Per camera freshness, tracked in memory by every worker.
+
+Each created passage updates the last seen passage_at / created_at of its
+camera and the ingest delay histogram (created_at - passage_at). Every
+PASSAGE_FRESHNESS_FLUSH_SECONDS the changes are upserted into the small
+passage_camerafreshness and passage_ingestdelay tables, so camera lag can be
+monitored without querying passage_passage.
+"""
+import atexit
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+log = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the ingest delay buckets
+DELAY_BUCKETS = (1, 5, 15, 60, 300, 900, 3600, 6 * 3600, 24 * 3600, float('inf'))
+
+SQL_UPSERT_FRESHNESS = """
+    INSERT INTO passage_camerafreshness
+        (camera_id, camera_naam, last_passage_at, last_created_at)
+    VALUES %s
+    ON CONFLICT (camera_id) DO UPDATE SET
+        camera_naam = excluded.camera_naam,
+        last_passage_at = greatest(
+            passage_camerafreshness.last_passage_at, excluded.last_passage_at
+        ),
+        last_created_at = greatest(
+            passage_camerafreshness.last_created_at, excluded.last_created_at
+        )
+"""
+
+SQL_UPSERT_DELAY = """
+    INSERT INTO passage_ingestdelay (date, le, count)
+    VALUES %s
+    ON CONFLICT (date, le) DO UPDATE SET
+        count = passage_ingestdelay.count + excluded.count
+"""
+
+
+class FreshnessTracker:
+    def __init__(self, flush_seconds):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._cameras = {}
+        self._delays = defaultdict(int)
+        self._last_flush = time.monotonic()
+
+    def record(self, passage):
+        delay = (passage.created_at - passage.passage_at).total_seconds()
+        le = DELAY_BUCKETS[bisect.bisect_left(DELAY_BUCKETS, max(delay, 0))]
+
+        with self._lock:
+            seen = self._cameras.get(passage.camera_id)
+            if seen is None:
+                seen = self._cameras[passage.camera_id] = [
+                    passage.camera_naam,
+                    passage.passage_at,
+                    passage.created_at,
+                ]
+            else:
+                seen[0] = passage.camera_naam
+                seen[1] = max(seen[1], passage.passage_at)
+                seen[2] = max(seen[2], passage.created_at)
+            self._delays[(passage.created_at.date(), le)] += 1
+
+            due = time.monotonic() - self._last_flush >= self.flush_seconds
+
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            cameras, self._cameras = self._cameras, {}
+            delays, self._delays = self._delays, defaultdict(int)
+            self._last_flush = time.monotonic()
+
+        if not cameras and not delays:
+            return
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if cameras:
+                    execute_values(
+                        cursor.cursor,
+                        SQL_UPSERT_FRESHNESS,
+                        sorted(
+                            (camera_id, *seen) for camera_id, seen in cameras.items()
+                        ),
+                    )
+                if delays:
+                    execute_values(
+                        cursor.cursor,
+                        SQL_UPSERT_DELAY,
+                        sorted((day, le, count) for (day, le), count in delays.items()),
+                    )
+        except Exception:
+            # Monitoring should never break the ingest. The buffers are merged
+            # back, so the next flush writes them.
+            log.exception('Flushing camera freshness failed')
+            self._restore(cameras, delays)
+
+    def _restore(self, cameras, delays):
+        with self._lock:
+            for camera_id, (naam, passage_at, created_at) in cameras.items():
+                seen = self._cameras.get(camera_id)
+                if seen is None:
+                    self._cameras[camera_id] = [naam, passage_at, created_at]
+                else:
+                    # The name of the newer passages wins
+                    seen[1] = max(seen[1], passage_at)
+                    seen[2] = max(seen[2], created_at)
+            for key, count in delays.items():
+                self._delays[key] += count
+
+
+tracker = FreshnessTracker(settings.PASSAGE_FRESHNESS_FLUSH_SECONDS)
+atexit.register(tracker.flush)
+
+
+def percentile(buckets, q):
+    """Return the upper bound of the bucket holding the q-th quantile.
+
+    :param buckets: list of (le, count) tuples, sorted by le
+    """
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+
+    cumulative = 0
+    for le, count in buckets:
+        cumulative += count
+        if cumulative >= q * total:
+            return le
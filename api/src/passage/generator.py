@@ -0,0 +1,389 @@
+"""
+Generate large amounts of synthetic passages for benchmarking.
+
+The passages are spread over the cameras of helpertable.csv (some cameras
+are much busier than others) and over the day following a typical traffic
+profile. Every partition is generated from its own random generator, seeded
+with the seed and the day, so a dataset is the same whatever the number of
+workers. The rows are written with a binary COPY straight into the daily
+partitions, one partition per worker process.
+"""
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import struct
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from psycopg2 import sql
+
+from .partitions import create_partition
+
+log = logging.getLogger(__name__)
+
+HELPERTABLE = os.path.join(settings.BASE_DIR, 'passage', 'helpertable.csv')
+
+CAMERA_NAMESPACE = uuid.UUID('2d4cfd8f-3b4b-4b6e-9d59-3a2b8f1c0e01')
+
+# Share of the passages of a day per hour, weekdays have rush hours
+# fmt: off
+WEEKDAY_PROFILE = (
+    4, 2, 2, 2, 4, 12, 40, 75, 85, 60, 50, 52,
+    55, 55, 58, 65, 78, 85, 70, 48, 35, 28, 18, 9,
+)
+WEEKEND_PROFILE = (
+    9, 6, 4, 3, 3, 5, 10, 18, 30, 42, 52, 58,
+    60, 60, 58, 56, 54, 50, 44, 36, 28, 22, 16, 11,
+)
+# fmt: on
+
+# Relative number of passages on a weekend day
+WEEKEND_SHARE = 0.7
+
+# voertuig_soort, inrichting, europese_voertuigcategorie, (min, max) massa,
+# brandstof, weight
+VEHICLES = (
+    ('Personenauto', 'stationwagen', 'M1', (1000, 2500), 'Benzine', 40),
+    ('Personenauto', 'hatchback', 'M1', (900, 1800), 'Benzine', 25),
+    ('Personenauto', 'MPV', 'M1', (1500, 3000), 'Diesel', 8),
+    ('Personenauto', 'sedan', 'M1', (1400, 2400), 'Elektriciteit', 5),
+    ('Bedrijfsauto', 'gesloten opbouw', 'N1', (2000, 3500), 'Diesel', 12),
+    ('Bedrijfsauto', 'bakwagen', 'N2', (7500, 12000), 'Diesel', 3),
+    ('Bedrijfsauto', 'trekker', 'N3', (18000, 50000), 'Diesel', 3),
+    ('Bus', 'bus', 'M3', (12000, 20000), 'Diesel', 2),
+    ('Bromfiets', 'N.V.t.', 'L1', (100, 300), 'Benzine', 2),
+)
+VEHICLE_WEIGHTS = [vehicle[-1] for vehicle in VEHICLES]
+
+MERKEN = ('VOLVO', 'SCANIA', 'DAF', 'MERCEDES-BENZ', 'MAN', 'IVECO', 'RENAULT')
+
+LANE_RE = re.compile(r'Rijstrook (-?\d+)')
+
+FIELDS = (
+    'id',
+    'passage_at',
+    'created_at',
+    'version',
+    'straat',
+    'rijrichting',
+    'rijstrook',
+    'camera_id',
+    'camera_naam',
+    'camera_kijkrichting',
+    'camera_locatie',
+    'kenteken_land',
+    'kenteken_nummer_betrouwbaarheid',
+    'kenteken_land_betrouwbaarheid',
+    'kenteken_karakters_betrouwbaarheid',
+    'indicatie_snelheid',
+    'automatisch_verwerkbaar',
+    'voertuig_soort',
+    'merk',
+    'inrichting',
+    'datum_eerste_toelating',
+    'toegestane_maximum_massa_voertuig',
+    'europese_voertuigcategorie',
+    'taxi_indicator',
+    'brandstoffen',
+    'diesel',
+    'gasoline',
+    'electric',
+)
+
+
+class Camera(NamedTuple):
+    camera_id: str
+    camera_naam: str
+    straat: str
+    rijrichting: int
+    rijstrook: int
+    camera_kijkrichting: float
+    longitude: float
+    latitude: float
+
+
+def load_cameras(path=HELPERTABLE):
+    with open(path, newline='') as f:
+        cameras = []
+        for row in csv.DictReader(f):
+            lane = LANE_RE.search(row['camera_naam'])
+            cameras.append(
+                Camera(
+                    camera_id=str(uuid.uuid5(CAMERA_NAMESPACE, row['camera_naam'])),
+                    camera_naam=row['camera_naam'],
+                    straat=row['order_naam'] or None,
+                    rijrichting=int(row['rijrichting']),
+                    rijstrook=abs(int(lane.group(1))) if lane else 1,
+                    camera_kijkrichting=float(row['camera_kijkrichting']),
+                    longitude=float(row['longitude']),
+                    latitude=float(row['latitude']),
+                )
+            )
+    return cameras
+
+
+# PostgreSQL binary COPY format, see
+# https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+NULL = struct.pack('!i', -1)
+
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+PG_EPOCH_DATE = date(2000, 1, 1)
+
+
+def _sized(value: bytes):
+    return struct.pack('!i', len(value)) + value
+
+
+def encode_uuid(value):
+    return _sized(value.bytes)
+
+
+def encode_text(value):
+    return _sized(value.encode())
+
+
+def encode_int2(value):
+    return _sized(struct.pack('!h', value))
+
+
+def encode_int4(value):
+    return _sized(struct.pack('!i', value))
+
+
+def encode_float8(value):
+    return _sized(struct.pack('!d', value))
+
+
+def encode_bool(value):
+    return _sized(b'\x01' if value else b'\x00')
+
+
+def encode_timestamptz(value):
+    delta = value - PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return _sized(struct.pack('!q', micros))
+
+
+def encode_date(value):
+    return _sized(struct.pack('!i', (value - PG_EPOCH_DATE).days))
+
+
+def encode_point(value):
+    # EWKB, little endian point with an SRID
+    longitude, latitude = value
+    return _sized(struct.pack('<BIIdd', 1, 0x20000001, 4326, longitude, latitude))
+
+
+def encode_jsonb(value):
+    return _sized(b'\x01' + json.dumps(value).encode())
+
+
+# Most fields have few distinct values (the cameras, vehicle types etc.),
+# so their encoding is cached.
+cached = lru_cache(maxsize=4096)
+
+ENCODERS = {
+    'id': encode_uuid,
+    'passage_at': encode_timestamptz,
+    'created_at': encode_timestamptz,
+    'version': cached(encode_text),
+    'straat': cached(encode_text),
+    'rijrichting': cached(encode_int2),
+    'rijstrook': cached(encode_int2),
+    'camera_id': cached(encode_text),
+    'camera_naam': cached(encode_text),
+    'camera_kijkrichting': cached(encode_float8),
+    'camera_locatie': cached(encode_point),
+    'kenteken_land': cached(encode_text),
+    'kenteken_nummer_betrouwbaarheid': cached(encode_int2),
+    'kenteken_land_betrouwbaarheid': cached(encode_int2),
+    'kenteken_karakters_betrouwbaarheid': encode_jsonb,
+    'indicatie_snelheid': cached(encode_float8),
+    'automatisch_verwerkbaar': cached(encode_bool),
+    'voertuig_soort': cached(encode_text),
+    'merk': cached(encode_text),
+    'inrichting': cached(encode_text),
+    'datum_eerste_toelating': cached(encode_date),
+    'toegestane_maximum_massa_voertuig': cached(encode_int4),
+    'europese_voertuigcategorie': cached(encode_text),
+    'taxi_indicator': cached(encode_bool),
+    'brandstoffen': encode_jsonb,
+    'diesel': cached(encode_int2),
+    'gasoline': cached(encode_int2),
+    'electric': cached(encode_int2),
+}
+ROW_ENCODERS = [ENCODERS[field] for field in FIELDS]
+ROW_HEADER = struct.pack('!h', len(FIELDS))
+
+
+def encode_row(row):
+    return ROW_HEADER + b''.join(
+        NULL if value is None else encode(value)
+        for encode, value in zip(ROW_ENCODERS, row)
+    )
+
+
+class ChunkReader(io.RawIOBase):
+    """A file object reading from an iterator of bytes, for copy_expert()."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class PassageGenerator:
+    def __init__(self, cameras, seed=0, chunk_rows=1000):
+        self.cameras = cameras
+        self.seed = seed
+        self.chunk_rows = chunk_rows
+        # Some cameras are much busier than others, fixed for a seed
+        rng = random.Random(f'{seed}-cameras')
+        self.camera_weights = [rng.lognormvariate(0, 1) for _ in cameras]
+
+    def rows(self, day, count):
+        """Yield `count` passages of `day`, ordered by passage_at."""
+        rng = random.Random(f'{self.seed}-{day.isoformat()}')
+        profile = WEEKEND_PROFILE if day.weekday() >= 5 else WEEKDAY_PROFILE
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+        offsets = sorted(
+            hour * 3600 + rng.random() * 3600
+            for hour in rng.choices(range(24), weights=profile, k=count)
+        )
+        cameras = rng.choices(self.cameras, weights=self.camera_weights, k=count)
+
+        for offset, camera in zip(offsets, cameras):
+            passage_at = start + timedelta(seconds=offset)
+            yield self.passage(rng, camera, passage_at)
+
+    def passage(self, rng, camera, passage_at):
+        soort, inrichting, categorie, (low, high), brandstof, _ = rng.choices(
+            VEHICLES, weights=VEHICLE_WEIGHTS
+        )[0]
+        massa = rng.randint(low, high)
+        light = massa <= 3500
+        nl = rng.random() < 0.92
+        return (
+            uuid.UUID(int=rng.getrandbits(128), version=4),
+            passage_at,
+            passage_at + timedelta(seconds=rng.expovariate(1 / 3)),
+            'passage-v1',
+            camera.straat,
+            camera.rijrichting,
+            camera.rijstrook,
+            camera.camera_id,
+            camera.camera_naam,
+            camera.camera_kijkrichting,
+            (camera.longitude, camera.latitude),
+            'NL' if nl else rng.choice(('DE', 'BE', 'FR', 'PL')),
+            rng.randint(600, 1000),
+            rng.randint(600, 1000),
+            [
+                {'betrouwbaarheid': rng.randint(600, 1000), 'positie': position}
+                for position in range(1, 7)
+            ],
+            round(rng.gauss(45, 12), 1) if rng.random() < 0.3 else None,
+            rng.random() < 0.95,
+            soort,
+            # The privacy rules of PassageDetailSerializer
+            None if light else rng.choice(MERKEN),
+            'Personenauto' if soort == 'Personenauto' else inrichting,
+            date(rng.randint(2000, 2021), 1, 1) if nl else None,
+            1500 if light else massa,
+            categorie,
+            soort == 'Personenauto' and rng.random() < 0.02,
+            [{'brandstof': brandstof, 'volgnr': 1}],
+            1 if brandstof == 'Diesel' else None,
+            1 if brandstof == 'Benzine' else None,
+            1 if brandstof == 'Elektriciteit' else None,
+        )
+
+    def chunks(self, day, count):
+        yield COPY_HEADER
+        chunk = []
+        for row in self.rows(day, count):
+            chunk.append(encode_row(row))
+            if len(chunk) == self.chunk_rows:
+                yield b''.join(chunk)
+                chunk = []
+        yield b''.join(chunk) + COPY_TRAILER
+
+    def copy(self, partition, count, using='default'):
+        """Write `count` passages into a partition, returns the number of rows."""
+        query = sql.SQL('COPY {} ({}) FROM STDIN WITH (FORMAT binary)').format(
+            sql.Identifier(partition.name),
+            sql.SQL(', ').join(map(sql.Identifier, FIELDS)),
+        )
+        with connections[using].cursor() as cursor:
+            cursor.copy_expert(
+                query.as_string(cursor.connection),
+                ChunkReader(self.chunks(partition.day, count)),
+            )
+            rows = cursor.rowcount
+        log.info(f'Generated {rows} passages in {partition.name}')
+        return rows
+
+    def run(self, from_date, to_date, rows, workers=4, using='default'):
+        """
+        Generate `rows` passages in [from_date, to_date], one partition per worker.
+
+        Generating the rows is CPU bound, so unlike map_partitions() the
+        workers are processes, each with its own connection.
+        Yields (partition, rows, exception) as the partitions finish.
+        """
+        counts = split_rows(rows, from_date, to_date)
+        partitions = [create_partition(day, using=connections[using]) for day in counts]
+        # The forked workers must not share the connection of this process
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(self.copy, p, counts[p.day], using): p
+                for p in partitions
+            }
+            for future in as_completed(futures):
+                result, exception = None, future.exception()
+                if exception is None:
+                    result = future.result()
+                yield futures[future], result, exception
+
+
+def split_rows(rows, from_date, to_date):
+    """Divide the rows over the days, with fewer passages in the weekend."""
+    days = [
+        from_date + timedelta(days=n) for n in range((to_date - from_date).days + 1)
+    ]
+    weights = [WEEKEND_SHARE if day.weekday() >= 5 else 1 for day in days]
+    counts = [int(rows * weight / sum(weights)) for weight in weights]
+    for n in range(rows - sum(counts)):
+        counts[n % len(days)] += 1
+    return dict(zip(days, counts))
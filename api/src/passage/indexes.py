@@ -0,0 +1,212 @@
+"""
+The index strategy of passage_passage, applied by the passage_indexes command.
+
+Passages arrive almost in the order of passage_at (and created_at), so a BRIN
+index of a few pages per partition finds a time range nearly as well as a
+B-tree, while an insert hardly has to maintain it. passage_passage has a
+BRIN index on both columns; a B-tree on passage_at is only kept on the
+partitions of the last PASSAGE_BTREE_DAYS days (and the ones made ahead),
+for the queries of recent passages.
+
+Migration 0019 creates the BRIN indexes on the parent table only (ON ONLY),
+so nothing is built in the migration. Partitions created afterwards get
+them from the parent. The existing partitions get theirs from
+switch_indexes(): every partition index is built with CREATE INDEX
+CONCURRENTLY, which doesn't block the ingest, and then attached to the
+parent index. When all partitions have them, the partitioned B-tree indexes
+of the parent (db_index of the model, before 0019) are dropped.
+"""
+import logging
+from datetime import date, timedelta
+
+from django.db import connection
+from psycopg2 import sql
+
+from .partitions import PARENT_TABLE, list_partitions
+
+log = logging.getLogger(__name__)
+
+BRIN_COLUMNS = ('passage_at', 'created_at')
+BTREE_COLUMN = 'passage_at'
+
+# Autosummarize, so the ranges are summarized as a day fills up instead of
+# at the next vacuum
+SQL_CREATE_PARENT_BRIN = """
+    CREATE INDEX IF NOT EXISTS {index} ON ONLY {table}
+    USING brin ({column}) WITH (autosummarize = on)
+"""
+SQL_CREATE_BRIN = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table}
+    USING brin ({column}) WITH (autosummarize = on)
+"""
+SQL_CREATE_BTREE = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {table} ({column})
+"""
+SQL_ATTACH = 'ALTER INDEX {parent} ATTACH PARTITION {index}'
+SQL_DROP = 'DROP INDEX CONCURRENTLY IF EXISTS {index}'
+
+# The partitions with an index that is attached to the index of the parent
+SQL_ATTACHED_PARTITIONS = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_index ON pg_index.indexrelid = pg_inherits.inhrelid
+    JOIN pg_class child ON child.oid = pg_index.indrelid
+    WHERE pg_inherits.inhparent = to_regclass(%s)
+"""
+
+SQL_INDEX_VALID = 'SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)'
+SQL_INDEX_EXISTS = 'SELECT to_regclass(%s) IS NOT NULL'
+
+# The single column B-tree indexes of the parent, the primary key has two
+SQL_PARENT_BTREES = """
+    SELECT idx.relname
+    FROM pg_index
+    JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+    JOIN pg_am ON pg_am.oid = idx.relam
+    JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid
+        AND pg_attribute.attnum = pg_index.indkey[0]
+    WHERE pg_index.indrelid = to_regclass(%s)
+    AND pg_index.indnatts = 1
+    AND pg_am.amname = 'btree'
+    AND pg_attribute.attname = ANY(%s)
+"""
+
+
+def brin_index_name(table, column):
+    return f'{table}_{column}_brin'
+
+
+def btree_index_name(table):
+    return f'{table}_{BTREE_COLUMN}_btree'
+
+
+def _execute(query, using=None, **identifiers):
+    conn = using or connection
+    query = sql.SQL(query).format(
+        **{key: sql.Identifier(value) for key, value in identifiers.items()}
+    )
+    with conn.cursor() as cursor:
+        log.info(query.as_string(cursor.connection))
+        cursor.execute(query)
+
+
+def _fetch_column(query, params, using=None):
+    conn = using or connection
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def is_valid(index, using=None):
+    """Return whether an index exists and is valid (built, and attached to all)."""
+    return _fetch_column(SQL_INDEX_VALID, [index], using) == [True]
+
+
+def exists(index, using=None):
+    return _fetch_column(SQL_INDEX_EXISTS, [index], using) == [True]
+
+
+def create_parent_brin(using=None):
+    for column in BRIN_COLUMNS:
+        _execute(
+            SQL_CREATE_PARENT_BRIN,
+            using,
+            index=brin_index_name(PARENT_TABLE, column),
+            table=PARENT_TABLE,
+            column=column,
+        )
+
+
+def build_brin(partition, using=None):
+    """Build the BRIN indexes of a partition and attach them to the parent."""
+    conn = using or connection
+    built = []
+    for column in BRIN_COLUMNS:
+        parent_index = brin_index_name(PARENT_TABLE, column)
+        if partition.name in _fetch_column(
+            SQL_ATTACHED_PARTITIONS, [parent_index], conn
+        ):
+            continue
+        index = brin_index_name(partition.name, column)
+        # An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index
+        if not is_valid(index, conn):
+            _execute(SQL_DROP, conn, index=index)
+        _execute(
+            SQL_CREATE_BRIN, conn, index=index, table=partition.name, column=column
+        )
+        _execute(SQL_ATTACH, conn, parent=parent_index, index=index)
+        built.append(index)
+    return built
+
+
+def create_btree(partition, using=None):
+    """Build the B-tree of a recent partition, returns whether it was missing."""
+    conn = using or connection
+    index = btree_index_name(partition.name)
+    if is_valid(index, conn):
+        return False
+    _execute(SQL_DROP, conn, index=index)
+    _execute(
+        SQL_CREATE_BTREE, conn, index=index, table=partition.name, column=BTREE_COLUMN
+    )
+    return True
+
+
+def drop_btree(partition, using=None):
+    """Drop the B-tree of an older partition, returns whether it was there."""
+    conn = using or connection
+    index = btree_index_name(partition.name)
+    if not exists(index, conn):
+        return False
+    _execute(SQL_DROP, conn, index=index)
+    return True
+
+
+def drop_parent_btrees(using=None):
+    """
+    Drop the partitioned B-tree indexes on passage_at and created_at, with
+    those of all partitions. Returns their names, or None when not all
+    partitions have their BRIN indexes yet.
+    """
+    conn = using or connection
+    if not all(
+        is_valid(brin_index_name(PARENT_TABLE, column), conn) for column in BRIN_COLUMNS
+    ):
+        return None
+
+    names = _fetch_column(SQL_PARENT_BTREES, [PARENT_TABLE, list(BRIN_COLUMNS)], conn)
+    for name in names:
+        # A partitioned index can't be dropped concurrently
+        _execute('DROP INDEX IF EXISTS {index}', conn, index=name)
+    return names
+
+
+def switch_indexes(btree_days, today=None, using=None):
+    """
+    Apply the index strategy to all partitions, see the module docstring.
+    Every step can be repeated, run it daily to move the B-trees along.
+    """
+    conn = using or connection
+    cutoff = (today or date.today()) - timedelta(days=btree_days - 1)
+    partitions = list_partitions(using=conn)
+    changes = {'brin': [], 'btree_created': [], 'btree_dropped': [], 'parent': []}
+
+    create_parent_brin(conn)
+    for partition in partitions:
+        changes['brin'] += build_brin(partition, conn)
+
+    # First the B-trees of the recent partitions, then the ones of the parent
+    # can go
+    for partition in partitions:
+        if partition.day >= cutoff and create_btree(partition, conn):
+            changes['btree_created'].append(btree_index_name(partition.name))
+
+    dropped = drop_parent_btrees(conn)
+    if dropped is None:
+        log.warning('Not all partitions have their BRIN indexes, kept the B-trees')
+    else:
+        changes['parent'] = dropped
+        for partition in partitions:
+            if partition.day < cutoff and drop_btree(partition, conn):
+                changes['btree_dropped'].append(btree_index_name(partition.name))
+    return changes
@@ -0,0 +1,226 @@
+"""
+Async ingest of the passages, for the ASGI entry point iotsignals/asgi.py.
+
+Django 2.2 has no async views, so the JSON passage POSTs are handled here,
+in front of Django: the passage is validated by PassageDetailSerializer, as
+in PassageViewSet.create, and inserted with asyncpg from a pool of
+ASYNC_INGEST_POOL_SIZE connections per database (the default one and the
+shards). A process waits for the database of hundreds of passages at once,
+instead of one per uWSGI worker.
+
+All other requests, and passages in another format or with a
+Content-Encoding, are handed to the WSGI application of Django.
+"""
+import asyncio
+import json
+import logging
+
+import asyncpg
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.db import connections, router
+from django.urls import reverse
+from metrics import (
+    PASSAGE_CREATE_PHASE_DURATION,
+    PASSAGE_DUPLICATES,
+    PASSAGE_VALIDATION_ERRORS,
+    timed,
+)
+from rest_framework.renderers import JSONRenderer
+
+from .case_converters import to_snakecase
+from .freshness import tracker
+from .models import Passage
+from .serializers import PassageDetailSerializer
+from .sharding import get_shards
+from .statements import get_insert_sql, get_insert_values
+
+log = logging.getLogger(__name__)
+
+
+def record_freshness(passage):
+    """
+    tracker.record() on a thread of the executor. There's no request to
+    return its database connections to the pool, so it's done here.
+    """
+    try:
+        tracker.record(passage)
+    finally:
+        connections.close_all()
+
+
+class RequestError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+async def init_connection(connection):
+    await connection.set_type_codec(
+        'jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog'
+    )
+    await connection.set_type_codec(
+        'geometry',
+        encoder=lambda geometry: geometry.hexewkb.decode(),
+        decoder=GEOSGeometry,
+        schema='public',
+        format='text',
+    )
+
+
+def create_pool(alias):
+    database = settings.DATABASES[alias]
+    return asyncpg.create_pool(
+        host=database['HOST'],
+        port=database['PORT'],
+        user=database['USER'],
+        password=database['PASSWORD'],
+        database=database['NAME'],
+        min_size=1,
+        max_size=settings.ASYNC_INGEST_POOL_SIZE,
+        init=init_connection,
+    )
+
+
+def get_header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def read_body(receive, max_size):
+    chunks, size = [], 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise RequestError(400, 'The client disconnected.')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > max_size:
+            raise RequestError(413, f'The body is larger than {max_size} bytes.')
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def respond(send, status, data, headers=()):
+    body = JSONRenderer().render(data)
+    await send(
+        {
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                *headers,
+            ],
+        }
+    )
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class AsyncIngest:
+    """ASGI application of the async ingest, see the module docstring."""
+
+    def __init__(self, application):
+        # The ASGI application of everything else
+        self.application = application
+        self.path = reverse('v0:passage-list')
+        self.pools = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif self.is_ingest(scope):
+            await self.ingest(receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    def is_ingest(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return False
+        if scope['path'] != self.path:
+            return False
+        content_type = get_header(scope, b'content-type') or ''
+        return content_type.startswith('application/json') and not get_header(
+            scope, b'content-encoding'
+        )
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    for alias in get_shards():
+                        self.pools[alias] = await create_pool(alias)
+                except Exception as exc:
+                    log.exception('Creating the database pools failed')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(exc)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.gather(*(pool.close() for pool in self.pools.values()))
+                self.pools.clear()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def ingest(self, receive, send):
+        try:
+            status, data = await self.create(receive)
+        except RequestError as exc:
+            status, data = exc.status, {'detail': exc.detail}
+        headers = []
+        if status == 503:
+            retry_after = str(settings.ADMISSION_RETRY_AFTER).encode()
+            headers.append((b'retry-after', retry_after))
+        await respond(send, status, data, headers)
+
+    async def create(self, receive):
+        """Return the status and data of the response, like PassageViewSet.create."""
+        body = await read_body(receive, settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('parse')):
+            try:
+                data = json.loads(body)
+            except ValueError as exc:
+                raise RequestError(400, f'JSON parse error - {exc}')
+            if not isinstance(data, dict):
+                raise RequestError(400, 'Expected a passage object.')
+            data = {to_snakecase(k): v for k, v in data.items()}
+
+        serializer = PassageDetailSerializer(data=data)
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('validate')):
+            valid = serializer.is_valid()
+        if not valid:
+            PASSAGE_VALIDATION_ERRORS.inc()
+            return 400, serializer.errors
+
+        passage = Passage(**serializer.validated_data)
+        alias = router.db_for_write(Passage, instance=passage)
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('insert')):
+            try:
+                await self.insert(alias, passage)
+            except asyncpg.UniqueViolationError as exc:
+                log.info(f'DuplicateIdError for id {passage.id}')
+                PASSAGE_DUPLICATES.inc()
+                raise RequestError(409, str(exc))
+            except asyncio.TimeoutError:
+                raise RequestError(503, 'The service is overloaded, try again later.')
+
+        if settings.PASSAGE_FRESHNESS_ENABLED:
+            # It flushes to the database now and then, which blocks
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, record_freshness, passage)
+
+        serializer.instance = passage
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('serialize')):
+            return 201, serializer.data
+
+    async def insert(self, alias, passage):
+        pool = self.pools[alias]
+        timeout = settings.ASYNC_INGEST_POOL_TIMEOUT
+        async with pool.acquire(timeout=timeout) as connection:
+            await connection.execute(get_insert_sql(), *get_insert_values(passage))
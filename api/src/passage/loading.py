@@ -0,0 +1,307 @@
+"""
+Bulk loading of passages from files, like the dump a camera vendor sends of
+the passages it couldn't deliver, or the CSV shards of passage_extract.
+
+The files are NDJSON (one passage per line) or CSV, optionally gzipped, and
+are read as a stream. Every passage goes through PassageDetailSerializer,
+after the same camelCase conversion as PassageViewSet.create, so the
+validation and privacy rules are those of the API. Valid passages are
+batched per database (the shard of the camera) and day, and every batch is
+copied by one of the worker threads into a temporary table and inserted
+from there into its daily partition, which is created when it's missing.
+
+A passage is rejected when it's invalid, when its id was already seen in
+the input, or when it's already in the database. The rejects are written to
+an NDJSON file, with the reason, the file and line, and the row as read.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timezone
+
+from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.postgres.fields import JSONField
+from django.db import connections, transaction
+from django.utils.dateparse import parse_datetime
+from psycopg2 import sql
+from rest_framework.utils.encoders import JSONEncoder
+
+from .case_converters import to_snakecase
+from .models import Passage
+from .partitions import create_partition, partition_name
+from .serializers import PassageDetailSerializer
+from .sharding import shard_for_camera
+from .statements import INSERT_FIELDS, get_insert_values
+
+log = logging.getLogger(__name__)
+
+FORMATS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv'}
+JSON_FIELDS = {
+    field.name
+    for field in Passage._meta.concrete_fields
+    if isinstance(field, JSONField)
+}
+COLUMNS = sql.SQL(', ').join(sql.Identifier(field.column) for field in INSERT_FIELDS)
+
+SQL_CREATE_STAGING = """
+    CREATE TEMPORARY TABLE passage_load (LIKE passage_passage INCLUDING DEFAULTS)
+    ON COMMIT DROP
+"""
+SQL_COPY = sql.SQL('COPY passage_load ({columns}) FROM STDIN').format(columns=COLUMNS)
+SQL_INSERT = sql.SQL(
+    'INSERT INTO {partition} ({columns}) SELECT {columns} FROM passage_load '
+    'ON CONFLICT DO NOTHING RETURNING id'
+)
+
+
+class LoadError(Exception):
+    pass
+
+
+def get_format(path):
+    name = path[: -len('.gz')] if path.endswith('.gz') else path
+    try:
+        return FORMATS[os.path.splitext(name)[1].lower()]
+    except KeyError:
+        raise LoadError(f'Unknown format of {path}, use --format')
+
+
+def open_input(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def read_ndjson(f):
+    """Yield (line, row, error) for every line of an NDJSON file."""
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text), None
+        except ValueError as exc:
+            yield line, text, f'JSON parse error - {exc}'
+
+
+def read_csv(f, delimiter):
+    """
+    Yield (line, row, error) for every row of a CSV file with a header. Empty
+    values are None, and the JSON fields are parsed, like the COPY output
+    of passage_extract.
+    """
+    reader = csv.DictReader(f, delimiter=delimiter)
+    for row in reader:
+        line = reader.line_num
+        try:
+            yield line, parse_csv_row(row), None
+        except ValueError as exc:
+            yield line, row, f'JSON parse error - {exc}'
+
+
+def parse_csv_row(row):
+    parsed = {}
+    for key, value in row.items():
+        if value == '':
+            value = None
+        elif to_snakecase(key) in JSON_FIELDS:
+            value = json.loads(value)
+        parsed[key] = value
+    return parsed
+
+
+def to_internal(row):
+    """The passage data of a row, like PassageViewSet.create gets it."""
+    data = {to_snakecase(key): value for key, value in row.items()}
+    passage_at = data.get('passage_at')
+    if isinstance(passage_at, str):
+        parsed = parse_datetime(passage_at)
+        # Timestamps without a time zone are in UTC, as passage_extract writes them
+        if parsed is not None and parsed.tzinfo is None:
+            data['passage_at'] = parsed.replace(tzinfo=timezone.utc).isoformat()
+    return data
+
+
+def copy_value(value, is_json=False):
+    """A value in the text format of COPY, is_json for the values of a JSONField."""
+    if value is None:
+        return '\\N'
+    # Any value of a JSONField is JSON, strings and booleans too
+    if is_json or isinstance(value, (dict, list)):
+        value = json.dumps(value, cls=JSONEncoder)
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    elif isinstance(value, GEOSGeometry):
+        value = value.hexewkb.decode()
+    else:
+        value = str(value)
+    return (
+        value.replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(passages):
+    f = io.StringIO()
+    for passage in passages:
+        values = zip(INSERT_FIELDS, get_insert_values(passage))
+        f.write(
+            '\t'.join(
+                copy_value(value, is_json=field.name in JSON_FIELDS)
+                for field, value in values
+            )
+        )
+        f.write('\n')
+    f.seek(0)
+    return f
+
+
+class PassageLoader:
+    """Load passages from NDJSON or CSV files, see the module docstring."""
+
+    def __init__(
+        self,
+        paths,
+        rejects_path,
+        file_format=None,
+        delimiter=';',
+        workers=4,
+        batch_size=10000,
+        progress=None,
+    ):
+        self.paths = paths
+        self.rejects_path = rejects_path
+        self.file_format = file_format
+        self.delimiter = delimiter
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress = progress
+
+        self.stats = {'read': 0, 'loaded': 0, 'rejected': 0}
+        self._seen = set()
+        self._partitions = set()
+
+    def read(self, path):
+        """Yield (line, row, error) for every passage in a file."""
+        file_format = self.file_format or get_format(path)
+        with open_input(path) as f:
+            if file_format == 'csv':
+                yield from read_csv(f, self.delimiter)
+            else:
+                yield from read_ndjson(f)
+
+    def validate(self, row):
+        """Return the passage of a row, and the errors when it's invalid."""
+        if not isinstance(row, dict):
+            return None, {'non_field_errors': ['Expected a passage object.']}
+        serializer = PassageDetailSerializer(data=to_internal(row))
+        if not serializer.is_valid():
+            return None, serializer.errors
+
+        passage = Passage(**serializer.validated_data)
+        if passage.id in self._seen:
+            return None, {'id': ['Duplicate id in the input.']}
+        self._seen.add(passage.id)
+        return passage, None
+
+    def reject(self, source, errors):
+        path, line, row = source
+        record = {'file': path, 'line': line, 'errors': errors, 'row': row}
+        self._rejects.write(json.dumps(record, cls=JSONEncoder) + '\n')
+        self.stats['rejected'] += 1
+
+    def load_batch(self, alias, day, batch):
+        """Copy a batch into its partition, returns the ids that were inserted."""
+        passages = [passage for passage, source in batch]
+        partition = sql.Identifier(partition_name(day))
+        try:
+            with transaction.atomic(using=alias):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(SQL_CREATE_STAGING)
+                    cursor.copy_expert(
+                        SQL_COPY.as_string(cursor.connection), copy_rows(passages)
+                    )
+                    cursor.execute(
+                        SQL_INSERT.format(partition=partition, columns=COLUMNS)
+                    )
+                    return {str(row[0]) for row in cursor.fetchall()}
+        finally:
+            connections[alias].close()
+
+    def submit(self, executor, alias, day, batch):
+        if (alias, day) not in self._partitions:
+            create_partition(day, using=connections[alias])
+            self._partitions.add((alias, day))
+        future = executor.submit(self.load_batch, alias, day, batch)
+        self._pending[future] = batch
+
+    def collect(self, futures):
+        for future in futures:
+            batch = self._pending.pop(future)
+            exception = future.exception()
+            if exception is not None:
+                log.error(f'Loading a batch failed: {exception}')
+                self._failed += 1
+                for passage, source in batch:
+                    self.reject(source, {'non_field_errors': [str(exception)]})
+                continue
+
+            inserted = future.result()
+            for passage, source in batch:
+                if str(passage.id) not in inserted:
+                    self.reject(source, {'id': ['Already in the database.']})
+            self.stats['loaded'] += len(inserted)
+
+        if self.progress:
+            self.progress(self.stats)
+
+    def run(self):
+        """Load all files, returns the number of passages read, loaded and rejected."""
+        self._pending = {}
+        self._failed = 0
+        batches = {}
+        # At most two batches per worker wait to be loaded
+        max_pending = 2 * self.workers
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        with open(self.rejects_path, 'w') as self._rejects, executor:
+            for path in self.paths:
+                for line, row, error in self.read(path):
+                    self.stats['read'] += 1
+                    source = (path, line, row)
+                    if error is not None:
+                        self.reject(source, {'non_field_errors': [error]})
+                        continue
+                    passage, errors = self.validate(row)
+                    if errors is not None:
+                        self.reject(source, errors)
+                        continue
+
+                    # The partitions are by the UTC day
+                    day = passage.passage_at.astimezone(timezone.utc).date()
+                    key = (shard_for_camera(passage.camera_id), day)
+                    batch = batches.setdefault(key, [])
+                    batch.append((passage, source))
+                    if len(batch) >= self.batch_size:
+                        self.submit(executor, *key, batches.pop(key))
+                    if len(self._pending) >= max_pending:
+                        done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+                        self.collect(done)
+
+            for key, batch in batches.items():
+                self.submit(executor, *key, batch)
+            self.collect(wait(self._pending).done)
+
+        if self._failed:
+            raise LoadError(
+                f'{self._failed} batches failed, their passages are in '
+                f'{self.rejects_path}'
+            )
+        return self.stats
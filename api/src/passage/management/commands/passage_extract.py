@@ -0,0 +1,106 @@
+import datetime
+import os
+
+from contrib.db.routers import choose_replica
+from django.core.management.base import BaseCommand, CommandError
+from passage.extraction import DEFAULT_FIELDS, ExtractionError, PassageExtraction
+from passage.sharding import get_shards, is_sharded, shard_for_camera
+
+
+class Command(BaseCommand):
+    help = (
+        'Extract raw passages per daily partition into gzipped CSV shards. '
+        'Running it again with the same arguments resumes a failed extraction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory for the shards and manifest')
+        parser.add_argument(
+            '--from-date',
+            type=datetime.date.fromisoformat,
+            required=True,
+            help='First day to extract',
+        )
+        parser.add_argument(
+            '--to-date',
+            type=datetime.date.fromisoformat,
+            default=datetime.date.today(),
+            help='Last day to extract (inclusive), defaults to today',
+        )
+        parser.add_argument(
+            '--camera-id',
+            action='append',
+            dest='camera_ids',
+            help='Only extract passages of this camera, can be given multiple times',
+        )
+        parser.add_argument(
+            '--fields',
+            type=lambda value: value.split(','),
+            default=DEFAULT_FIELDS,
+            help='Comma separated list of fields to extract',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of partitions (and database connections) extracted at once',
+        )
+        parser.add_argument('--delimiter', default=';')
+        parser.add_argument(
+            '--database',
+            help='Database alias to extract from, defaults to a recent replica',
+        )
+
+    def _progress(self, done, total, partition, shard):
+        if shard['status'] == 'done':
+            self.stdout.write(
+                f'[{done}/{total}] {partition.name}: '
+                f'{self.style.SUCCESS(shard["rows"])} rows, {shard["bytes"]} bytes'
+            )
+        else:
+            self.stderr.write(
+                f'[{done}/{total}] {partition.name}: '
+                f'{self.style.ERROR(shard["error"])}'
+            )
+
+    def handle(self, *args, **options):
+        if options['database'] or not is_sharded():
+            using = options['database'] or choose_replica()
+            self.extract(options['output_dir'], using, options)
+            return
+
+        # Every shard is extracted to a directory of its own, with its own
+        # manifest, and only the shards of the requested cameras are.
+        shards = get_shards()
+        if options['camera_ids']:
+            cameras = {shard_for_camera(camera) for camera in options['camera_ids']}
+            shards = [alias for alias in shards if alias in cameras]
+        for alias in shards:
+            self.stdout.write(f'Extracting shard {alias}')
+            self.extract(os.path.join(options['output_dir'], alias), alias, options)
+
+    def extract(self, output_dir, using, options):
+        extraction = PassageExtraction(
+            output_dir=output_dir,
+            from_date=options['from_date'],
+            to_date=options['to_date'],
+            camera_ids=options['camera_ids'],
+            fields=options['fields'],
+            workers=options['workers'],
+            delimiter=options['delimiter'],
+            using=using,
+            progress=self._progress,
+        )
+
+        try:
+            manifest = extraction.run()
+        except ExtractionError as e:
+            raise CommandError(str(e))
+
+        rows = sum(shard['rows'] for shard in manifest['shards'].values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Finished: {len(manifest["shards"])} shards, {rows} rows, '
+                f'manifest: {extraction.manifest_path}'
+            )
+        )
@@ -0,0 +1,63 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from passage.generator import PassageGenerator, load_cameras
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic passages for benchmarking, with the cameras of '
+        'helpertable.csv. The same seed and arguments give the same passages.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rows', type=int, help='Total number of passages')
+        parser.add_argument(
+            '--from-date',
+            type=datetime.date.fromisoformat,
+            required=True,
+            help='First day to generate passages for',
+        )
+        parser.add_argument(
+            '--to-date',
+            type=datetime.date.fromisoformat,
+            help='Last day (inclusive), defaults to --from-date',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of partitions (and database connections) written at once',
+        )
+
+    def handle(self, *args, **options):
+        from_date = options['from_date']
+        to_date = options['to_date'] or from_date
+        if to_date < from_date:
+            raise CommandError('--to-date is before --from-date')
+
+        generator = PassageGenerator(load_cameras(), seed=options['seed'])
+        start = time.monotonic()
+        total = 0
+        failed = []
+        results = generator.run(from_date, to_date, options['rows'], options['workers'])
+        for partition, rows, exception in results:
+            if exception:
+                self.stderr.write(f'{partition.name}: {self.style.ERROR(exception)}')
+                failed.append(partition.name)
+            else:
+                total += rows
+                self.stdout.write(f'{partition.name}: {self.style.SUCCESS(rows)} rows')
+
+        if failed:
+            raise CommandError(f'Generating failed for: {", ".join(sorted(failed))}')
+
+        duration = time.monotonic() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Generated {total} passages in {duration:.1f}s '
+                f'({total / max(duration, 0.001):.0f} rows/s)'
+            )
+        )
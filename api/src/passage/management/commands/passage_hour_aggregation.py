@@ -4,9 +4,14 @@ from datetime import date, timedelta
 
 from django.core.management.base import BaseCommand
 from django.db import connection
+from metrics import AGGREGATION_DURATION, AGGREGATION_ROWS, timed
+from passage.sharding import insert_aggregation, is_sharded
+from sql_accounting import track_command
 
 log = logging.getLogger(__name__)
 
+COMMAND = 'passage_hour_aggregation'
+
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
@@ -26,8 +31,8 @@ class Command(BaseCommand):
         ;
         """
 
-    def _get_aggreagation_query(self, run_date):
-        return f"""
+    def _get_insert_query(self):
+        return """
         INSERT INTO passage_passagehouraggregation (
             date, 
             year, 
@@ -50,6 +55,10 @@ class Command(BaseCommand):
             toegestane_maximum_massa_voertuig, 
             count
         )
+        """
+
+    def _get_select_query(self, run_date):
+        return f"""
         SELECT DATE(passage_at),
                EXTRACT(YEAR FROM passage_at) :: int  AS YEAR,
                EXTRACT(MONTH FROM passage_at) :: int AS MONTH,
@@ -147,31 +156,48 @@ class Command(BaseCommand):
         ;
         """
 
+    def _get_aggreagation_query(self, run_date):
+        return self._get_insert_query() + self._get_select_query(run_date)
+
     def _run_query_from_date(self, run_date):
 
         log.info(f"Delete previously made aggregations for date {run_date}")
         delete_query = self._get_delete_query(run_date)
         log.info(f"Run the following query:")
         log.info(delete_query)
-        with connection.cursor() as cursor:
+        with connection.cursor() as cursor, timed(
+            AGGREGATION_DURATION.labels(COMMAND, 'delete')
+        ):
             cursor.execute(delete_query)
             log.info(f"Deleted {cursor.rowcount} records")
+            AGGREGATION_ROWS.labels(COMMAND, 'delete').inc(cursor.rowcount)
 
         log.info(f"Run aggregation for date {run_date}")
         aggregation_query = self._get_aggreagation_query(run_date)
         log.info(f"Run the following query:")
         log.info(aggregation_query)
-        with connection.cursor() as cursor:
-            cursor.execute(aggregation_query)
-            log.info(f"Inserted {cursor.rowcount} records")
+        with connection.cursor() as cursor, timed(
+            AGGREGATION_DURATION.labels(COMMAND, 'insert')
+        ):
+            if is_sharded():
+                # GROUP BY on every shard, the counts are merged here
+                inserted = insert_aggregation(
+                    cursor, self._get_insert_query(), self._get_select_query(run_date)
+                )
+            else:
+                cursor.execute(aggregation_query)
+                inserted = cursor.rowcount
+            log.info(f"Inserted {inserted} records")
+            AGGREGATION_ROWS.labels(COMMAND, 'insert').inc(inserted)
 
     def handle(self, *args, **options):
-        if options['from_date']:
-            run_date = options['from_date']
-            while run_date < date.today():
-                self._run_query_from_date(run_date)
-                run_date = run_date + timedelta(days=1)
+        with track_command(COMMAND):
+            if options['from_date']:
+                run_date = options['from_date']
+                while run_date < date.today():
+                    self._run_query_from_date(run_date)
+                    run_date = run_date + timedelta(days=1)
 
-        else:
-            run_date = date.today() - timedelta(days=1)
-            self._run_query_from_date(run_date)
+            else:
+                run_date = date.today() - timedelta(days=1)
+                self._run_query_from_date(run_date)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from passage.indexes import switch_indexes
+from passage.sharding import scatter
+from sql_accounting import track_command
+
+COMMAND = 'passage_indexes'
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the BRIN indexes of the passage_passage partitions, keep a B-tree '
+        'on passage_at only on the newest partitions and drop the others. Run it '
+        'daily, after make_paritions.py.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--btree-days',
+            type=int,
+            default=settings.PASSAGE_BTREE_DAYS,
+            help='Days (up to today, and the partitions ahead) with a B-tree',
+        )
+
+    def handle(self, *args, **options):
+        def switch(alias):
+            return switch_indexes(options['btree_days'], using=connections[alias])
+
+        with track_command(COMMAND):
+            results = scatter(switch)
+
+        for changes in results:
+            for name in changes['brin']:
+                self.stdout.write(f'Built {name}')
+            for name in changes['btree_created']:
+                self.stdout.write(f'Built {name}')
+            for name in changes['btree_dropped'] + changes['parent']:
+                self.stdout.write(f'Dropped {name}')
+        self.stdout.write(self.style.SUCCESS('Finished'))
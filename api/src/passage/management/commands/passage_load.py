@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from passage.loading import LoadError, PassageLoader
+
+
+class Command(BaseCommand):
+    help = (
+        'Load passages from NDJSON or CSV files (optionally gzipped), e.g. the '
+        'passages a camera vendor sends after an outage. Rejected passages are '
+        'written to an NDJSON file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Files to load')
+        parser.add_argument(
+            '--format',
+            choices=['ndjson', 'csv'],
+            help='Format of the files, by default from their extension',
+        )
+        parser.add_argument('--delimiter', default=';', help='CSV delimiter')
+        parser.add_argument(
+            '--rejects',
+            help='NDJSON file for the rejected passages, '
+            'defaults to the first file with .rejects.ndjson',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of batches (and database connections) copied at once',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Passages per COPY, per database and day',
+        )
+
+    def _progress(self, stats):
+        self.stdout.write(
+            f'{stats["read"]} read, {stats["loaded"]} loaded, '
+            f'{stats["rejected"]} rejected'
+        )
+
+    def handle(self, *args, **options):
+        rejects = options['rejects'] or f'{options["paths"][0]}.rejects.ndjson'
+        loader = PassageLoader(
+            paths=options['paths'],
+            rejects_path=rejects,
+            file_format=options['format'],
+            delimiter=options['delimiter'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            progress=self._progress,
+        )
+
+        try:
+            stats = loader.run()
+        except LoadError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Finished: {stats["read"]} read, {stats["loaded"]} loaded, '
+                f'{stats["rejected"]} rejected ({rejects})'
+            )
+        )
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from passage.sharding import scatter
+from passage.staging import merge
+from sql_accounting import track_command
+
+log = logging.getLogger(__name__)
+
+COMMAND = 'passage_merge_staging'
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge the passages of the staging table (PASSAGE_INGEST_MODE staging) '
+        'into passage_passage, every --interval seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.PASSAGE_STAGING_MERGE_INTERVAL,
+            help='Seconds between the merges',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.PASSAGE_STAGING_BATCH_SIZE,
+            help='Passages per transaction',
+        )
+        parser.add_argument(
+            '--once', action='store_true', help='Merge once, instead of in a loop'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            start = time.monotonic()
+            with track_command(COMMAND):
+                results = scatter(lambda alias: merge(alias, batch_size))
+            inserted = sum(result[0] for result in results)
+            duplicates = sum(result[1] for result in results)
+            self.stdout.write(f'Merged {inserted} passages, {duplicates} duplicates')
+
+            if options['once']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - start), 0))
@@ -1,22 +1,93 @@
+import datetime
 import logging
 import time
 from datetime import timedelta
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 from django.db.models import Case, F, Max, Min, Value, When
 from django.db.models.functions import TruncDay, TruncYear
 from django.db.utils import ProgrammingError
 from passage.models import Passage
+from passage.partitions import list_partitions, map_partitions
+from passage.privacy import is_clean, rewrite_partition
+from sql_accounting import QueryStats, track_command, track_queries
 
 logger = logging.getLogger(__name__)
 
+COMMAND = 'passage_privacy'
+
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--sleep', nargs='?', default=1, type=int)
+        parser.add_argument(
+            '--rewrite',
+            action='store_true',
+            help=(
+                'Rewrite each partition into a new table and swap it in, '
+                'instead of UPDATE and VACUUM FULL'
+            ),
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of partitions rewritten at once (with --rewrite)',
+        )
+        parser.add_argument(
+            '--from-date',
+            type=datetime.date.fromisoformat,
+            help='First day to rewrite (with --rewrite)',
+        )
+        parser.add_argument(
+            '--to-date',
+            type=datetime.date.fromisoformat,
+            help='Last day to rewrite (with --rewrite), defaults to yesterday',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Also rewrite partitions that are already marked clean',
+        )
+
+    def handle_rewrite(self, **options):
+        # Today's partition is still being written to, and new passages
+        # already have the privacy rules applied by the serializer.
+        to_date = options['to_date'] or datetime.date.today() - timedelta(days=1)
+        partitions = list_partitions(options['from_date'], to_date)
+        if not options['force']:
+            partitions = [p for p in partitions if not is_clean(p)]
+
+        self.stdout.write(f'Rewriting {len(partitions)} partitions')
+        failed = []
+        results = map_partitions(self.rewrite_partition, partitions, options['workers'])
+        for partition, rows, exception in results:
+            if exception:
+                # e.g. a deadlock with a late passage, the next run retries it
+                self.stderr.write(f'{partition.name}: {self.style.ERROR(exception)}')
+                failed.append(partition.name)
+            else:
+                self.stdout.write(f'{partition.name}: {self.style.SUCCESS(rows)} rows')
+
+        if failed:
+            raise CommandError(f'Rewriting failed for: {", ".join(sorted(failed))}')
+        self.stdout.write(self.style.SUCCESS('Finished'))
+
+    def rewrite_partition(self, partition):
+        # The workers have their own connections, account them in the
+        # totals of the command as well.
+        with track_queries(self.stats):
+            return rewrite_partition(partition)
 
     def handle(self, **options):
+        self.stats = QueryStats()
+        with track_command(COMMAND, self.stats):
+            if options['rewrite']:
+                return self.handle_rewrite(**options)
+            return self.handle_update(**options)
+
+    def handle_update(self, **options):
         verbosity = int(options['verbosity'])
         logger.info("message")
 
@@ -0,0 +1,83 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from passage import query_plans
+
+BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'query_plans.json')
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the aggregation and export queries with EXPLAIN (ANALYZE, BUFFERS) '
+        'on a synthetic dataset and compare them with the baseline. '
+        'Only use this on a local database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--load',
+            action='store_true',
+            help='Load the synthetic dataset (and its aggregations) first',
+        )
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--save', action='store_true', help='Store the results as the new baseline'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=25,
+            help='Increase of the runtime or buffers (in percent) that is a regression',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of runs per query, the fastest one is kept',
+        )
+
+    def handle(self, *args, **options):
+        if options['load']:
+            try:
+                loaded = query_plans.load_dataset()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write('Loaded the dataset' if loaded else 'Already loaded')
+
+        results = query_plans.run(query_plans.get_queries(), options['repeat'])
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name}: {result["execution_ms"]} ms, {result["buffers"]} buffers, '
+                f'{len(result["partitions"])} partitions'
+            )
+
+        if options['save']:
+            with open(options['baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Saved {options["baseline"]}'))
+            return
+
+        findings = query_plans.check(results)
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            findings += query_plans.compare(baseline, results, options['threshold'])
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'No baseline at {options["baseline"]}, only the plans are '
+                    f'checked. Create it with --save'
+                )
+            )
+
+        for name, message, regression in findings:
+            style = self.style.ERROR if regression else self.style.WARNING
+            self.stdout.write(f'{name}: {style(message)}')
+
+        regressions = [finding for finding in findings if finding[2]]
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -1,14 +1,30 @@
-from django.core.management.base import BaseCommand
+from datetime import timedelta
 
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
 from passage.models import Passage
 from verify_timestamp import verify_timestamp
 
 
 class Command(BaseCommand):
     def handle(self, *args, **options):
-        latest = Passage.objects.order_by('created_at').last()
+        # Limit on passage_at so only the newest partitions are scanned
+        since = timezone.now() - timedelta(
+            days=settings.PASSAGE_TIMESTAMP_LOOKBACK_DAYS
+        )
+        latest = (
+            Passage.objects.filter(passage_at__gte=since).order_by('created_at').last()
+        )
 
         if latest:
-            verify_timestamp(latest.created_at, app='passage')
+            verify_timestamp(
+                latest.created_at,
+                app='passage',
+                max_age=timedelta(minutes=settings.PASSAGE_TIMESTAMP_MAX_AGE_MINUTES),
+            )
         else:
-            raise Exception('Table is Empty')
+            raise Exception(
+                f'Table is Empty for the last '
+                f'{settings.PASSAGE_TIMESTAMP_LOOKBACK_DAYS} days'
+            )
@@ -3,10 +3,32 @@ import logging
 from datetime import date, timedelta
 
 from django.core.management.base import BaseCommand
-from django.db import connection
+from django.db import connection, transaction
+from metrics import AGGREGATION_DURATION, AGGREGATION_ROWS, timed
+from passage.sharding import fetch_all, is_sharded, merge_counts
+from psycopg2.extras import execute_values
+from sql_accounting import track_command
 
 log = logging.getLogger(__name__)
 
+COMMAND = 'passage_zwaar_verkeer_hour_aggregation'
+
+# The counts of the shards, passage_camera is only on default
+SQL_CREATE_SHARD_COUNTS = """
+    CREATE TEMPORARY TABLE passage_heavy_traffic_counts (
+        timestamp timestamp,
+        camera_naam varchar(255),
+        camera_kijkrichting double precision,
+        rijrichting smallint,
+        kenteken_land text,
+        voertuig_soort varchar(25),
+        inrichting varchar(255),
+        klasse_toegestaan_gewicht text,
+        intensiteit bigint
+    ) ON COMMIT DROP
+"""
+SQL_INSERT_SHARD_COUNTS = 'INSERT INTO passage_heavy_traffic_counts VALUES %s'
+
 
 class Command(BaseCommand):
     def add_arguments(self, parser):
@@ -26,8 +48,8 @@ class Command(BaseCommand):
         ;
         """
 
-    def _get_aggregation_query(self, run_date):
-        return f"""
+    def _get_insert_query(self):
+        return """
         INSERT INTO passage_heavytraffichouraggregation (
             passage_at_timestamp,
             passage_at_date,
@@ -50,6 +72,10 @@ class Command(BaseCommand):
             voertuig_klasse_toegestaan_gewicht,
             intensiteit
         )
+        """
+
+    def _get_select_query(self, run_date):
+        return f"""
         
         -- query voor zone zwaar verkeer
         SELECT
@@ -143,28 +169,134 @@ class Command(BaseCommand):
                 ELSE 'onbekend'	END
         """
 
+    def _get_aggregation_query(self, run_date):
+        return self._get_insert_query() + self._get_select_query(run_date)
+
+    def _get_shard_select_query(self, run_date):
+        # The passage side of _get_select_query, grouped by the columns that
+        # are joined with passage_camera
+        return f"""
+        SELECT
+        date_trunc('hour', passage_at),
+        camera_naam,
+        camera_kijkrichting,
+        rijrichting,
+        CASE WHEN kenteken_land = 'NL' then 'NL' ELSE 'buitenland' END,
+        voertuig_soort,
+        CASE WHEN voertuig_soort = 'Personenauto' then 'Personenauto' ELSE inrichting END,
+        CASE    WHEN kenteken_land <> 'NL' then 'buitenland'
+                WHEN toegestane_maximum_massa_voertuig <=  3500 then 'klasse 0 <= 3500'
+                WHEN toegestane_maximum_massa_voertuig <=  7500 then 'klasse 1 <= 7500'
+                WHEN toegestane_maximum_massa_voertuig <= 11250 then 'klasse 2 <= 11250'
+                WHEN toegestane_maximum_massa_voertuig <= 30000 then 'klasse 3 <= 30000'
+                WHEN toegestane_maximum_massa_voertuig <= 50000 then 'klasse 4 <= 50000'
+                WHEN toegestane_maximum_massa_voertuig > 50000 then 'klasse 5 > 50000'
+                ELSE 'onbekend' END,
+        count(*)
+        FROM passage_passage
+        WHERE passage_at >= '{run_date}'
+        AND passage_at < '{run_date + timedelta(days=1)}'
+        GROUP BY 1, 2, 3, 4, 5, 6, 7, 8
+        """
+
+    def _get_camera_select_query(self):
+        # _get_select_query on the merged counts of the shards
+        return """
+        SELECT
+        c.timestamp,
+        date(c.timestamp),
+        extract(YEAR FROM c.timestamp)::int,
+        extract(MONTH FROM c.timestamp)::int,
+        extract(DAY FROM c.timestamp)::int,
+        extract(WEEK FROM c.timestamp)::int,
+        CASE
+            WHEN extract(DOW FROM c.timestamp)::int = 0 then '7 zondag'
+            WHEN extract(DOW FROM c.timestamp)::int = 1 then '1 maandag'
+            WHEN extract(DOW FROM c.timestamp)::int = 2 then '2 dinsdag'
+            WHEN extract(DOW FROM c.timestamp)::int = 3 then '3 woendsag'
+            WHEN extract(DOW FROM c.timestamp)::int = 4 then '4 donderdag'
+            WHEN extract(DOW FROM c.timestamp)::int = 5 then '5 vrijdag'
+            WHEN extract(DOW FROM c.timestamp)::int = 6 then '6 zaterdag'
+        ELSE 'onbekend ' END,
+        extract(HOUR FROM c.timestamp)::int,
+        h.order_kaart,
+        h.order_naam,
+        h.cordon,
+        h.richting,
+        h.location,
+        h.geom,
+        h.azimuth,
+        c.kenteken_land,
+        c.voertuig_soort,
+        c.inrichting,
+        c.klasse_toegestaan_gewicht,
+        sum(c.intensiteit)
+        FROM passage_heavy_traffic_counts AS c
+        JOIN passage_camera AS h
+        ON c.camera_naam = h.camera_naam AND
+           c.camera_kijkrichting = h.camera_kijkrichting AND
+           c.rijrichting = h.rijrichting
+        WHERE h.cordon IN ('S100','A10')
+        GROUP BY
+        c.timestamp,
+        h.order_kaart,
+        h.order_naam,
+        h.cordon,
+        h.richting,
+        h.geom,
+        h.location,
+        h.azimuth,
+        c.kenteken_land,
+        c.voertuig_soort,
+        c.inrichting,
+        c.klasse_toegestaan_gewicht
+        """
+
+    def _insert_sharded(self, run_date):
+        """
+        Count the passages on every shard, and join the merged counts with
+        passage_camera on default, which the shards don't have.
+        """
+        rows = merge_counts(fetch_all(self._get_shard_select_query(run_date)))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(SQL_CREATE_SHARD_COUNTS)
+            execute_values(cursor.cursor, SQL_INSERT_SHARD_COUNTS, rows, page_size=1000)
+            cursor.execute(self._get_insert_query() + self._get_camera_select_query())
+            return cursor.rowcount
+
     def _run_query_from_date(self, run_date):
         log.info(f"Delete previously made aggregations for date {run_date}")
         delete_query = self._get_delete_query(run_date)
         log.info(f"Run the following query: {delete_query}")
-        with connection.cursor() as cursor:
+        with connection.cursor() as cursor, timed(
+            AGGREGATION_DURATION.labels(COMMAND, 'delete')
+        ):
             cursor.execute(delete_query)
             log.info(f"Deleted {cursor.rowcount} records")
+            AGGREGATION_ROWS.labels(COMMAND, 'delete').inc(cursor.rowcount)
 
         log.info(f"Run aggregation for date {run_date}")
         aggregation_query = self._get_aggregation_query(run_date)
         log.info(f"Run the following query: {aggregation_query}")
-        with connection.cursor() as cursor:
-            cursor.execute(aggregation_query)
-            log.info(f"Inserted {cursor.rowcount} records")
+        with connection.cursor() as cursor, timed(
+            AGGREGATION_DURATION.labels(COMMAND, 'insert')
+        ):
+            if is_sharded():
+                inserted = self._insert_sharded(run_date)
+            else:
+                cursor.execute(aggregation_query)
+                inserted = cursor.rowcount
+            log.info(f"Inserted {inserted} records")
+            AGGREGATION_ROWS.labels(COMMAND, 'insert').inc(inserted)
 
     def handle(self, *args, **options):
-        if options['from_date']:
-            run_date = options['from_date']
-            while run_date < date.today():
-                self._run_query_from_date(run_date)
-                run_date = run_date + timedelta(days=1)
+        with track_command(COMMAND):
+            if options['from_date']:
+                run_date = options['from_date']
+                while run_date < date.today():
+                    self._run_query_from_date(run_date)
+                    run_date = run_date + timedelta(days=1)
 
-        else:
-            run_date = date.today() - timedelta(days=1)
-            self._run_query_from_date(run_date)
+            else:
+                run_date = date.today() - timedelta(days=1)
+                self._run_query_from_date(run_date)
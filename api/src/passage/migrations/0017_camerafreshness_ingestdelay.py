@@ -0,0 +1,36 @@
+# Generated by Django 2.2.24 on 2026-10-19 09:12
+
+import datetimeutc.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passage', '0016_auto_20210909_1410'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CameraFreshness',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('camera_id', models.CharField(max_length=255, unique=True)),
+                ('camera_naam', models.CharField(max_length=255)),
+                ('last_passage_at', datetimeutc.fields.DateTimeUTCField()),
+                ('last_created_at', datetimeutc.fields.DateTimeUTCField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IngestDelay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('le', models.FloatField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('date', 'le')},
+            },
+        ),
+    ]
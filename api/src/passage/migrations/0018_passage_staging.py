@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passage', '0017_camerafreshness_ingestdelay'),
+    ]
+
+    # The table of PASSAGE_INGEST_MODE staging, see passage/staging.py. It is
+    # UNLOGGED and has no indexes (not even a primary key), so an insert
+    # writes neither WAL nor index pages.
+    sql = """
+    CREATE UNLOGGED TABLE passage_passage_staging (
+        LIKE passage_passage INCLUDING DEFAULTS
+    );
+    """
+
+    reverse_sql = "DROP TABLE IF EXISTS passage_passage_staging;"
+
+    operations = [migrations.RunSQL(sql=sql, reverse_sql=reverse_sql)]
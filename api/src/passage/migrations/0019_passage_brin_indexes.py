@@ -0,0 +1,70 @@
+import datetimeutc.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('passage', '0018_passage_staging'),
+    ]
+
+    # The BRIN indexes on the parent only, they are built for the existing
+    # partitions (and the B-trees dropped) by the passage_indexes command,
+    # see passage/indexes.py. New partitions get them from the parent.
+    sql = """
+    CREATE INDEX IF NOT EXISTS passage_passage_passage_at_brin
+    ON ONLY passage_passage USING brin (passage_at) WITH (autosummarize = on);
+    CREATE INDEX IF NOT EXISTS passage_passage_created_at_brin
+    ON ONLY passage_passage USING brin (created_at) WITH (autosummarize = on);
+    """
+
+    # The B-trees are back, unless passage_indexes never dropped them
+    reverse_sql = """
+    DROP INDEX IF EXISTS passage_passage_passage_at_brin;
+    DROP INDEX IF EXISTS passage_passage_created_at_brin;
+    DO $$
+    DECLARE
+        col text;
+    BEGIN
+        FOREACH col IN ARRAY ARRAY['passage_at', 'created_at'] LOOP
+            IF NOT EXISTS (
+                SELECT FROM pg_index
+                JOIN pg_class idx ON idx.oid = pg_index.indexrelid
+                JOIN pg_am ON pg_am.oid = idx.relam
+                JOIN pg_attribute ON pg_attribute.attrelid = pg_index.indrelid
+                    AND pg_attribute.attnum = pg_index.indkey[0]
+                WHERE pg_index.indrelid = 'passage_passage'::regclass
+                AND pg_index.indnatts = 1
+                AND pg_am.amname = 'btree'
+                AND pg_attribute.attname = col
+            ) THEN
+                EXECUTE format(
+                    'CREATE INDEX %I ON passage_passage (%I)',
+                    'passage_passage_' || col || '_btree',
+                    col
+                );
+            END IF;
+        END LOOP;
+    END
+    $$;
+    """
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(sql=sql, reverse_sql=reverse_sql),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='passage',
+                    name='passage_at',
+                    field=datetimeutc.fields.DateTimeUTCField(),
+                ),
+                migrations.AlterField(
+                    model_name='passage',
+                    name='created_at',
+                    field=datetimeutc.fields.DateTimeUTCField(auto_now_add=True),
+                ),
+            ],
+        ),
+    ]
@@ -13,8 +13,10 @@ class Passage(models.Model):
     """
 
     id = models.UUIDField(primary_key=True, unique=True)
-    passage_at = DateTimeUTCField(db_index=True, null=False)
-    created_at = DateTimeUTCField(db_index=True, auto_now_add=True, editable=False)
+    # Both have a BRIN index, passage_at a B-tree on the recent partitions, see
+    # passage/indexes.py
+    passage_at = DateTimeUTCField(null=False)
+    created_at = DateTimeUTCField(auto_now_add=True, editable=False)
 
     version = models.CharField(max_length=20)
 
@@ -121,3 +123,23 @@ class HeavyTrafficHourAggregation(models.Model):
     inrichting = models.CharField(max_length=255, null=True)
     voertuig_klasse_toegestaan_gewicht = models.CharField(max_length=255, null=True, blank=True)
     intensiteit = models.IntegerField(null=True, blank=True)
+
+
+class CameraFreshness(models.Model):
+    """Last seen passage per camera, flushed periodically by the ingest workers."""
+
+    camera_id = models.CharField(max_length=255, unique=True)
+    camera_naam = models.CharField(max_length=255)
+    last_passage_at = DateTimeUTCField()
+    last_created_at = DateTimeUTCField()
+
+
+class IngestDelay(models.Model):
+    """Histogram of created_at - passage_at per day, `le` is the bucket bound in seconds."""
+
+    date = models.DateField()
+    le = models.FloatField()
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'le')
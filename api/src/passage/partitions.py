@@ -0,0 +1,136 @@
+"""
+Helpers for the daily partitions of passage_passage.
+
+The partitions are created by make_paritions.py and are named
+passage_passage_YYYYMMDD, each holding one day of passages (by passage_at).
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple
+
+from django.db import connection, connections
+from psycopg2 import sql
+
+PARENT_TABLE = 'passage_passage'
+
+SQL_LIST_PARTITIONS = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+    JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+    WHERE parent.relname = %s
+    ORDER BY child.relname
+"""
+
+# reltuples is maintained by (auto)vacuum and analyze, it is -1 or 0 for
+# partitions that have never been analyzed.
+SQL_ESTIMATE_ROWS = """
+    SELECT coalesce(sum(greatest(child.reltuples, 0)), 0)::bigint
+    FROM pg_inherits
+    JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+    JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+    WHERE parent.relname = %s
+    AND child.relname >= %s
+"""
+
+
+class Partition(NamedTuple):
+    name: str
+    day: date
+
+    @property
+    def lower(self):
+        return self.day
+
+    @property
+    def upper(self):
+        return self.day + timedelta(days=1)
+
+
+def partition_name(day: date) -> str:
+    return f'{PARENT_TABLE}_{day:%Y%m%d}'
+
+
+def parse_partition_name(name: str):
+    """Return the day of a partition name, or None if it is not a daily partition."""
+    suffix = name[len(PARENT_TABLE) + 1 :]
+    if not name.startswith(f'{PARENT_TABLE}_') or len(suffix) != 8:
+        return None
+    try:
+        return datetime.strptime(suffix, '%Y%m%d').date()
+    except ValueError:
+        return None
+
+
+def list_partitions(
+    from_date: date = None, to_date: date = None, using=None
+) -> List[Partition]:
+    """List the daily partitions, optionally limited to [from_date, to_date]."""
+    conn = using or connection
+    with conn.cursor() as cursor:
+        cursor.execute(SQL_LIST_PARTITIONS, [PARENT_TABLE])
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        day = parse_partition_name(name)
+        if day is None:
+            continue
+        if from_date and day < from_date:
+            continue
+        if to_date and day > to_date:
+            continue
+        partitions.append(Partition(name, day))
+    return partitions
+
+
+def create_partition(day: date, using=None) -> Partition:
+    """Create the partition of a day (like make_paritions.py) if it doesn't exist."""
+    conn = using or connection
+    partition = Partition(partition_name(day), day)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            sql.SQL(
+                'CREATE TABLE IF NOT EXISTS {} PARTITION OF {} '
+                'FOR VALUES FROM ({}) TO ({})'
+            ).format(
+                sql.Identifier(partition.name),
+                sql.Identifier(PARENT_TABLE),
+                sql.Literal(partition.lower.isoformat()),
+                sql.Literal(partition.upper.isoformat()),
+            )
+        )
+    return partition
+
+
+def estimate_row_count(from_date: date = None, using=None) -> int:
+    """Estimate the number of passages from the catalog, without scanning any table."""
+    conn = using or connection
+    lower = partition_name(from_date) if from_date else PARENT_TABLE
+    with conn.cursor() as cursor:
+        cursor.execute(SQL_ESTIMATE_ROWS, [PARENT_TABLE, lower])
+        return cursor.fetchone()[0]
+
+
+def map_partitions(func, partitions, workers, using='default'):
+    """
+    Call func(partition) for every partition from a pool of worker threads.
+
+    Every worker uses its own connection, which is closed after each
+    partition so there are never more than `workers` connections open.
+    Yields (partition, result, exception) in the order the partitions finish.
+    """
+
+    def run(partition):
+        try:
+            return func(partition)
+        finally:
+            connections[using].close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, p): p for p in partitions}
+        for future in as_completed(futures):
+            result, exception = None, future.exception()
+            if exception is None:
+                result = future.result()
+            yield futures[future], result, exception
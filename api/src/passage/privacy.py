@@ -0,0 +1,200 @@
+"""
+Rewrite daily partitions with the privacy rules applied.
+
+Instead of updating the rows in place (and vacuuming the bloat away
+afterwards) a partition is copied into a new table with INSERT ... SELECT,
+applying the same rules as PassageDetailSerializer. The copy gets the indexes
+of the original and is swapped in with DETACH / ATTACH PARTITION, all within
+one transaction so readers never see a partial day.
+
+A rewritten partition is marked with a table comment, so it is skipped when
+the job runs again.
+"""
+import logging
+import re
+
+from django.db import connections, transaction
+from psycopg2 import sql
+
+from .models import Passage
+from .partitions import PARENT_TABLE
+
+log = logging.getLogger(__name__)
+
+CLEAN_MARKER = 'privacy:clean'
+
+# Same rules as PassageDetailSerializer.validate(_*)
+PRIVACY_RULES = {
+    'datum_eerste_toelating': "date_trunc('year', datum_eerste_toelating)::date",
+    'datum_tenaamstelling': 'NULL',
+    'toegestane_maximum_massa_voertuig': (
+        'CASE WHEN toegestane_maximum_massa_voertuig <= 3500 THEN 1500 '
+        'ELSE toegestane_maximum_massa_voertuig END'
+    ),
+    'europese_voertuigcategorie_toevoeging': (
+        'CASE WHEN toegestane_maximum_massa_voertuig <= 3500 THEN NULL '
+        'ELSE europese_voertuigcategorie_toevoeging END'
+    ),
+    'inrichting': (
+        "CASE WHEN lower(voertuig_soort) = 'personenauto' THEN 'Personenauto' "
+        "ELSE inrichting END"
+    ),
+    'merk': (
+        'CASE WHEN toegestane_maximum_massa_voertuig <= 3500 THEN NULL ' 'ELSE merk END'
+    ),
+}
+
+SQL_PARTITION_INFO = """
+    SELECT
+        pg_get_expr(c.relpartbound, c.oid),
+        pg_get_partition_constraintdef(c.oid),
+        obj_description(c.oid, 'pg_class')
+    FROM pg_class c
+    WHERE c.oid = %s::regclass
+"""
+
+# The indexes of the partition, with the constraint they back (if any)
+SQL_PARTITION_INDEXES = """
+    SELECT i.relname, pg_get_indexdef(i.oid), con.conname, pg_get_constraintdef(con.oid)
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    LEFT JOIN pg_constraint con ON con.conindid = i.oid AND con.conrelid = x.indrelid
+    WHERE x.indrelid = %s::regclass
+"""
+
+INDEXDEF_RE = re.compile(
+    r'^(CREATE (?:UNIQUE )?INDEX) \S+ ON (?:ONLY )?\S+ (USING .*)$'
+)
+
+
+def is_clean(partition, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(SQL_PARTITION_INFO, [partition.name])
+        return cursor.fetchone()[2] == CLEAN_MARKER
+
+
+def get_select_list():
+    columns = [field.column for field in Passage._meta.concrete_fields]
+    return columns, sql.SQL(', ').join(
+        sql.SQL(PRIVACY_RULES[column])
+        if column in PRIVACY_RULES
+        else sql.Identifier(column)
+        for column in columns
+    )
+
+
+def rewrite_partition(partition, using='default'):
+    """Rewrite one partition with the privacy rules applied, returns the number of rows."""
+    old = partition.name
+    new = f'{old}_rw'
+    columns, select_list = get_select_list()
+
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # Late passages for this day have to wait until the swap is done,
+        # reading the partition is still possible.
+        cursor.execute(
+            sql.SQL('LOCK TABLE {} IN SHARE MODE').format(sql.Identifier(old))
+        )
+
+        cursor.execute(SQL_PARTITION_INFO, [old])
+        bound, partition_constraint, _ = cursor.fetchone()
+        cursor.execute(SQL_PARTITION_INDEXES, [old])
+        indexes = cursor.fetchall()
+
+        cursor.execute(
+            sql.SQL(
+                'CREATE TABLE {new} (LIKE {old} INCLUDING DEFAULTS INCLUDING STORAGE)'
+            ).format(new=sql.Identifier(new), old=sql.Identifier(old))
+        )
+        cursor.execute(
+            sql.SQL(
+                'INSERT INTO {new} ({columns}) '
+                'SELECT {select_list} FROM {old} ORDER BY passage_at'
+            ).format(
+                new=sql.Identifier(new),
+                old=sql.Identifier(old),
+                columns=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                select_list=select_list,
+            )
+        )
+        rows = cursor.rowcount
+
+        # Build the indexes before the swap, so ATTACH only has to adopt them
+        renames = []
+        for index_name, indexdef, constraint_name, constraintdef in indexes:
+            tmp_name = f'{index_name[:60]}_rw'
+            if constraint_name:
+                cursor.execute(
+                    sql.SQL('ALTER TABLE {} ADD CONSTRAINT {} {}').format(
+                        sql.Identifier(new),
+                        sql.Identifier(tmp_name),
+                        sql.SQL(constraintdef),
+                    )
+                )
+            else:
+                create, using_clause = INDEXDEF_RE.match(indexdef).groups()
+                cursor.execute(
+                    sql.SQL('{} {} ON {} {}').format(
+                        sql.SQL(create),
+                        sql.Identifier(tmp_name),
+                        sql.Identifier(new),
+                        sql.SQL(using_clause),
+                    )
+                )
+            renames.append((tmp_name, index_name, constraint_name))
+
+        # With the partition constraint in place ATTACH doesn't scan the table
+        cursor.execute(
+            sql.SQL('ALTER TABLE {} ADD CONSTRAINT {} CHECK ({})').format(
+                sql.Identifier(new),
+                sql.Identifier(f'{new}_bound'),
+                sql.SQL(partition_constraint),
+            )
+        )
+        cursor.execute(sql.SQL('ANALYZE {}').format(sql.Identifier(new)))
+
+        # The swap, this holds a lock on passage_passage for a short moment
+        cursor.execute(
+            sql.SQL('ALTER TABLE {} DETACH PARTITION {}').format(
+                sql.Identifier(PARENT_TABLE), sql.Identifier(old)
+            )
+        )
+        cursor.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier(old)))
+        cursor.execute(
+            sql.SQL('ALTER TABLE {} RENAME TO {}').format(
+                sql.Identifier(new), sql.Identifier(old)
+            )
+        )
+        for tmp_name, index_name, constraint_name in renames:
+            if constraint_name:
+                cursor.execute(
+                    sql.SQL('ALTER TABLE {} RENAME CONSTRAINT {} TO {}').format(
+                        sql.Identifier(old),
+                        sql.Identifier(tmp_name),
+                        sql.Identifier(constraint_name),
+                    )
+                )
+            else:
+                cursor.execute(
+                    sql.SQL('ALTER INDEX {} RENAME TO {}').format(
+                        sql.Identifier(tmp_name), sql.Identifier(index_name)
+                    )
+                )
+        cursor.execute(
+            sql.SQL('ALTER TABLE {} ATTACH PARTITION {} {}').format(
+                sql.Identifier(PARENT_TABLE), sql.Identifier(old), sql.SQL(bound)
+            )
+        )
+        cursor.execute(
+            sql.SQL('ALTER TABLE {} DROP CONSTRAINT {}').format(
+                sql.Identifier(old), sql.Identifier(f'{new}_bound')
+            )
+        )
+        cursor.execute(
+            sql.SQL('COMMENT ON TABLE {} IS {}').format(
+                sql.Identifier(old), sql.Literal(CLEAN_MARKER)
+            )
+        )
+
+    log.info(f'Rewrote {old}: {rows} rows')
+    return rows
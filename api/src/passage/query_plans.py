@@ -0,0 +1,308 @@
+"""
+Plan and timing regression checks of the aggregation and export queries.
+
+A small deterministic dataset (DATASET_DAYS days from DATASET_START, the
+same rows on every run) is loaded into a local database, and every query is
+run with EXPLAIN (ANALYZE, BUFFERS). The plans are checked against
+EXPECTED_PLANS, which needs no baseline: the dataset is the same every run,
+so a seq scan or a partition more is a change of the query or the indexes.
+The runtime, buffers and plan shape are compared with a JSON baseline, see
+the passage_query_plans command.
+"""
+import json
+import logging
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.http import QueryDict
+
+from .management.commands.passage_hour_aggregation import (
+    Command as HourAggregationCommand,
+)
+from .management.commands.passage_zwaar_verkeer_hour_aggregation import (
+    Command as HeavyTrafficAggregationCommand,
+)
+from .models import Passage
+from .partitions import PARENT_TABLE, create_partition
+
+log = logging.getLogger(__name__)
+
+# A Monday, so the dataset is ISO week 2 of 2020
+DATASET_START = date(2020, 1, 6)
+DATASET_DAYS = 7
+DATASET_ROWS_PER_DAY = 10000
+DATASET_CAMERAS = 40
+
+# Differences below this are noise, whatever the threshold
+MIN_DURATION_MS = 1
+
+# The number of passage partitions a query may scan, and the tables it may
+# read with a seq scan. The partitions themselves may be read whole.
+EXPECTED_PLANS = {
+    'hour_aggregation.delete': (0, {'passage_passagehouraggregation'}),
+    'hour_aggregation.insert': (1, set()),
+    'zwaar_verkeer_hour_aggregation.delete': (
+        0,
+        {'passage_heavytraffichouraggregation'},
+    ),
+    'zwaar_verkeer_hour_aggregation.insert': (1, {'passage_camera'}),
+    'export': (0, {'passage_passagehouraggregation'}),
+    'export_taxi': (0, {'passage_passagehouraggregation'}),
+}
+
+SQL_INSERT_CAMERAS = """
+    INSERT INTO passage_camera (camera_naam, rijrichting, camera_kijkrichting, cordon)
+    SELECT
+        'Synthetic camera ' || c,
+        1 - 2 * (c %% 2),
+        (c * 45) %% 360,
+        (ARRAY['S100', 'A10', NULL])[c %% 3 + 1]
+    FROM generate_series(0, %(cameras)s - 1) AS c
+    WHERE NOT EXISTS (
+        SELECT FROM passage_camera WHERE camera_naam = 'Synthetic camera ' || c
+    )
+"""
+
+# Every value is derived from the day and the row number, so each load
+# gives the same rows.
+SQL_INSERT_PASSAGES = """
+    INSERT INTO passage_passage (
+        id, passage_at, created_at, version, rijrichting, rijstrook,
+        camera_id, camera_naam, camera_kijkrichting, camera_locatie,
+        kenteken_land, kenteken_nummer_betrouwbaarheid,
+        kenteken_land_betrouwbaarheid, voertuig_soort, merk, inrichting,
+        datum_eerste_toelating, toegestane_maximum_massa_voertuig,
+        europese_voertuigcategorie, taxi_indicator, diesel, gasoline, electric
+    )
+    SELECT
+        md5(%(day)s || '-' || i)::uuid,
+        %(day)s::timestamptz + i * interval '1 day' / %(rows)s,
+        %(day)s::timestamptz + i * interval '1 day' / %(rows)s + interval '5 s',
+        'passage-v1',
+        1 - 2 * (c %% 2),
+        1 + i %% 3,
+        md5('camera-' || c)::uuid::text,
+        'Synthetic camera ' || c,
+        (c * 45) %% 360,
+        ST_SetSRID(ST_MakePoint(4.85 + c * 0.002, 52.35 + c * 0.001), 4326),
+        CASE WHEN i %% 10 = 0 THEN 'DE' ELSE 'NL' END,
+        500 + i %% 500,
+        500 + i %% 500,
+        (ARRAY[
+            'Personenauto', 'Personenauto', 'Personenauto', 'Personenauto',
+            'Personenauto', 'Personenauto', 'Bedrijfsauto', 'Bedrijfsauto',
+            'Bus', 'Vrachtwagen'
+        ])[v + 1],
+        'MERK' || i %% 25,
+        (ARRAY['stationwagen', 'hatchback', 'gesloten opbouw', 'bus', 'kipper'])[
+            i %% 5 + 1
+        ],
+        date '2000-01-01' + (i %% 7000),
+        (ARRAY[1500, 1800, 2200, 2500, 3000, 3500, 3500, 7500, 18000, 40000])[v + 1],
+        (ARRAY['M1', 'M1', 'M1', 'M1', 'M1', 'M1', 'N1', 'N1', 'M3', 'N3'])[v + 1],
+        i %% 50 = 0,
+        CASE WHEN v >= 6 THEN 1 END,
+        CASE WHEN v < 6 THEN 1 END,
+        CASE WHEN i %% 20 = 0 THEN 1 END
+    FROM generate_series(0, %(rows)s - 1) AS i,
+    LATERAL (SELECT (i * 7919) %% %(cameras)s AS c, (i * 31) %% 10 AS v) AS x
+"""
+
+
+def load_dataset(
+    start=DATASET_START,
+    days=DATASET_DAYS,
+    rows_per_day=DATASET_ROWS_PER_DAY,
+    cameras=DATASET_CAMERAS,
+):
+    """Load the dataset and its aggregations, returns False if it was already loaded."""
+    end = start + timedelta(days=days)
+    existing = Passage.objects.filter(passage_at__gte=start, passage_at__lt=end).count()
+    if existing == days * rows_per_day:
+        return False
+    if existing:
+        raise ValueError(
+            f'{existing} passages between {start} and {end} that are not part '
+            f'of the dataset, use an empty database'
+        )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(SQL_INSERT_CAMERAS, {'cameras': cameras})
+        for n in range(days):
+            day = start + timedelta(days=n)
+            create_partition(day)
+            cursor.execute(
+                SQL_INSERT_PASSAGES,
+                {'day': day.isoformat(), 'rows': rows_per_day, 'cameras': cameras},
+            )
+            log.info(f'Loaded {cursor.rowcount} passages for {day}')
+
+    for n in range(days):
+        day = start + timedelta(days=n)
+        HourAggregationCommand()._run_query_from_date(day)
+        HeavyTrafficAggregationCommand()._run_query_from_date(day)
+
+    with connection.cursor() as cursor:
+        for table in (
+            PARENT_TABLE,
+            'passage_camera',
+            'passage_passagehouraggregation',
+            'passage_heavytraffichouraggregation',
+        ):
+            cursor.execute(f'ANALYZE {table}')
+    return True
+
+
+def get_queries(day=DATASET_START):
+    """Return the queries to check as {name: (sql, params)}."""
+    # Imported here, the views import a lot that the command doesn't need
+    from .views import PassageViewSet
+
+    hour_aggregation = HourAggregationCommand()
+    heavy_traffic = HeavyTrafficAggregationCommand()
+    year, week, _ = day.isocalendar()
+    export = PassageViewSet.get_export_queryset(QueryDict(f'year={year}&week={week}'))
+    export_taxi = PassageViewSet.get_export_taxi_queryset()
+    return {
+        'hour_aggregation.delete': (hour_aggregation._get_delete_query(day), None),
+        'hour_aggregation.insert': (
+            hour_aggregation._get_aggreagation_query(day),
+            None,
+        ),
+        'zwaar_verkeer_hour_aggregation.delete': (
+            heavy_traffic._get_delete_query(day),
+            None,
+        ),
+        'zwaar_verkeer_hour_aggregation.insert': (
+            heavy_traffic._get_aggregation_query(day),
+            None,
+        ),
+        'export': export.query.sql_with_params(),
+        'export_taxi': export_taxi.query.sql_with_params(),
+    }
+
+
+def explain(sql, params):
+    """Run the query with EXPLAIN (ANALYZE, BUFFERS), the changes are rolled back."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        transaction.set_rollback(True)
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def walk(node, depth=0):
+    yield node, depth
+    for child in node.get('Plans', []):
+        yield from walk(child, depth + 1)
+
+
+def summarize(explained):
+    """Return the numbers and plan shape of an EXPLAIN (FORMAT JSON) result."""
+    root = explained['Plan']
+    shape = []
+    seq_scans = set()
+    partitions = set()
+    for node, depth in walk(root):
+        relation = node.get('Relation Name')
+        label = node['Node Type'] + (f' on {relation}' if relation else '')
+        shape.append('  ' * depth + label)
+        if node['Node Type'] == 'Seq Scan':
+            seq_scans.add(relation)
+        if (
+            relation
+            and relation.startswith(f'{PARENT_TABLE}_')
+            and node['Node Type'] != 'ModifyTable'
+        ):
+            partitions.add(relation)
+
+    return {
+        'execution_ms': round(explained['Execution Time'], 3),
+        'planning_ms': round(explained['Planning Time'], 3),
+        'buffers': (
+            root.get('Shared Hit Blocks', 0) + root.get('Shared Read Blocks', 0)
+        ),
+        'rows': root.get('Actual Rows', 0),
+        'seq_scans': sorted(seq_scans),
+        'partitions': sorted(partitions),
+        'shape': shape,
+    }
+
+
+def run(queries, repeat=3):
+    """Explain every query `repeat` times, keeping the fastest run."""
+    results = {}
+    for name, (sql, params) in queries.items():
+        runs = [summarize(explain(sql, params)) for _ in range(repeat)]
+        results[name] = min(runs, key=lambda result: result['execution_ms'])
+    return results
+
+
+def check(results, expected=EXPECTED_PLANS):
+    """
+    Check the plans without a baseline: the seq scans and the partition
+    pruning. Returns (query, message, regression) tuples, like compare().
+    """
+    findings = []
+    for name, result in sorted(results.items()):
+        if name not in expected:
+            findings.append((name, 'no expected plan', False))
+            continue
+        max_partitions, seq_scans = expected[name]
+
+        unexpected = set(result['seq_scans']) - seq_scans - set(result['partitions'])
+        for relation in sorted(unexpected):
+            findings.append((name, f'seq scan on {relation}', True))
+
+        if len(result['partitions']) > max_partitions:
+            findings.append(
+                (
+                    name,
+                    f'scans {len(result["partitions"])} partitions, expected at '
+                    f'most {max_partitions} (partition pruning)',
+                    True,
+                )
+            )
+    return findings
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare the runtime and buffers of the results with the baseline.
+
+    Returns a list of (query, message, regression) tuples. Plan changes that
+    are not a regression by themselves are reported with regression False.
+    """
+    findings = []
+    factor = 1 + threshold / 100
+
+    for name, result in sorted(current.items()):
+        if name not in baseline:
+            findings.append((name, 'no baseline', False))
+            continue
+        base = baseline[name]
+
+        if (
+            result['execution_ms'] > base['execution_ms'] * factor
+            and result['execution_ms'] - base['execution_ms'] > MIN_DURATION_MS
+        ):
+            findings.append(
+                (
+                    name,
+                    f'execution time {base["execution_ms"]} -> '
+                    f'{result["execution_ms"]} ms',
+                    True,
+                )
+            )
+
+        if result['buffers'] > base['buffers'] * factor:
+            findings.append(
+                (name, f'buffers {base["buffers"]} -> {result["buffers"]}', True)
+            )
+
+        if result['shape'] != base['shape']:
+            findings.append((name, 'plan changed', False))
+
+    return findings
@@ -2,11 +2,17 @@ import logging
 from datetime import date
 
 from datapunt_api.rest import DisplayField, HALSerializer
+from django.conf import settings
 from django.db import IntegrityError
+from metrics import PASSAGE_DUPLICATES
 from rest_framework import serializers
+from rest_framework_gis.fields import GeometryField
+from tracing import span
 
 from .errors import DuplicateIdError
+from .freshness import tracker
 from .models import Passage
+from .statements import insert_passage
 
 log = logging.getLogger(__name__)
 
@@ -28,22 +34,35 @@ class PassageSerializer(HALSerializer):
         ]
 
 
+class TracedGeometryField(GeometryField):
+    def to_internal_value(self, value):
+        with span('geometry'):
+            return super().to_internal_value(value)
+
+
 class PassageDetailSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(
         validators=[]
     )  # Disable the validators for the id, which improves performance (rps) by over 200%
+    camera_locatie = TracedGeometryField()
 
     class Meta:
         model = Passage
         fields = '__all__'
 
     def create(self, validated_data):
+        instance = Passage(**validated_data)
         try:
-            return super().create(validated_data)
+            insert_passage(instance)
         except IntegrityError as e:
             log.info(f"DuplicateIdError for id {validated_data['id']}")
+            PASSAGE_DUPLICATES.inc()
             raise DuplicateIdError(str(e))
 
+        if settings.PASSAGE_FRESHNESS_ENABLED:
+            tracker.record(instance)
+        return instance
+
     def validate_datum_eerste_toelating(self, value):
         return date(year=value.year, month=1, day=1)
 
@@ -0,0 +1,102 @@
+"""
+Sharding of passage_passage across databases, by camera.
+
+Without DATABASE_SHARD_HOSTS all passages are stored in the default database.
+With shards they are spread over default and the shard aliases: a camera in
+PASSAGE_SHARD_MAP is stored on the alias it maps to, the others on the alias
+of a hash of the camera id. All passages of a camera are on one shard, so a
+retried passage still runs into its duplicate. The other tables, like the
+aggregations the exports read, are only used on default.
+
+Every shard has the schema (and daily partitions) of default, migrate them
+with `manage.py migrate --database shard_N`.
+"""
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from psycopg2.extras import execute_values
+
+
+def get_shards():
+    return [DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS]
+
+
+def is_sharded():
+    return bool(settings.DATABASE_SHARDS)
+
+
+def shard_for_camera(camera_id):
+    """Return the alias of the database that stores the passages of a camera."""
+    camera_id = str(camera_id)
+    try:
+        return settings.PASSAGE_SHARD_MAP[camera_id]
+    except KeyError:
+        shards = get_shards()
+        return shards[zlib.crc32(camera_id.encode()) % len(shards)]
+
+
+def scatter(func, shards=None):
+    """
+    Call func(alias) for every shard at once, and return the results in the
+    order of the shards. Every shard is handled by its own thread, with its
+    own connection that is closed afterwards.
+    """
+    shards = shards or get_shards()
+    if len(shards) == 1:
+        return [func(shards[0])]
+
+    def run(alias):
+        try:
+            return func(alias)
+        finally:
+            connections[alias].close()
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        return list(executor.map(run, shards))
+
+
+def fetch_all(query, params=None, shards=None):
+    """Run a query on every shard and return the rows of all shards."""
+
+    def fetch(alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    return [row for rows in scatter(fetch, shards) for row in rows]
+
+
+def merge_counts(rows):
+    """
+    Merge the rows of a GROUP BY that ran on every shard: the last column is
+    a count, summed over the rows with the same other columns.
+    """
+    counts = defaultdict(int)
+    for *key, count in rows:
+        counts[tuple(key)] += count
+    return [(*key, count) for key, count in counts.items()]
+
+
+def insert_aggregation(cursor, insert_query, select_query):
+    """
+    Run an aggregation (select_query, with the count as its last column) on
+    every shard, and insert the merged rows with insert_query, an INSERT INTO
+    table (columns) without its VALUES. Returns the number of rows inserted.
+    """
+    rows = merge_counts(fetch_all(select_query))
+    execute_values(cursor.cursor, f'{insert_query} VALUES %s', rows, page_size=1000)
+    return len(rows)
+
+
+class PassageShardRouter:
+    """Send the writes of a passage to the shard of its camera."""
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if model._meta.label == 'passage.Passage' and instance is not None:
+            if is_sharded():
+                return shard_for_camera(instance.camera_id)
+        return None
@@ -0,0 +1,149 @@
+"""
+The staging ingest of passages, with PASSAGE_INGEST_MODE staging.
+
+New passages are inserted into passage_passage_staging instead of their
+daily partition. That table is UNLOGGED and has no indexes, so an insert
+writes no WAL and maintains no B-trees, and the ingest has no unique
+constraint to run into: a passage that is posted twice is staged twice.
+
+The passage_merge_staging command moves the staged passages into
+passage_passage in batches of PASSAGE_STAGING_BATCH_SIZE: every batch is
+deleted from the staging table and inserted, sorted by passage_at, into the
+partitions in one transaction. Passages with the same (id, passage_at) in a
+batch, or that are already in passage_passage, are dropped.
+
+An UNLOGGED table is emptied when the database crashes (or is stopped
+without a checkpoint), and isn't replicated: staged passages that weren't
+merged yet are lost on a crash, and are not on the replicas. See the README.
+
+The staging table is a copy of passage_passage as of migration 0018, while
+the inserts and the merge use the columns of INSERT_FIELDS. A migration
+that changes the columns of passage_passage has to change the staging table
+the same way (TestStaging.test_columns checks it). Unlike an insert into
+passage_passage, a staged passage doesn't need the partition of its day:
+merge() creates the partitions of all staged days.
+"""
+import logging
+
+from django.db import connections, transaction
+from metrics import PASSAGE_STAGING_MERGED
+from prometheus_client.core import GaugeMetricFamily
+from psycopg2 import sql
+
+from .partitions import PARENT_TABLE, create_partition
+from .sharding import get_shards, scatter
+from .statements import INSERT_FIELDS, STAGING_TABLE
+
+log = logging.getLogger(__name__)
+
+COLUMNS = sql.SQL(', ').join(sql.Identifier(field.column) for field in INSERT_FIELDS)
+
+SQL_STAGED_DAYS = sql.SQL('SELECT DISTINCT passage_at::date FROM {staging}').format(
+    staging=sql.Identifier(STAGING_TABLE)
+)
+
+# The oldest passages aren't necessarily first, that's fine: every batch
+# leaves the staging table in one go. SKIP LOCKED keeps two merges apart.
+SQL_MERGE = sql.SQL(
+    """
+    WITH batch AS (
+        DELETE FROM {staging}
+        WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM {staging} LIMIT %s FOR UPDATE SKIP LOCKED
+        ))
+        RETURNING *
+    ), inserted AS (
+        INSERT INTO {parent} ({columns})
+        SELECT {columns} FROM (
+            SELECT DISTINCT ON (id, passage_at) * FROM batch
+            ORDER BY id, passage_at, created_at
+        ) AS passages
+        ORDER BY passage_at
+        ON CONFLICT DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM batch), (SELECT count(*) FROM inserted)
+    """
+).format(
+    staging=sql.Identifier(STAGING_TABLE),
+    parent=sql.Identifier(PARENT_TABLE),
+    columns=COLUMNS,
+)
+
+# created_at is a timestamp in UTC, without a time zone
+SQL_STATUS = sql.SQL(
+    """
+    SELECT count(*),
+           coalesce(
+               extract(epoch FROM (now() AT TIME ZONE 'UTC') - min(created_at)), 0
+           )
+    FROM {staging}
+    """
+).format(staging=sql.Identifier(STAGING_TABLE))
+
+
+def get_status(using='default'):
+    """Return the number of staged passages and the age of the oldest in seconds."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(SQL_STATUS)
+        rows, lag = cursor.fetchone()
+    return rows, float(lag)
+
+
+class StagingCollector:
+    """
+    The depth and lag of the staging table of every database, read when the
+    metrics are scraped. So the lag keeps growing when the merge job is down.
+    """
+
+    def collect(self):
+        try:
+            statuses = scatter(get_status)
+        except Exception:
+            # The metrics of the API are still served
+            log.exception('Reading the staging status failed')
+            return
+
+        rows = GaugeMetricFamily(
+            'iotsignals_passage_staging_rows',
+            'Passages in the staging table, waiting to be merged',
+            labels=['alias'],
+        )
+        lag = GaugeMetricFamily(
+            'iotsignals_passage_staging_lag_seconds',
+            'Age of the oldest passage in the staging table',
+            labels=['alias'],
+        )
+        for alias, (alias_rows, alias_lag) in zip(get_shards(), statuses):
+            rows.add_metric([alias], alias_rows)
+            lag.add_metric([alias], alias_lag)
+        yield rows
+        yield lag
+
+
+def merge(using='default', batch_size=50000):
+    """
+    Move all staged passages of a database into passage_passage, returns
+    the number of passages that were inserted and that were duplicates.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_STAGED_DAYS)
+        days = [row[0] for row in cursor.fetchall()]
+    for day in days:
+        create_partition(day, using=connection)
+
+    inserted = duplicates = 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(SQL_MERGE, [batch_size])
+            batch, batch_inserted = cursor.fetchone()
+        inserted += batch_inserted
+        duplicates += batch - batch_inserted
+        PASSAGE_STAGING_MERGED.labels(using, 'inserted').inc(batch_inserted)
+        PASSAGE_STAGING_MERGED.labels(using, 'duplicate').inc(batch - batch_inserted)
+        if batch < batch_size:
+            break
+
+    log.info(f'Merged {inserted} staged passages ({duplicates} duplicates) on {using}')
+    return inserted, duplicates
@@ -0,0 +1,80 @@
+"""The statements of the ingest path, executed as prepared statements."""
+import datetime
+
+from contrib.db.prepared import execute_prepared
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .models import Passage
+
+INSERT_FIELDS = Passage._meta.concrete_fields
+
+# The UNLOGGED table of PASSAGE_INGEST_MODE staging, see passage/staging.py
+STAGING_TABLE = 'passage_passage_staging'
+
+
+def _insert_sql(table, placeholders):
+    return 'INSERT INTO {table} ({columns}) VALUES ({values})'.format(
+        table=table,
+        columns=', '.join(f'"{field.column}"' for field in INSERT_FIELDS),
+        values=', '.join(placeholders),
+    )
+
+
+SQL_INSERT_PASSAGE = _insert_sql(
+    Passage._meta.db_table, [f'${n}' for n in range(1, len(INSERT_FIELDS) + 1)]
+)
+SQL_INSERT_STAGED = _insert_sql(
+    STAGING_TABLE, [f'${n}' for n in range(1, len(INSERT_FIELDS) + 1)]
+)
+# Without prepared statements, the ORM can't insert into the staging table
+SQL_INSERT_STAGED_UNPREPARED = _insert_sql(STAGING_TABLE, ['%s'] * len(INSERT_FIELDS))
+
+
+def is_staged():
+    return settings.PASSAGE_INGEST_MODE == 'staging'
+
+
+def get_insert_sql():
+    """The INSERT of a new passage, with $1, $2, .. placeholders."""
+    return SQL_INSERT_STAGED if is_staged() else SQL_INSERT_PASSAGE
+
+
+def get_insert_values(passage):
+    """
+    The values of INSERT_FIELDS as Python objects, for the async ingest and
+    COPY. The timestamps are naive and in UTC, as the DateTimeUTCField columns
+    are timestamps without time zone.
+    """
+    values = []
+    for field in INSERT_FIELDS:
+        value = field.pre_save(passage, True)
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        values.append(value)
+    return values
+
+
+def insert_passage(passage, using=None):
+    """Insert a new passage, like passage.save(force_insert=True)."""
+    using = using or router.db_for_write(Passage, instance=passage)
+    staged = is_staged()
+    if not settings.DATABASE_PREPARED_STATEMENTS and not staged:
+        passage.save(force_insert=True, using=using)
+        return
+
+    connection = connections[using]
+    # Like the INSERT of the ORM, pre_save() sets created_at
+    params = [
+        field.get_db_prep_save(field.pre_save(passage, True), connection)
+        for field in INSERT_FIELDS
+    ]
+    with transaction.mark_for_rollback_on_error(using), connection.cursor() as cursor:
+        if not settings.DATABASE_PREPARED_STATEMENTS:
+            cursor.execute(SQL_INSERT_STAGED_UNPREPARED, params)
+        elif staged:
+            execute_prepared(cursor, 'passage_insert_staged', SQL_INSERT_STAGED, params)
+        else:
+            execute_prepared(cursor, 'passage_insert', SQL_INSERT_PASSAGE, params)
+    passage._state.adding = False
+    passage._state.db = using
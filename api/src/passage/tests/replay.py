@@ -0,0 +1,178 @@
+"""
+Replay passages captured by middleware/capture.py against an instance.
+
+The passages are sent open-loop with the timing of the capture, --speed
+times as fast. Every id is replaced by one derived from the original id and
+--run-id, so a replay doesn't collide with the captured passages or with an
+earlier replay, while the retries in the capture are still duplicates. The
+passage_at timestamps are moved by whole days to the day of the replay, which
+keeps the hourly patterns.
+
+From api/src:
+
+    python -m passage.tests.replay /tmp/capture/capture-*.jsonl --speed 4
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import json
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from functools import partial
+
+import cbor2
+import msgpack
+from passage.tests.stress import URL, Driver, report, write_histograms
+
+# (loads, dumps) of the binary formats of contrib/rest_framework/parsers.py
+BINARY_FORMATS = {
+    'application/msgpack': (partial(msgpack.unpackb, raw=False), msgpack.packb),
+    'application/cbor': (cbor2.loads, cbor2.dumps),
+}
+
+
+def load(paths):
+    """Return the captured requests of all files, in the order they arrived."""
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    # Written when the response was sent, so not in order within a file
+    return sorted(records, key=lambda record: record['at'])
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def get_body(record):
+    if 'body_base64' in record:
+        return base64.b64decode(record['body_base64'])
+    return record['body']
+
+
+def rewrite(body, namespace, days, content_type='application/json'):
+    """Return the body with a new id, and passage_at moved by `days`."""
+    loads, dumps = BINARY_FORMATS.get(content_type, (json.loads, json.dumps))
+    try:
+        passage = loads(body)
+    except ValueError:
+        # Sent as is, the replay should see the same 400
+        return body
+    if not isinstance(passage, dict):
+        return body
+
+    if 'id' in passage:
+        passage['id'] = str(uuid.uuid5(namespace, str(passage['id'])))
+    if days and isinstance(passage.get('passage_at'), str):
+        try:
+            passage_at = parse_timestamp(passage['passage_at'])
+        except ValueError:
+            pass
+        else:
+            passage['passage_at'] = (passage_at + timedelta(days=days)).isoformat()
+    return dumps(passage)
+
+
+class Replay(Driver):
+    def __init__(self, url, records, run_id, speed=1, shift=True, connections=100):
+        super().__init__(url, {'replay': 1}, connections=connections)
+        self.records = records
+        self.namespace = uuid.UUID(run_id)
+        self.speed = speed
+        self.days = 0
+        if shift and records:
+            first = date.fromtimestamp(records[0]['at'])
+            self.days = (date.today() - first).days
+        self.open_loop = True
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        async with self.connect():
+            start = loop.time()
+            first = self.records[0]['at']
+            pending = set()
+            for record in self.records:
+                due = start + (record['at'] - first) / self.speed
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.ensure_future(self.send('replay', due, record))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.wait(pending)
+        return dict(self.results)
+
+    async def replay(self, record):
+        content_type = record['content_type']
+        body = rewrite(get_body(record), self.namespace, self.days, content_type)
+        if isinstance(body, str):
+            body = body.encode()
+        async with self.session.post(
+            self.url + record['path'],
+            data=body,
+            headers={'Content-Type': content_type},
+        ) as response:
+            await response.read()
+            return [response.status]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='+', help='Capture files')
+    parser.add_argument('--url', default=URL, help=f'Default: {URL}')
+    parser.add_argument(
+        '--speed', type=float, default=1, help='Replay N times as fast, default 1'
+    )
+    parser.add_argument(
+        '--run-id',
+        default=str(uuid.uuid4()),
+        help='Namespace of the new ids, reuse it to replay the same ids again',
+    )
+    parser.add_argument(
+        '--keep-timestamps',
+        action='store_true',
+        help='Send passage_at as captured, instead of moving it to today',
+    )
+    parser.add_argument('--limit', type=int, help='Replay the first N requests')
+    parser.add_argument(
+        '--connections', type=int, default=100, help='Size of the connection pool'
+    )
+    parser.add_argument('--histogram-dir', help='Write .hgrm files to this directory')
+    args = parser.parse_args()
+
+    records = load(args.paths)[: args.limit]
+    if not records:
+        parser.error('no captured requests')
+    span = records[-1]['at'] - records[0]['at']
+    print(
+        f'Replaying {len(records)} requests of {span:.0f}s at {args.speed}x '
+        f'to {args.url}, run id {args.run_id}'
+    )
+
+    replay = Replay(
+        args.url,
+        records,
+        args.run_id,
+        speed=args.speed,
+        shift=not args.keep_timestamps,
+        connections=args.connections,
+    )
+    start = time.monotonic()
+    results = asyncio.run(replay.run())
+    elapsed = time.monotonic() - start
+
+    report(results, elapsed, open_loop=True)
+    # To compare with the status codes of the replay
+    captured = collections.Counter(record['status'] for record in records)
+    statuses = ', '.join(f'{status}: {n}' for status, n in sorted(captured.items()))
+    print(f'{"captured":<12} {statuses}')
+    if args.histogram_dir:
+        write_histograms(results, args.histogram_dir, open_loop=True)
+
+
+if __name__ == '__main__':
+    main()
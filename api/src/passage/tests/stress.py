@@ -1,27 +1,53 @@
 #!/usr/bin/env python3
 """
-There were some problems in production under load. This file tests some simple
-stress, but can definitely be expanded.
+Load driver for the passage API.
+
+The requests are sent from an asyncio event loop over a pool of kept-alive
+connections, either open-loop at a fixed --rate (requests per second, no
+matter how fast the server answers) or closed-loop with --concurrency clients
+that each wait for their response before sending the next request.
+
+The latencies are kept in a histogram per scenario. In open-loop mode the
+response time is measured from the moment the request was scheduled, so a
+stalled server isn't hidden by the requests the driver held back in the
+meantime (coordinated omission). In closed-loop mode the histogram is
+corrected afterwards the way HdrHistogram does it, with the expected interval
+between the requests of a client.
+
+Against the docker-compose stack:
+
+    docker-compose up -d api
+    python passage/tests/stress.py --rate 500 --duration 60
 """
-import requests
 import argparse
-import sys
+import asyncio
+import collections
+import math
 import os
+import random
+import sys
+import time
 import uuid
-from datetime import datetime
-from multiprocessing import Process
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
 
+import aiohttp
 
-URL = 'https://acc.waarnemingen.amsterdam.nl/v0/milieuzone/passage/'
+URL = 'http://127.0.0.1:8001'
+PASSAGE_PATH = '/v0/milieuzone/passage/'
+EXPORT_PATH = '/v0/milieuzone/passage/export/'
+EXPORT_TAXI_PATH = '/v0/milieuzone/passage/export-taxi/'
 
-POST_HEADERS = {
-        'Accept': 'application/json',
-        'Content-type': 'application/json'
-    }
+DEFAULT_MIX = 'post=90,batch=4,duplicate=4,export_taxi=2'
+
+PERCENTILES = (50, 90, 99, 99.9)
 
+# Every bucket of the histogram is 1% wider than the previous one
+BUCKET_BASE = math.log(1.01)
 
-def generate_request(id):
-    tmp = {
+
+def generate_request():
+    return {
         "version": "passage-v1",
         "id": str(uuid.uuid4()),
         "passage_at": str(datetime.now()),
@@ -31,41 +57,17 @@ def generate_request(id):
         "camera_id": "ddddffff-4444-aaaa-7777-aaaaeeee1111",
         "camera_naam": "Spaarndammerdijk [Z]",
         "camera_kijkrichting": 0,
-        "camera_locatie": {
-            "type": "Point",
-            "coordinates": [
-                4.845423,
-                52.386831
-            ]
-        },
+        "camera_locatie": {"type": "Point", "coordinates": [4.845423, 52.386831]},
         "kenteken_land": "NL",
         "kenteken_nummer_betrouwbaarheid": 640,
         "kenteken_land_betrouwbaarheid": 690,
         "kenteken_karakters_betrouwbaarheid": [
-            {
-                "betrouwbaarheid": 650,
-                "positie": 1
-            },
-            {
-                "betrouwbaarheid": 630,
-                "positie": 2
-            },
-            {
-                "betrouwbaarheid": 640,
-                "positie": 3
-            },
-            {
-                "betrouwbaarheid": 660,
-                "positie": 4
-            },
-            {
-                "betrouwbaarheid": 620,
-                "positie": 5
-            },
-            {
-                "betrouwbaarheid": 640,
-                "positie": 6
-            }
+            {"betrouwbaarheid": 650, "positie": 1},
+            {"betrouwbaarheid": 630, "positie": 2},
+            {"betrouwbaarheid": 640, "positie": 3},
+            {"betrouwbaarheid": 660, "positie": 4},
+            {"betrouwbaarheid": 620, "positie": 5},
+            {"betrouwbaarheid": 640, "positie": 6},
         ],
         "indicatie_snelheid": 23,
         "automatisch_verwerkbaar": True,
@@ -79,56 +81,382 @@ def generate_request(id):
         "europese_voertuigcategorie_toevoeging": "e",
         "taxi_indicator": True,
         "maximale_constructie_snelheid_bromsnorfiets": 25,
-        "brandstoffen": [
-            {
-                "brandstof": "Benzine",
-                "volgnr": 1
-            }
-        ],
-        "versit_klasse": "test klasse"
+        "brandstoffen": [{"brandstof": "Benzine", "volgnr": 1}],
+        "versit_klasse": "test klasse",
     }
-    return tmp
 
 
-def simulate_request(start, blocksize):
-    pid = os.getpid()
-    print(f'{pid} start: {start} block: {blocksize}')
-    # session = requests.Session()
-    for i in range(blocksize):
-        id = start + i
+class Histogram:
+    """Latencies in microseconds, with a relative error of at most 1%."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        return int(math.log(max(value, 1)) / BUCKET_BASE)
+
+    @staticmethod
+    def bucket_value(bucket):
+        # The upper bound, so a percentile is never reported too low
+        return math.exp((bucket + 1) * BUCKET_BASE)
+
+    def record(self, value, count=1):
+        self.counts[self.bucket(value)] += count
+        self.total += count
+        self.sum += value * count
+        self.max = max(self.max, value)
+
+    def record_corrected(self, value, expected_interval, count=1):
+        """
+        Record value, and the values that would have been measured for the
+        requests that weren't sent while waiting for it (like HdrHistogram's
+        recordValueWithExpectedInterval).
+        """
+        self.record(value, count)
+        if expected_interval <= 0:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing, count)
+            missing -= expected_interval
+
+    def corrected(self, expected_interval):
+        histogram = Histogram()
+        for bucket, count in self.counts.items():
+            value = min(self.bucket_value(bucket), self.max)
+            histogram.record_corrected(value, expected_interval, count)
+        return histogram
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def percentile(self, percentile):
+        if not self.total:
+            return 0
+        rank = math.ceil(self.total * percentile / 100)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.bucket_value(bucket), self.max)
+        return self.max
+
+    def write_hgrm(self, f, unit=1000):
+        """Write the percentile distribution in the HdrHistogram (.hgrm) format."""
+        f.write(f'{"Value":>12} {"Percentile":>14} {"TotalCount":>10} ')
+        f.write(f'{"1/(1-Percentile)":>14}\n\n')
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            value = min(self.bucket_value(bucket), self.max) / unit
+            fraction = seen / self.total
+            line = f'{value:12.3f} {fraction:14.12f} {seen:10d}'
+            if seen < self.total:
+                line += f' {1 / (1 - fraction):14.2f}'
+            f.write(line + '\n')
+        f.write(f'#[Mean    = {self.mean / unit:12.3f}]\n')
+        f.write(f'#[Max     = {self.max / unit:12.3f}, ')
+        f.write(f'Total count    = {self.total:12d}]\n')
+
+
+class Result:
+    """The statuses and latencies of one scenario."""
+
+    def __init__(self):
+        self.statuses = collections.Counter()
+        # From sending the request to the last byte of the response
+        self.service = Histogram()
+        # From the moment the request was due (open-loop only)
+        self.response = Histogram()
+
+    def merge(self, other):
+        self.statuses.update(other.statuses)
+        self.service.merge(other.service)
+        self.response.merge(other.response)
+
+
+class Driver:
+    def __init__(self, url, mix, batch_size=50, token=None, connections=100):
+        self.url = url.rstrip('/')
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+        self.batch_size = batch_size
+        self.token = token
+        self.connections = connections
+        self.results = collections.defaultdict(Result)
+        # Recently created passages, to send again as duplicates
+        self.created = collections.deque(maxlen=1000)
+        self.open_loop = False
+
+    def connect(self):
+        timeout = aiohttp.ClientTimeout(total=60)
+        connector = aiohttp.TCPConnector(limit=self.connections)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    async def run(self, duration, rate=None, concurrency=None):
+        async with self.connect():
+            if rate:
+                self.open_loop = True
+                await self.run_open_loop(duration, rate)
+            else:
+                await self.run_closed_loop(duration, concurrency)
+        return dict(self.results)
+
+    async def run_open_loop(self, duration, rate):
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        pending = set()
+        for n in range(int(duration * rate)):
+            due = start + n / rate
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # Not awaited, a slow response doesn't hold back the next request
+            task = asyncio.ensure_future(self.send(self.choose(), due))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def run_closed_loop(self, duration, concurrency):
+        loop = asyncio.get_event_loop()
+        end = loop.time() + duration
+
+        async def client():
+            while loop.time() < end:
+                await self.send(self.choose(), loop.time())
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    def choose(self):
+        return random.choices(self.scenarios, self.weights)[0]
+
+    async def send(self, scenario, due, *args):
+        loop = asyncio.get_event_loop()
+        sent = loop.time()
+        try:
+            statuses = await getattr(self, scenario)(*args)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            statuses = [type(e).__name__]
+        done = loop.time()
+
+        result = self.results[scenario]
+        result.statuses.update(statuses)
+        result.service.record((done - sent) * 1e6)
+        if self.open_loop:
+            result.response.record((done - due) * 1e6)
+
+    async def post_passage(self, passage):
+        async with self.session.post(self.url + PASSAGE_PATH, json=passage) as response:
+            await response.read()
+            if response.status == 201:
+                self.created.append(passage)
+            return response.status
+
+    async def post(self):
+        return [await self.post_passage(generate_request())]
+
+    async def batch(self):
+        # There is no bulk endpoint, a batch is a burst of single posts and
+        # its latency is the time until the last one is stored.
+        passages = [generate_request() for _ in range(self.batch_size)]
+        return await asyncio.gather(*map(self.post_passage, passages))
+
+    async def duplicate(self):
+        if not self.created:
+            return await self.post()
+        return [await self.post_passage(random.choice(self.created))]
+
+    async def get(self, path, **kwargs):
+        async with self.session.get(self.url + path, **kwargs) as response:
+            async for _ in response.content.iter_chunked(2 ** 16):
+                pass
+            return [response.status]
+
+    async def export(self):
+        year, week, _ = date.today().isocalendar()
+        return await self.get(
+            EXPORT_PATH,
+            params={'year': year, 'week': week},
+            headers={'Authorization': f'Token {self.token}'},
+        )
+
+    async def export_taxi(self):
+        return await self.get(EXPORT_TAXI_PATH)
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        scenario, _, weight = part.partition('=')
+        scenario = scenario.strip()
+        if scenario not in ('post', 'batch', 'duplicate', 'export', 'export_taxi'):
+            raise argparse.ArgumentTypeError(f'unknown scenario {scenario!r}')
         try:
-            # resp = session.post(
-            resp = requests.post(
-                URL,
-                json=generate_request(id),
-                headers=POST_HEADERS
-            )
-            # print(f'{pid} HTTP response code: {resp.status_code}')
-            # if record could not be created, dump response
-            if resp.status_code != 201:
-                print(resp.content)
-        except Exception as e:
-            print(e)
+            mix[scenario] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'invalid weight {weight!r}')
+    return {scenario: weight for scenario, weight in mix.items() if weight > 0}
+
+
+def drive(args, process):
+    # Every process has its own event loop and share of the load
+    random.seed(f'{args.seed}-{process}')
+    driver = Driver(
+        args.url,
+        args.mix,
+        batch_size=args.batch_size,
+        token=args.token,
+        connections=max(1, args.connections // args.processes),
+    )
+    return asyncio.run(
+        driver.run(
+            args.duration,
+            rate=args.rate and args.rate / args.processes,
+            concurrency=args.concurrency and max(1, args.concurrency // args.processes),
+        )
+    )
+
+
+def report(results, elapsed, open_loop, expected_interval=0, out=sys.stdout):
+    def row(name, requests, rate, histogram):
+        values = [histogram.percentile(p) for p in PERCENTILES] + [histogram.max]
+        out.write(f'{name:<12} {requests:>9} {rate:>9.1f}')
+        out.write(''.join(f' {value / 1000:>9.1f}' for value in values) + '\n')
+
+    header = f'{"scenario":<12} {"requests":>9} {"per sec":>9}'
+    header += ''.join(f' {"p" + format(p, "g"):>9}' for p in PERCENTILES)
+    header += f' {"max":>9}\n'
+
+    for title, kind in (
+        ('Service time (ms), from sending the request', 'service'),
+        ('Response time (ms), corrected for coordinated omission', 'corrected'),
+    ):
+        out.write(f'\n{title}\n{header}')
+        total = Histogram()
+        for scenario, result in sorted(results.items()):
+            histogram = get_histogram(result, kind, open_loop, expected_interval)
+            total.merge(histogram)
+            requests = result.service.total
+            row(scenario, requests, requests / elapsed, histogram)
+        requests = sum(result.service.total for result in results.values())
+        row('total', requests, requests / elapsed, total)
+
+    out.write('\nStatus codes\n')
+    for scenario, result in sorted(results.items()):
+        statuses = ', '.join(
+            f'{status}: {count}' for status, count in sorted(result.statuses.items())
+        )
+        out.write(f'{scenario:<12} {statuses}\n')
+
+
+def get_histogram(result, kind, open_loop, expected_interval=0):
+    if kind == 'service':
+        return result.service
+    if open_loop:
+        return result.response
+    # Closed-loop: without a target rate the expected interval (ms) defaults
+    # to the typical service time of the scenario.
+    expected = expected_interval * 1000 or result.service.percentile(50)
+    return result.service.corrected(expected)
+
+
+def write_histograms(results, directory, open_loop, expected_interval=0):
+    os.makedirs(directory, exist_ok=True)
+    for scenario, result in results.items():
+        for kind in ('service', 'corrected'):
+            path = os.path.join(directory, f'{scenario}-{kind}.hgrm')
+            histogram = get_histogram(result, kind, open_loop, expected_interval)
+            with open(path, 'w') as f:
+                histogram.write_hgrm(f)
 
 
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("workers", help="# workers", type=int)
-    parser.add_argument("requests", help="# request", type=int)
-    if len(sys.argv) == 1:
-        parser.print_help()
-        return
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=URL, help=f'Default: {URL}')
+    load = parser.add_mutually_exclusive_group(required=True)
+    load.add_argument(
+        '--rate', type=float, help='Open-loop: requests (scenarios) per second'
+    )
+    load.add_argument(
+        '--concurrency', type=int, help='Closed-loop: number of concurrent clients'
+    )
+    parser.add_argument('--duration', type=float, default=30, help='In seconds')
+    parser.add_argument(
+        '--mix',
+        type=parse_mix,
+        default=parse_mix(DEFAULT_MIX),
+        help=(
+            'Weights of the scenarios post, batch, duplicate, export and '
+            f'export_taxi. Default: {DEFAULT_MIX}'
+        ),
+    )
+    parser.add_argument('--batch-size', type=int, default=50, help='Passages per batch')
+    parser.add_argument(
+        '--token',
+        default=os.getenv('AUTHORIZATION_TOKEN'),
+        help='Token for the export scenario, defaults to $AUTHORIZATION_TOKEN',
+    )
+    parser.add_argument(
+        '--connections', type=int, default=100, help='Size of the connection pool'
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=1,
+        help='Event loops the load is divided over, for rates one loop cannot keep up',
+    )
+    parser.add_argument(
+        '--expected-interval',
+        type=float,
+        default=0,
+        help=(
+            'Closed-loop: expected ms between the requests of a client, for the '
+            'coordinated omission correction. Defaults to the median service time'
+        ),
+    )
+    parser.add_argument('--histogram-dir', help='Write .hgrm files to this directory')
+    parser.add_argument('--seed', default='stress')
     args = parser.parse_args()
-    procs = []
-    blocksize = int(args.requests / args.workers)
-    for i in [x * blocksize for x in range(args.workers)]:
-        p = Process(target=simulate_request, args=(i, blocksize,))
-        p.start()
-        procs.append(p)
-
-    print('Waiting for workers to complete')
-    for p in procs:
-        p.join()
+
+    if not args.mix:
+        parser.error('--mix has no scenarios')
+    if 'export' in args.mix and not args.token:
+        parser.error('the export scenario needs --token')
+
+    mode = f'{args.rate}/s' if args.rate else f'{args.concurrency} clients'
+    print(f'Sending {mode} for {args.duration}s to {args.url}')
+    start = time.monotonic()
+    if args.processes == 1:
+        results = drive(args, 0)
+    else:
+        with ProcessPoolExecutor(args.processes) as executor:
+            futures = [
+                executor.submit(drive, args, process)
+                for process in range(args.processes)
+            ]
+            results = collections.defaultdict(Result)
+            for future in futures:
+                for scenario, result in future.result().items():
+                    results[scenario].merge(result)
+    elapsed = time.monotonic() - start
+
+    open_loop = bool(args.rate)
+    report(results, elapsed, open_loop, args.expected_interval)
+    if args.histogram_dir:
+        write_histograms(results, args.histogram_dir, open_loop, args.expected_interval)
 
 
 if __name__ == '__main__':
@@ -6,6 +6,8 @@ from datetime import date, datetime, timedelta
 from decimal import Decimal
 from itertools import cycle
 
+import cbor2
+import msgpack
 import pytest
 from django.contrib.gis.geos import Point
 from django.db import connection
@@ -15,6 +17,7 @@ from model_bakery import baker
 from passage.case_converters import to_camelcase
 from passage.models import Passage
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
 
 from .factories import PassageFactory
 
@@ -115,6 +118,46 @@ class TestPassageAPI:
         assert Passage.objects.get(id=passage_payload['id'])
         assert_response(res, passage_payload)
 
+    @pytest.mark.parametrize(
+        'content_type, dumps, loads',
+        [
+            ('application/msgpack', msgpack.packb, msgpack.unpackb),
+            ('application/cbor', cbor2.dumps, cbor2.loads),
+        ],
+    )
+    def test_post_new_passage_binary(self, passage_payload, content_type, dumps, loads):
+        """Test posting a new camelcase passage as MessagePack or CBOR"""
+        camel_case = {to_camelcase(k): v for k, v in passage_payload.items()}
+        # The values as a JSON client would send them
+        camel_case = json.loads(json.dumps(camel_case, cls=JSONEncoder))
+        res = self.client.post(
+            self.URL,
+            dumps(camel_case),
+            content_type=content_type,
+            HTTP_ACCEPT=content_type,
+        )
+        assert res.status_code == 201, res.content
+        assert res['Content-Type'] == content_type
+        assert Passage.objects.get(id=passage_payload['id'])
+        assert_response(res, passage_payload)
+        assert loads(res.content) == json.loads(json.dumps(res.data, cls=JSONEncoder))
+
+    @pytest.mark.parametrize(
+        'content_type, body',
+        [
+            (
+                'application/msgpack',
+                msgpack.packb({b'passageAt': 1}, use_bin_type=True),
+            ),
+            ('application/cbor', cbor2.dumps({1: 2})),
+        ],
+    )
+    def test_post_binary_key_error(self, content_type, body):
+        """Test that only string keys are accepted, like in JSON"""
+        res = self.client.post(self.URL, body, content_type=content_type)
+        assert res.status_code == 400, res.content
+        assert Passage.objects.count() == 0
+
     def test_post_new_passage_missing_attr(self, passage_payload):
         """Test posting a new passage with missing fields"""
         assert Passage.objects.count() == 0
@@ -0,0 +1,76 @@
+import json
+from datetime import date
+from unittest import mock
+
+import pytest
+from django.db import connection
+from passage.extraction import ExtractionError, PassageExtraction
+from passage.partitions import Partition
+
+PARTITIONS = [
+    Partition('passage_passage_20210501', date(2021, 5, 1)),
+    Partition('passage_passage_20210502', date(2021, 5, 2)),
+    Partition('passage_passage_20210503', date(2021, 5, 3)),
+]
+
+
+def fake_extract(partition):
+    return {'status': 'done', 'file': f'{partition.name}.csv.gz', 'rows': 1}
+
+
+class TestPassageExtraction:
+    @pytest.fixture
+    def extraction(self, tmp_path):
+        return PassageExtraction(
+            output_dir=str(tmp_path),
+            from_date=date(2021, 5, 1),
+            to_date=date(2021, 5, 3),
+            camera_ids=['5274d916-0cf3-4cfe-abe7-63005aeec49d'],
+            workers=2,
+        )
+
+    @pytest.mark.django_db
+    def test_query(self, extraction):
+        with connection.cursor() as cursor:
+            query = extraction.get_query(PARTITIONS[0]).as_string(cursor.connection)
+
+        assert query.startswith('COPY (SELECT "id", "passage_at", "created_at"')
+        assert 'FROM "passage_passage_20210501"' in query
+        assert (
+            "WHERE camera_id = ANY(ARRAY['5274d916-0cf3-4cfe-abe7-63005aeec49d'])"
+            in query
+        )
+        assert query.endswith("TO STDOUT WITH (FORMAT csv, HEADER, DELIMITER ';')")
+
+    def test_resume(self, extraction, tmp_path):
+        extracted = []
+
+        def extract(partition):
+            extracted.append(partition.name)
+            if partition == PARTITIONS[1] and len(extracted) <= 3:
+                raise Exception('connection lost')
+            (tmp_path / f'{partition.name}.csv.gz').write_bytes(b'')
+            return fake_extract(partition)
+
+        with mock.patch('passage.extraction.list_partitions', return_value=PARTITIONS):
+            with mock.patch.object(extraction, '_extract_partition', extract):
+                with pytest.raises(ExtractionError):
+                    extraction.run()
+
+                manifest = json.loads((tmp_path / 'manifest.json').read_text())
+                assert manifest['shards'][PARTITIONS[1].name]['status'] == 'failed'
+                assert manifest['shards'][PARTITIONS[2].name]['status'] == 'done'
+
+                # Only the failed partition is extracted again
+                manifest = extraction.run()
+
+        assert sorted(extracted[3:]) == [PARTITIONS[1].name]
+        assert all(s['status'] == 'done' for s in manifest['shards'].values())
+
+    def test_other_parameters(self, extraction, tmp_path):
+        with mock.patch('passage.extraction.list_partitions', return_value=[]):
+            extraction.run()
+
+        extraction.camera_ids = ['07b48bc1-f42b-42e1-92de-b21ec9f1d249']
+        with pytest.raises(ExtractionError):
+            extraction.run()
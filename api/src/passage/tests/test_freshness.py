@@ -0,0 +1,101 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from passage.freshness import FreshnessTracker, percentile
+from passage.models import CameraFreshness, IngestDelay
+
+from .factories import PassageFactory
+
+
+@pytest.fixture
+def tracker():
+    tracker = FreshnessTracker(flush_seconds=3600)
+    with mock.patch('passage.serializers.tracker', tracker):
+        yield tracker
+
+
+def test_percentile():
+    buckets = [(1, 50), (5, 45), (15, 4), (float('inf'), 1)]
+    assert percentile(buckets, 0.5) == 1
+    assert percentile(buckets, 0.95) == 5
+    assert percentile(buckets, 0.99) == 15
+    assert percentile([(1, 0)], 0.5) is None
+
+
+def test_flush_failed(tracker):
+    now = timezone.now()
+    passage = PassageFactory.build(camera_id='cam-1', passage_at=now)
+    passage.created_at = now
+    tracker.record(passage)
+
+    with mock.patch('passage.freshness.connection') as connection:
+        connection.cursor.side_effect = Exception('no database')
+        with mock.patch('passage.freshness.transaction'):
+            tracker.flush()
+
+    # Recorded after the failed flush, merged with the restored buffers
+    newer = PassageFactory.build(camera_id='cam-1', passage_at=now)
+    newer.created_at = now + timedelta(seconds=1)
+    tracker.record(newer)
+
+    assert tracker._cameras['cam-1'][2] == newer.created_at
+    assert sum(tracker._delays.values()) == 2
+
+
+@pytest.mark.django_db
+class TestFreshnessTracker:
+    def test_flush(self, tracker):
+        now = timezone.now()
+        old = PassageFactory.build(
+            camera_id='cam-1', passage_at=now - timedelta(hours=1)
+        )
+        old.created_at = now - timedelta(minutes=59, seconds=58)
+        new = PassageFactory.build(
+            camera_id='cam-1', passage_at=now - timedelta(seconds=30)
+        )
+        new.created_at = now
+        tracker.record(new)
+        tracker.record(old)
+        tracker.flush()
+
+        freshness = CameraFreshness.objects.get(camera_id='cam-1')
+        assert freshness.last_passage_at == new.passage_at
+        assert freshness.last_created_at == new.created_at
+        assert dict(IngestDelay.objects.values_list('le', 'count')) == {5: 1, 60: 1}
+
+        # Flushing older data from another worker doesn't move the camera back
+        tracker.record(old)
+        tracker.flush()
+        freshness.refresh_from_db()
+        assert freshness.last_created_at == new.created_at
+        assert dict(IngestDelay.objects.values_list('le', 'count')) == {5: 2, 60: 1}
+
+    @override_settings(AUTHORIZATION_TOKEN='foo')
+    def test_camera_lag(self, api_client, tracker):
+        now = timezone.now()
+        for camera_id, minutes in [('cam-1', 1), ('cam-2', 30)]:
+            passage = PassageFactory.build(
+                camera_id=camera_id, passage_at=now - timedelta(minutes=minutes)
+            )
+            passage.created_at = now - timedelta(minutes=minutes)
+            tracker.record(passage)
+        tracker.flush()
+
+        url = reverse('v0:passage-camera-lag')
+        response = api_client.get(url, HTTP_AUTHORIZATION='Token foo')
+        assert response.status_code == 200
+
+        cameras = response.data['cameras']
+        assert [c['camera_id'] for c in cameras] == ['cam-2', 'cam-1']
+        assert cameras[0]['lag_seconds'] >= 30 * 60
+        assert response.data['ingest_delay']['p50'] == 1
+
+    @override_settings(AUTHORIZATION_TOKEN='foo')
+    def test_camera_lag_no_auth(self, api_client):
+        url = reverse('v0:passage-camera-lag')
+        response = api_client.get(url)
+        assert response.status_code == 401
@@ -0,0 +1,94 @@
+import struct
+from datetime import date, datetime
+
+import pytest
+from django.utils import timezone
+from passage.generator import (
+    COPY_HEADER,
+    COPY_TRAILER,
+    FIELDS,
+    ChunkReader,
+    PassageGenerator,
+    encode_row,
+    encode_timestamptz,
+    load_cameras,
+    split_rows,
+)
+from passage.models import Passage
+
+DAY = date(2018, 10, 16)
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return PassageGenerator(load_cameras(), seed=42, chunk_rows=10)
+
+
+def test_load_cameras():
+    cameras = load_cameras()
+    assert len(cameras) == 544
+    assert len({camera.camera_id for camera in cameras}) == len(
+        {camera.camera_naam for camera in cameras}
+    )
+    assert cameras[0].rijstrook == 1
+    assert cameras[0].rijrichting == -1
+
+
+def test_reproducible(generator):
+    rows = list(generator.rows(DAY, 100))
+    assert rows == list(PassageGenerator(generator.cameras, seed=42).rows(DAY, 100))
+    assert rows != list(PassageGenerator(generator.cameras, seed=43).rows(DAY, 100))
+
+    passage_at = [row[1] for row in rows]
+    assert passage_at == sorted(passage_at)
+    assert all(value.date() == DAY for value in passage_at)
+
+
+def test_privacy_rules(generator):
+    for row in generator.rows(DAY, 500):
+        passage = dict(zip(FIELDS, row))
+        if passage['toegestane_maximum_massa_voertuig'] == 1500:
+            assert passage['merk'] is None
+        if passage['voertuig_soort'] == 'Personenauto':
+            assert passage['inrichting'] == 'Personenauto'
+
+
+def test_split_rows():
+    # 2021-07-02 is a friday
+    counts = split_rows(1000, date(2021, 7, 2), date(2021, 7, 4))
+    assert sum(counts.values()) == 1000
+    assert counts[date(2021, 7, 2)] > counts[date(2021, 7, 3)]
+
+
+def test_encode():
+    assert encode_timestamptz(datetime(2000, 1, 1, 0, 0, 1, tzinfo=timezone.utc)) == (
+        struct.pack('!iq', 8, 1000000)
+    )
+    row = encode_row([None] * len(FIELDS))
+    assert row == struct.pack('!h', len(FIELDS)) + struct.pack('!i', -1) * len(FIELDS)
+
+
+def test_chunks(generator):
+    data = ChunkReader(generator.chunks(DAY, 25)).read()
+    assert data.startswith(COPY_HEADER)
+    assert data.endswith(COPY_TRAILER)
+
+    reader = ChunkReader([b'abc', b'de', b'f'])
+    assert reader.read(4) == b'abcd'
+    assert reader.read() == b'ef'
+    assert reader.read(1) == b''
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run(generator):
+    results = list(generator.run(DAY, DAY, 50, workers=1))
+    assert [(partition.name, rows, exc) for partition, rows, exc in results] == [
+        ('passage_passage_20181016', 50, None)
+    ]
+
+    row = next(generator.rows(DAY, 50))
+    passage = Passage.objects.get(id=row[0])
+    assert passage.passage_at == row[1]
+    assert passage.camera_naam == row[8]
+    assert passage.camera_locatie.coords == row[10]
+    assert passage.kenteken_karakters_betrouwbaarheid == row[14]
@@ -0,0 +1,75 @@
+from datetime import date, timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from passage import indexes
+from passage.partitions import PARENT_TABLE, create_partition, list_partitions
+
+TODAY = date(2021, 6, 10)
+
+SQL_INDEXES = 'SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s'
+
+
+def get_indexes(table):
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_INDEXES, [table])
+        return dict(cursor.fetchall())
+
+
+def test_index_names():
+    assert indexes.brin_index_name('passage_passage_20210610', 'passage_at') == (
+        'passage_passage_20210610_passage_at_brin'
+    )
+    assert indexes.btree_index_name('passage_passage_20210610') == (
+        'passage_passage_20210610_passage_at_btree'
+    )
+
+
+# CREATE INDEX CONCURRENTLY can't run in a transaction
+@pytest.mark.django_db(transaction=True)
+class TestSwitchIndexes:
+    @pytest.fixture(autouse=True)
+    def partitions(self):
+        for n in range(-3, 2):
+            create_partition(TODAY + timedelta(days=n))
+
+    def test_switch(self):
+        indexes.switch_indexes(btree_days=2, today=TODAY)
+
+        for column in indexes.BRIN_COLUMNS:
+            assert indexes.is_valid(indexes.brin_index_name(PARENT_TABLE, column))
+        assert indexes.drop_parent_btrees() == []
+
+        for partition in list_partitions():
+            definitions = get_indexes(partition.name).values()
+            brins = [d for d in definitions if 'USING brin' in d]
+            btrees = [d for d in definitions if 'btree (passage_at)' in d]
+            assert len(brins) == 2
+            # The B-tree of the primary key is on (id, passage_at)
+            assert len(btrees) == (1 if partition.day >= TODAY - timedelta(1) else 0)
+
+    def test_repeat(self):
+        indexes.switch_indexes(btree_days=2, today=TODAY)
+
+        changes = indexes.switch_indexes(btree_days=2, today=TODAY)
+        assert changes == {
+            'brin': [],
+            'btree_created': [],
+            'btree_dropped': [],
+            'parent': [],
+        }
+
+    def test_move_btrees(self):
+        indexes.switch_indexes(btree_days=2, today=TODAY)
+
+        changes = indexes.switch_indexes(btree_days=2, today=TODAY + timedelta(1))
+        assert changes['btree_dropped'] == [
+            indexes.btree_index_name('passage_passage_20210609')
+        ]
+
+    def test_command(self):
+        call_command('passage_indexes', btree_days=1)
+
+        for column in indexes.BRIN_COLUMNS:
+            assert indexes.is_valid(indexes.brin_index_name(PARENT_TABLE, column))
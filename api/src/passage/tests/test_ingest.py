@@ -0,0 +1,159 @@
+import asyncio
+import json
+import uuid
+from contextlib import asynccontextmanager
+from unittest import mock
+
+import asyncpg
+import pytest
+from django.db import connections
+from passage.case_converters import to_camelcase
+from passage.ingest import AsyncIngest
+from passage.statements import SQL_INSERT_PASSAGE
+
+URL = '/v0/milieuzone/passage/'
+
+MESSAGE = {
+    'id': '5ad2a8d9-7a2a-4cc4-a6a4-3a84d4c2a7b1',
+    'passage_at': '2021-06-01T12:00:00+02:00',
+    'version': '1',
+    'straat': None,
+    'rijrichting': 1,
+    'rijstrook': 2,
+    'camera_id': '00856ef3-c6f5-4194-9531-a3267839674a',
+    'camera_naam': 'Muntbergweg (s111) nabij afrit (A9) uit oost - Rijstrook 2',
+    'camera_kijkrichting': 337.5,
+    'camera_locatie': {'type': 'Point', 'coordinates': [4.945936, 52.301221]},
+    'kenteken_land': 'NL',
+    'kenteken_nummer_betrouwbaarheid': 990,
+    'kenteken_land_betrouwbaarheid': 0,
+    'voertuig_soort': 'Personenauto',
+    'merk': 'SPYKER',
+    'datum_eerste_toelating': '2001-02-01',
+    'toegestane_maximum_massa_voertuig': 4000,
+    'brandstoffen': [{'volgnr': 1, 'brandstof': 'Benzine', 'euroklasse': 'Euro 3'}],
+}
+
+
+class Connection:
+    def __init__(self, error=None):
+        self.error = error
+        self.executed = []
+
+    async def execute(self, query, *params):
+        if self.error is not None:
+            raise self.error
+        self.executed.append((query, params))
+
+
+class DatabasePool:
+    """The pool of the postgis_pool backend."""
+
+    def __init__(self):
+        self.returned = []
+
+    def putconn(self, connection):
+        self.returned.append(connection)
+
+
+class Pool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        yield self.connection
+
+
+async def other(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def request(application, body, path=URL, content_type=b'application/json'):
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': path,
+        'headers': [(b'content-type', content_type)],
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    start, body = sent
+    return start['status'], body['body']
+
+
+class TestAsyncIngest:
+    @pytest.fixture(autouse=True)
+    def no_freshness(self, settings):
+        settings.PASSAGE_FRESHNESS_ENABLED = False
+
+    @pytest.fixture
+    def connection(self):
+        return Connection()
+
+    @pytest.fixture
+    def application(self, connection):
+        application = AsyncIngest(other)
+        application.pools['default'] = Pool(connection)
+        return application
+
+    def test_create(self, application, connection):
+        body = json.dumps({to_camelcase(k): v for k, v in MESSAGE.items()})
+        status, content = request(application, body.encode())
+
+        assert status == 201, content
+        data = json.loads(content)
+        assert data['id'] == MESSAGE['id']
+        assert data['inrichting'] == 'Personenauto'
+        assert data['created_at']
+
+        ((query, params),) = connection.executed
+        assert query == SQL_INSERT_PASSAGE
+        assert params[0] == uuid.UUID(MESSAGE['id'])
+
+    def test_invalid(self, application, connection):
+        status, content = request(application, json.dumps({'id': 'x'}).encode())
+        assert status == 400
+        assert 'id' in json.loads(content)
+        assert connection.executed == []
+
+    def test_parse_error(self, application):
+        assert request(application, b'{"id":')[0] == 400
+        assert request(application, b'[]')[0] == 400
+
+    def test_duplicate(self, application):
+        application.pools['default'] = Pool(
+            Connection(asyncpg.UniqueViolationError('duplicate key'))
+        )
+        status, content = request(application, json.dumps(MESSAGE).encode())
+        assert status == 409
+
+    def test_freshness_connection(self, application, settings):
+        settings.PASSAGE_FRESHNESS_ENABLED = True
+        pool = DatabasePool()
+
+        def record(passage):
+            # A flush, on a thread of the executor
+            database = connections['default']
+            database.pool, database.connection = pool, 'connection'
+
+        with mock.patch('passage.ingest.tracker.record', side_effect=record):
+            status, content = request(application, json.dumps(MESSAGE).encode())
+        assert status == 201, content
+        assert pool.returned == ['connection']
+
+    def test_other_requests(self, application, connection):
+        # Other paths and formats are handled by the WSGI application
+        assert request(application, b'{}', path='/status/health')[0] == 204
+        body = b'\x80'
+        assert request(application, body, content_type=b'application/msgpack')[0] == 204
+        assert connection.executed == []
@@ -0,0 +1,228 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import uuid
+from unittest import mock
+
+import pytest
+from django.contrib.gis.geos import Point
+from passage.case_converters import to_camelcase
+from passage.loading import (
+    LoadError,
+    PassageLoader,
+    copy_rows,
+    copy_value,
+    parse_csv_row,
+    read_ndjson,
+    to_internal,
+)
+from passage.models import Passage
+from passage.statements import INSERT_FIELDS
+
+MESSAGE = {
+    'passage_at': '2021-06-01T12:00:00+02:00',
+    'version': '1',
+    'rijrichting': 1,
+    'rijstrook': 2,
+    'camera_id': '00856ef3-c6f5-4194-9531-a3267839674a',
+    'camera_naam': 'Muntbergweg (s111) nabij afrit (A9) uit oost - Rijstrook 2',
+    'camera_kijkrichting': 337.5,
+    'camera_locatie': {'type': 'Point', 'coordinates': [4.945936, 52.301221]},
+    'kenteken_land': 'NL',
+    'kenteken_nummer_betrouwbaarheid': 990,
+    'kenteken_land_betrouwbaarheid': 0,
+    'voertuig_soort': 'Personenauto',
+    'merk': 'SPYKER',
+    'toegestane_maximum_massa_voertuig': 3000,
+    'brandstoffen': [{'volgnr': 1, 'brandstof': 'Benzine', 'euroklasse': 'Euro 3'}],
+}
+
+
+def message(**kwargs):
+    return dict(MESSAGE, id=str(uuid.uuid4()), **kwargs)
+
+
+def write_ndjson(path, rows):
+    with gzip.open(path, 'wt') as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + '\n')
+    return str(path)
+
+
+def read_rejects(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_read_ndjson():
+    f = io.StringIO('{"id": "1"}\n\n{"id":\n')
+    (first, row, error), (second, text, parse_error) = read_ndjson(f)
+    assert (first, row, error) == (1, {'id': '1'}, None)
+    assert second == 3
+    assert parse_error.startswith('JSON parse error')
+
+
+def test_parse_csv_row():
+    row = {
+        'id': '1',
+        'straat': '',
+        'brandstoffen': '[{"volgnr": 1}]',
+        'extraData': '{}',
+    }
+    assert parse_csv_row(row) == {
+        'id': '1',
+        'straat': None,
+        'brandstoffen': [{'volgnr': 1}],
+        'extraData': {},
+    }
+
+
+def test_to_internal():
+    data = to_internal({'passageAt': '2021-06-01 12:00:00', 'cameraId': '1'})
+    # Naive timestamps are in UTC
+    assert data == {'passage_at': '2021-06-01T12:00:00+00:00', 'camera_id': '1'}
+
+
+def test_copy_value():
+    assert copy_value(None) == '\\N'
+    assert copy_value(True) == 't'
+    assert copy_value('a\tb\\c\n') == 'a\\tb\\\\c\\n'
+    assert copy_value(datetime.datetime(2021, 6, 1, 12)) == '2021-06-01T12:00:00'
+    assert copy_value({'a': [1]}) == '{"a": [1]}'
+    point = Point(4.9, 52.3, srid=4326)
+    assert copy_value(point) == point.hexewkb.decode()
+    assert copy_value('x', is_json=True) == '"x"'
+    assert copy_value(True, is_json=True) == 'true'
+
+
+def test_copy_rows_json_scalar():
+    passage = Passage(
+        id=uuid.uuid4(),
+        passage_at=datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc),
+        extra_data='x',
+        brandstoffen=True,
+    )
+    values = copy_rows([passage]).read().rstrip('\n').split('\t')
+    row = dict(zip([field.name for field in INSERT_FIELDS], values))
+    assert row['extra_data'] == '"x"'
+    assert row['brandstoffen'] == 'true'
+    assert row['kenteken_karakters_betrouwbaarheid'] == '\\N'
+
+
+class TestPassageLoader:
+    @pytest.fixture(autouse=True)
+    def create_partition(self):
+        with mock.patch('passage.loading.create_partition') as create_partition:
+            yield create_partition
+
+    def test_rejects(self, tmp_path):
+        existing = message()
+        first = message()
+        rows = [
+            existing,
+            first,
+            # Validation error, duplicate in the input, parse error
+            message(rijrichting='x'),
+            dict(first, camera_naam='other'),
+            '{"id":',
+        ]
+        path = write_ndjson(tmp_path / 'passages.ndjson.gz', rows)
+        rejects = str(tmp_path / 'rejects.ndjson')
+
+        def load_batch(alias, day, batch):
+            assert (alias, day) == ('default', datetime.date(2021, 6, 1))
+            return {str(passage.id) for passage, source in batch} - {existing['id']}
+
+        loader = PassageLoader([path], rejects, workers=2)
+        with mock.patch.object(loader, 'load_batch', side_effect=load_batch):
+            stats = loader.run()
+
+        assert stats == {'read': 5, 'loaded': 1, 'rejected': 4}
+        errors = {reject['line']: reject['errors'] for reject in read_rejects(rejects)}
+        assert set(errors) == {1, 3, 4, 5}
+        assert errors[1] == {'id': ['Already in the database.']}
+        assert 'rijrichting' in errors[3]
+        assert errors[4] == {'id': ['Duplicate id in the input.']}
+
+    def test_batches(self, tmp_path, create_partition):
+        days = ['2021-06-01T08:00:00+00:00', '2021-06-02T08:00:00+00:00']
+        rows = [message(passage_at=days[n % 2]) for n in range(5)]
+        path = write_ndjson(tmp_path / 'passages.ndjson.gz', rows)
+
+        batches = []
+
+        def load_batch(alias, day, batch):
+            batches.append((day, len(batch)))
+            return {str(passage.id) for passage, source in batch}
+
+        loader = PassageLoader([path], str(tmp_path / 'rejects'), batch_size=2)
+        with mock.patch.object(loader, 'load_batch', side_effect=load_batch):
+            assert loader.run()['loaded'] == 5
+
+        day1, day2 = datetime.date(2021, 6, 1), datetime.date(2021, 6, 2)
+        assert sorted(batches) == [(day1, 1), (day1, 2), (day2, 2)]
+        # Every partition is created once
+        assert create_partition.call_count == 2
+
+    def test_failed_batch(self, tmp_path):
+        path = write_ndjson(tmp_path / 'passages.ndjson.gz', [message()])
+        rejects = str(tmp_path / 'rejects.ndjson')
+
+        loader = PassageLoader([path], rejects)
+        error = Exception('connection lost')
+        with mock.patch.object(loader, 'load_batch', side_effect=error):
+            with pytest.raises(LoadError):
+                loader.run()
+
+        (reject,) = read_rejects(rejects)
+        assert reject['errors'] == {'non_field_errors': ['connection lost']}
+
+    def test_unknown_format(self, tmp_path):
+        loader = PassageLoader([str(tmp_path / 'passages.xml')], str(tmp_path / 'r'))
+        with pytest.raises(LoadError):
+            loader.run()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_csv(tmp_path):
+    rows = [message(passage_at='2021-06-01 10:00:00') for _ in range(3)]
+    path = tmp_path / 'passages.csv'
+    with open(path, 'w', newline='') as f:
+        fields = [to_camelcase(key) for key in rows[0]]
+        writer = csv.DictWriter(f, fields, delimiter=';')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(
+                {
+                    to_camelcase(key): json.dumps(value)
+                    if isinstance(value, (dict, list))
+                    else value
+                    for key, value in row.items()
+                }
+            )
+
+    rejects = str(tmp_path / 'rejects.ndjson')
+    assert PassageLoader([str(path)], rejects).run()['loaded'] == 3
+    # Loading it again only rejects
+    assert PassageLoader([str(path)], rejects).run()['rejected'] == 3
+
+    passage = Passage.objects.get(id=rows[0]['id'])
+    assert passage.passage_at == datetime.datetime(
+        2021, 6, 1, 10, tzinfo=datetime.timezone.utc
+    )
+    # The privacy rules of the serializer
+    assert passage.merk is None
+    assert passage.toegestane_maximum_massa_voertuig == 1500
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_json_scalar(tmp_path):
+    # Any JSON value is valid for the JSON fields, not only objects and arrays
+    row = message(passage_at='2021-06-01 10:00:00', extraData='x')
+    path = write_ndjson(tmp_path / 'passages.ndjson.gz', [row])
+
+    stats = PassageLoader([path], str(tmp_path / 'rejects.ndjson')).run()
+    assert stats['loaded'] == 1
+    assert Passage.objects.get(id=row['id']).extra_data == 'x'
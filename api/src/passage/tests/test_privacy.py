@@ -0,0 +1,57 @@
+from datetime import date, datetime
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from passage.models import Passage
+from passage.partitions import Partition
+from passage.privacy import is_clean, rewrite_partition
+
+from .factories import PassageFactory
+
+PARTITION = Partition('passage_passage_20181016', date(2018, 10, 16))
+
+
+@pytest.mark.django_db
+class TestPrivacyRewrite:
+    def test_rewrite_partition(self):
+        passage_at = datetime(2018, 10, 16, 12, tzinfo=timezone.utc)
+        light = PassageFactory(
+            passage_at=passage_at,
+            toegestane_maximum_massa_voertuig=3000,
+            voertuig_soort='PERSONENAUTO',
+            datum_eerste_toelating=date(2012, 5, 6),
+        )
+        heavy = PassageFactory(
+            passage_at=passage_at, toegestane_maximum_massa_voertuig=12000
+        )
+        assert not is_clean(PARTITION)
+
+        assert rewrite_partition(PARTITION) == 2
+        assert is_clean(PARTITION)
+
+        light = Passage.objects.get(id=light.id)
+        assert light.toegestane_maximum_massa_voertuig == 1500
+        assert light.merk is None
+        assert light.europese_voertuigcategorie_toevoeging is None
+        assert light.inrichting == 'Personenauto'
+        assert light.datum_eerste_toelating == date(2012, 1, 1)
+        assert light.datum_tenaamstelling is None
+
+        heavy_after = Passage.objects.get(id=heavy.id)
+        assert heavy_after.toegestane_maximum_massa_voertuig == 12000
+        assert heavy_after.merk == heavy.merk
+
+    def test_skip_clean_partitions(self):
+        rewrite_partition(PARTITION)
+
+        command = 'passage.management.commands.passage_privacy'
+        with mock.patch(f'{command}.rewrite_partition') as rewrite:
+            call_command(
+                'passage_privacy',
+                rewrite=True,
+                from_date=PARTITION.day,
+                to_date=PARTITION.day,
+            )
+        rewrite.assert_not_called()
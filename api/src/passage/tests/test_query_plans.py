@@ -0,0 +1,130 @@
+from datetime import date
+
+import pytest
+from passage import query_plans
+from passage.models import Passage, PassageHourAggregation
+
+EXPLAINED = {
+    'Plan': {
+        'Node Type': 'Aggregate',
+        'Shared Hit Blocks': 10,
+        'Shared Read Blocks': 5,
+        'Actual Rows': 1,
+        'Plans': [
+            {
+                'Node Type': 'Append',
+                'Plans': [
+                    {
+                        'Node Type': 'Index Scan',
+                        'Relation Name': 'passage_passage_20200106',
+                    },
+                    {'Node Type': 'Seq Scan', 'Relation Name': 'passage_camera'},
+                ],
+            }
+        ],
+    },
+    'Planning Time': 0.1234,
+    'Execution Time': 12.3456,
+}
+
+
+def test_summarize():
+    assert query_plans.summarize(EXPLAINED) == {
+        'execution_ms': 12.346,
+        'planning_ms': 0.123,
+        'buffers': 15,
+        'rows': 1,
+        'seq_scans': ['passage_camera'],
+        'partitions': ['passage_passage_20200106'],
+        'shape': [
+            'Aggregate',
+            '  Append',
+            '    Index Scan on passage_passage_20200106',
+            '    Seq Scan on passage_camera',
+        ],
+    }
+
+
+class TestCompare:
+    baseline = {'q': query_plans.summarize(EXPLAINED)}
+
+    def compare(self, **changes):
+        current = {'q': dict(self.baseline['q'], **changes)}
+        return query_plans.compare(self.baseline, current, threshold=25)
+
+    def test_unchanged(self):
+        assert self.compare() == []
+
+    def test_new_query(self):
+        findings = query_plans.compare({}, self.baseline, threshold=25)
+        assert findings == [('q', 'no baseline', False)]
+
+    def test_plan_changed(self):
+        findings = self.compare(shape=['Seq Scan on passage_passage_20200106'])
+        assert findings == [('q', 'plan changed', False)]
+
+    def test_execution_time(self):
+        assert self.compare(execution_ms=15) == []
+        assert self.compare(execution_ms=20) == [
+            ('q', 'execution time 12.346 -> 20 ms', True)
+        ]
+
+    def test_buffers(self):
+        assert self.compare(buffers=30) == [('q', 'buffers 15 -> 30', True)]
+
+
+class TestCheck:
+    expected = {'q': (1, {'passage_camera'})}
+
+    def check(self, **changes):
+        results = {'q': dict(query_plans.summarize(EXPLAINED), **changes)}
+        return query_plans.check(results, self.expected)
+
+    def test_expected(self):
+        assert self.check() == []
+        # A partition that is scanned may be read whole
+        assert self.check(seq_scans=['passage_passage_20200106']) == []
+
+    def test_unknown_query(self):
+        results = {'q': query_plans.summarize(EXPLAINED)}
+        assert query_plans.check(results, {}) == [('q', 'no expected plan', False)]
+
+    def test_seq_scan(self):
+        findings = self.check(seq_scans=['passage_camera', 'passage_cameralag'])
+        assert findings == [('q', 'seq scan on passage_cameralag', True)]
+
+    def test_partition_pruning(self):
+        findings = self.check(
+            partitions=['passage_passage_20200106', 'passage_passage_20200107']
+        )
+        assert findings == [
+            ('q', 'scans 2 partitions, expected at most 1 (partition pruning)', True)
+        ]
+
+    def test_expected_plans(self):
+        assert set(query_plans.EXPECTED_PLANS) == set(query_plans.get_queries())
+
+
+@pytest.mark.django_db
+def test_load_and_run():
+    start = date(2020, 1, 6)
+    assert query_plans.load_dataset(start, days=2, rows_per_day=100, cameras=5)
+    assert not query_plans.load_dataset(start, days=2, rows_per_day=100, cameras=5)
+    assert Passage.objects.count() == 200
+    assert PassageHourAggregation.objects.filter(day=6).exists()
+
+    results = query_plans.run(query_plans.get_queries(start), repeat=1)
+    assert set(results) == {
+        'hour_aggregation.delete',
+        'hour_aggregation.insert',
+        'zwaar_verkeer_hour_aggregation.delete',
+        'zwaar_verkeer_hour_aggregation.insert',
+        'export',
+        'export_taxi',
+    }
+    assert results['hour_aggregation.insert']['partitions'] == [
+        'passage_passage_20200106'
+    ]
+    assert query_plans.check(results) == []
+    # EXPLAIN ANALYZE of the inserts and deletes is rolled back
+    assert PassageHourAggregation.objects.filter(day=6).exists()
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+import uuid
+
+import msgpack
+from aiohttp import web
+from passage.tests.replay import Replay, load, rewrite
+
+NAMESPACE = uuid.UUID('6b2c7e4a-8f0e-4d3b-9a51-2f6c1d0e7b93')
+
+
+def capture(at, id, status=201):
+    return {
+        'at': at,
+        'path': '/v0/milieuzone/passage/',
+        'content_type': 'application/json',
+        'status': status,
+        'body': json.dumps({'id': id, 'passage_at': '2021-03-01T08:15:00+01:00'}),
+    }
+
+
+def test_load(tmp_path):
+    first, second = tmp_path / 'capture-1.jsonl', tmp_path / 'capture-2.jsonl'
+    first.write_text(f'{json.dumps(capture(3, "c"))}\n{json.dumps(capture(1, "a"))}\n')
+    second.write_text(f'{json.dumps(capture(2, "b"))}\n\n')
+
+    records = load([first, second])
+    assert [record['at'] for record in records] == [1, 2, 3]
+
+
+def test_rewrite():
+    body = capture(0, 'a')['body']
+    first = json.loads(rewrite(body, NAMESPACE, 2))
+    assert first['id'] == str(uuid.uuid5(NAMESPACE, 'a'))
+    assert first['passage_at'] == '2021-03-03T08:15:00+01:00'
+
+    # Duplicates in the capture stay duplicates, other runs get other ids
+    assert json.loads(rewrite(body, NAMESPACE, 2))['id'] == first['id']
+    assert json.loads(rewrite(body, uuid.uuid4(), 2))['id'] != first['id']
+
+    assert json.loads(rewrite(body, NAMESPACE, 0))['passage_at'] == (
+        '2021-03-01T08:15:00+01:00'
+    )
+    assert rewrite('not json', NAMESPACE, 2) == 'not json'
+
+
+def test_rewrite_msgpack():
+    body = msgpack.packb(json.loads(capture(0, 'a')['body']))
+    passage = msgpack.unpackb(rewrite(body, NAMESPACE, 2, 'application/msgpack'))
+    assert passage['id'] == str(uuid.uuid5(NAMESPACE, 'a'))
+    assert passage['passage_at'] == '2021-03-03T08:15:00+01:00'
+
+
+def test_replay():
+    received = []
+
+    async def create(request):
+        passage = await request.json()
+        status = 409 if passage['id'] in received else 201
+        received.append(passage['id'])
+        return web.json_response(passage, status=status)
+
+    async def run(records, speed):
+        app = web.Application()
+        app.router.add_post('/v0/milieuzone/passage/', create)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            replay = Replay(
+                f'http://127.0.0.1:{port}', records, str(NAMESPACE), speed=speed
+            )
+            return await replay.run()
+        finally:
+            await runner.cleanup()
+
+    now = time.time()
+    # A burst, a retry of the first passage and one a second later
+    records = [capture(now, 'a'), capture(now, 'b'), capture(now + 0.1, 'a', 409)]
+    records.append(capture(now + 1, 'c'))
+
+    start = time.monotonic()
+    results = asyncio.run(run(records, speed=4))
+    elapsed = time.monotonic() - start
+
+    assert 0.25 <= elapsed < 1
+    assert results['replay'].statuses == {201: 3, 409: 1}
+    assert str(uuid.uuid5(NAMESPACE, 'a')) in received
+    assert len(set(received)) == 3
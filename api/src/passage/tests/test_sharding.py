@@ -0,0 +1,69 @@
+import threading
+from unittest import mock
+
+import pytest
+from passage.models import Passage
+from passage.sharding import PassageShardRouter, merge_counts, scatter, shard_for_camera
+
+from .factories import PassageFactory
+
+
+@pytest.fixture
+def shards(settings):
+    settings.DATABASE_SHARDS = ['shard_1', 'shard_2']
+    settings.PASSAGE_SHARD_MAP = {'cam-pinned': 'shard_2'}
+    return settings.DATABASE_SHARDS
+
+
+def test_not_sharded():
+    assert {shard_for_camera(f'cam-{n}') for n in range(10)} == {'default'}
+    passage = PassageFactory.build()
+    assert PassageShardRouter().db_for_write(Passage, instance=passage) is None
+
+
+def test_shard_for_camera(shards):
+    assert shard_for_camera('cam-pinned') == 'shard_2'
+
+    cameras = [f'cam-{n}' for n in range(100)]
+    aliases = [shard_for_camera(camera) for camera in cameras]
+    assert set(aliases) == {'default', 'shard_1', 'shard_2'}
+    # Stable, the same camera is always stored on the same shard
+    assert aliases == [shard_for_camera(camera) for camera in cameras]
+
+
+def test_router(shards):
+    router = PassageShardRouter()
+    passage = PassageFactory.build(camera_id='cam-pinned')
+    assert router.db_for_write(Passage, instance=passage) == 'shard_2'
+    assert router.db_for_write(Passage) is None
+
+
+def test_merge_counts():
+    rows = [('2021-06-01', 8, 'NL', 3), ('2021-06-01', 8, 'overig', 1)]
+    rows += [('2021-06-01', 8, 'NL', 2)]
+    assert sorted(merge_counts(rows)) == [
+        ('2021-06-01', 8, 'NL', 5),
+        ('2021-06-01', 8, 'overig', 1),
+    ]
+
+
+def test_scatter(shards):
+    # Only passes when the three shards are handled at the same time
+    barrier = threading.Barrier(3, timeout=5)
+
+    def func(alias):
+        barrier.wait()
+        return alias
+
+    closed = []
+
+    class Connections:
+        # A MagicMock isn't thread safe
+        def __getitem__(self, alias):
+            return mock.Mock(close=lambda: closed.append(alias))
+
+    with mock.patch('passage.sharding.connections', Connections()):
+        assert scatter(func) == ['default', 'shard_1', 'shard_2']
+    # The connections of the threads are closed
+    assert sorted(closed) == ['default', 'shard_1', 'shard_2']
+    assert scatter(lambda alias: alias, ['default']) == ['default']
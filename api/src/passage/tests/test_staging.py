@@ -0,0 +1,128 @@
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from metrics import render
+from passage.models import Passage
+from passage.staging import StagingCollector, get_status, merge
+from passage.statements import (
+    INSERT_FIELDS,
+    SQL_INSERT_PASSAGE,
+    SQL_INSERT_STAGED,
+    STAGING_TABLE,
+    get_insert_sql,
+    insert_passage,
+)
+
+from .factories import PassageFactory
+
+
+def staged_count():
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {STAGING_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def table_columns(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT column_name, data_type FROM information_schema.columns '
+            'WHERE table_name = %s ORDER BY column_name',
+            [table],
+        )
+        return cursor.fetchall()
+
+
+def test_get_insert_sql():
+    assert get_insert_sql() == SQL_INSERT_STAGED
+    with override_settings(PASSAGE_INGEST_MODE='direct'):
+        assert get_insert_sql() == SQL_INSERT_PASSAGE
+
+
+def test_collector():
+    with mock.patch('passage.staging.get_status', return_value=(3, 12.5)):
+        _, content = render([StagingCollector()])
+
+    assert b'iotsignals_passage_staging_rows{alias="default"} 3.0' in content
+    assert b'iotsignals_passage_staging_lag_seconds{alias="default"} 12.5' in content
+
+
+def test_collector_failed():
+    with mock.patch('passage.staging.get_status', side_effect=Exception('down')):
+        _, content = render([StagingCollector()])
+
+    assert b'iotsignals_passage_staging_rows' not in content
+
+
+@pytest.fixture(autouse=True)
+def staging(settings):
+    settings.PASSAGE_INGEST_MODE = 'staging'
+
+
+@pytest.mark.django_db
+class TestStaging:
+    def test_columns(self):
+        # Migration 0018 copied passage_passage, a migration that changes it has
+        # to change the staging table as well
+        columns = table_columns(STAGING_TABLE)
+        assert columns == table_columns(Passage._meta.db_table)
+        assert {name for name, _ in columns} == {f.column for f in INSERT_FIELDS}
+
+    def test_insert_staged(self):
+        insert_passage(PassageFactory.build())
+
+        assert staged_count() == 1
+        assert Passage.objects.count() == 0
+
+    @override_settings(DATABASE_PREPARED_STATEMENTS=False)
+    def test_insert_staged_not_prepared(self):
+        insert_passage(PassageFactory.build())
+
+        assert staged_count() == 1
+
+    def test_merge(self):
+        passages = PassageFactory.build_batch(5)
+        for passage in passages:
+            insert_passage(passage)
+
+        assert merge(batch_size=2) == (5, 0)
+        assert staged_count() == 0
+        assert Passage.objects.count() == 5
+        saved = Passage.objects.get(pk=passages[0].pk)
+        assert saved.camera_naam == passages[0].camera_naam
+        assert saved.created_at == passages[0].created_at
+
+    def test_merge_duplicates(self):
+        passage = PassageFactory.build()
+        # Posted twice, and already in passage_passage
+        insert_passage(passage)
+        insert_passage(passage)
+        merge()
+        insert_passage(passage)
+
+        assert merge() == (0, 1)
+        assert staged_count() == 0
+        assert Passage.objects.count() == 1
+
+    def test_status(self):
+        assert get_status() == (0, 0)
+        insert_passage(PassageFactory.build())
+
+        rows, lag = get_status()
+        assert rows == 1
+        assert lag >= 0
+
+    def test_command(self):
+        insert_passage(PassageFactory.build())
+        call_command('passage_merge_staging', once=True)
+
+        assert staged_count() == 0
+        assert Passage.objects.count() == 1
+
+    def test_metrics(self, client):
+        insert_passage(PassageFactory.build())
+
+        content = client.get('/status/metrics').content
+        assert b'iotsignals_passage_staging_rows{alias="default"} 1.0' in content
@@ -0,0 +1,62 @@
+import datetime
+import uuid
+
+import pytest
+from django.db import IntegrityError, connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from passage.models import Passage
+from passage.statements import INSERT_FIELDS, get_insert_values, insert_passage
+
+from .factories import PassageFactory
+
+
+@pytest.mark.django_db
+class TestInsertPassage:
+    def test_insert(self):
+        passage = PassageFactory.build()
+        insert_passage(passage)
+
+        assert not passage._state.adding
+        saved = Passage.objects.get(pk=passage.pk)
+        assert saved.created_at == passage.created_at
+        assert saved.camera_naam == passage.camera_naam
+        assert saved.camera_locatie == passage.camera_locatie
+        assert saved.brandstoffen == passage.brandstoffen
+
+    def test_prepared_once(self):
+        with CaptureQueriesContext(connection) as context:
+            insert_passage(PassageFactory.build())
+            insert_passage(PassageFactory.build())
+
+        queries = [query['sql'].split()[0] for query in context.captured_queries]
+        assert queries.count('PREPARE') <= 1
+        assert queries.count('EXECUTE') == 2
+
+    def test_duplicate(self):
+        passage = PassageFactory.build()
+        insert_passage(passage)
+
+        duplicate = PassageFactory.build(id=passage.id, passage_at=passage.passage_at)
+        with pytest.raises(IntegrityError), transaction.atomic():
+            insert_passage(duplicate)
+        # The connection is still usable
+        assert Passage.objects.count() == 1
+
+    @override_settings(DATABASE_PREPARED_STATEMENTS=False)
+    def test_not_prepared(self):
+        passage = PassageFactory.build()
+        with CaptureQueriesContext(connection) as context:
+            insert_passage(passage)
+
+        assert context.captured_queries[0]['sql'].startswith('INSERT')
+        assert Passage.objects.filter(pk=passage.pk).exists()
+
+
+def test_get_insert_values():
+    passage_at = datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc)
+    passage = Passage(id=uuid.uuid4(), passage_at=passage_at)
+    values = dict(zip([f.name for f in INSERT_FIELDS], get_insert_values(passage)))
+    # Naive, in UTC
+    assert values['passage_at'] == datetime.datetime(2021, 6, 1, 12)
+    assert values['created_at'].tzinfo is None
@@ -0,0 +1,105 @@
+import argparse
+import asyncio
+import io
+
+import pytest
+from aiohttp import web
+from passage.tests.stress import Driver, Histogram, parse_mix
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    assert histogram.total == 1000
+    assert histogram.max == 1000000
+    for percentile, expected in ((50, 500000), (99, 990000), (99.9, 999000)):
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=0.01)
+    assert histogram.percentile(100) == 1000000
+
+
+def test_histogram_corrected():
+    histogram = Histogram()
+    for _ in range(99):
+        histogram.record(1000)
+    # One stall of a second, with a request due every millisecond
+    histogram.record(1000000)
+
+    corrected = histogram.corrected(1000)
+    assert corrected.total == 99 + 1000
+    assert corrected.max == histogram.max
+    # Without the correction the stall is only visible in the max
+    assert histogram.percentile(99) == pytest.approx(1000, rel=0.01)
+    assert corrected.percentile(50) > 400000
+
+
+def test_histogram_merge_and_hgrm():
+    first, second = Histogram(), Histogram()
+    first.record(1000)
+    second.record(3000)
+    first.merge(second)
+    assert first.total == 2
+    assert first.mean == 2000
+
+    f = io.StringIO()
+    first.write_hgrm(f)
+    lines = f.getvalue().splitlines()
+    assert lines[0].split() == ['Value', 'Percentile', 'TotalCount', '1/(1-Percentile)']
+    assert lines[-3].split()[1:] == ['1.000000000000', '2']
+    assert 'Total count' in lines[-1]
+
+
+def test_parse_mix():
+    assert parse_mix('post=3, export_taxi=1,batch=0') == {
+        'post': 3,
+        'export_taxi': 1,
+    }
+    assert parse_mix('duplicate') == {'duplicate': 1}
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix('delete=1')
+
+
+def test_driver():
+    received = []
+
+    async def create(request):
+        passage = await request.json()
+        status = 409 if passage['id'] in received else 201
+        received.append(passage['id'])
+        return web.json_response(passage, status=status)
+
+    async def export_taxi(request):
+        return web.Response(text='datum;aantal_taxi_passages\n')
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/v0/milieuzone/passage/', create)
+        app.router.add_get('/v0/milieuzone/passage/export-taxi/', export_taxi)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            driver = Driver(
+                f'http://127.0.0.1:{port}',
+                parse_mix('post=1,batch=1,duplicate=1,export_taxi=1'),
+                batch_size=5,
+            )
+            return await driver.run(1, rate=100)
+        finally:
+            await runner.cleanup()
+
+    results = asyncio.run(run())
+
+    assert set(results) == {'post', 'batch', 'duplicate', 'export_taxi'}
+    assert sum(result.service.total for result in results.values()) == 100
+    assert set(results['duplicate'].statuses) <= {201, 409}
+    assert set(results['export_taxi'].statuses) == {200}
+    batch = results['batch']
+    assert sum(batch.statuses.values()) == 5 * batch.service.total
+    # Open-loop, so the response time is never shorter than the service time
+    for result in results.values():
+        assert result.response.total == result.service.total
+        assert result.response.max >= result.service.max
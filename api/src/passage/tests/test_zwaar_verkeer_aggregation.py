@@ -1,4 +1,5 @@
 from datetime import timedelta, datetime
+from unittest import mock
 
 import pytest
 import time_machine
@@ -6,6 +7,7 @@ from django.core.management import call_command
 from django.utils import timezone
 
 from passage.models import Camera, HeavyTrafficHourAggregation
+from passage.sharding import fetch_all
 from passage.tests.factories import PassageFactory
 
 
@@ -150,6 +152,64 @@ class TestZwaarVerkeerAggregation:
         # check the most important (calculated) attribute: intensity
         assert result.intensiteit == 10
 
+    @time_machine.travel(datetime.today() + timedelta(days=1), tick=False)
+    def test_aggregation_sharded(self, settings):
+        # required to ensure partitions exist
+        import make_paritions
+
+        settings.DATABASE_SHARDS = ['shard_1']
+        helper_table_row = Camera.objects.filter(cordon__in=['S100', 'A10']).first()
+
+        yesterday = timezone.now() - timedelta(days=1)
+        PassageFactory.create_batch(
+            size=2,
+            passage_at=yesterday,
+            camera_naam=helper_table_row.camera_naam,
+            camera_kijkrichting=helper_table_row.camera_kijkrichting,
+            rijrichting=helper_table_row.rijrichting,
+            kenteken_land='NL',
+            voertuig_soort='Vrachtwagen',
+            inrichting='barbaz',
+            toegestane_maximum_massa_voertuig=7500,
+        )
+        # The same hour and camera on shard_1, which has no passage_camera rows
+        shard_rows = [
+            (
+                yesterday.replace(minute=0, second=0, microsecond=0),
+                helper_table_row.camera_naam,
+                helper_table_row.camera_kijkrichting,
+                helper_table_row.rijrichting,
+                'NL',
+                'Vrachtwagen',
+                'barbaz',
+                'klasse 1 <= 7500',
+                3,
+            )
+        ]
+
+        def fetch_shards(query):
+            assert 'passage_camera' not in query
+            return fetch_all(query, shards=['default']) + shard_rows
+
+        with mock.patch(
+            'passage.management.commands.passage_zwaar_verkeer_hour_aggregation'
+            '.fetch_all',
+            side_effect=fetch_shards,
+        ) as fetch:
+            call_command(
+                'passage_zwaar_verkeer_hour_aggregation',
+                from_date=yesterday.date(),
+            )
+        assert fetch.call_count == 1
+
+        result = HeavyTrafficHourAggregation.objects.get()
+        assert result.passage_at_timestamp == shard_rows[0][0]
+        assert result.passage_at_hour == yesterday.hour
+        assert result.voertuig_klasse_toegestaan_gewicht == 'klasse 1 <= 7500'
+        for attr in ['order_kaart', 'order_naam', 'cordon', 'location', 'geom']:
+            assert getattr(result, attr) == getattr(helper_table_row, attr)
+        assert result.intensiteit == 5
+
     def _get_expected_dow(self, timestamp):
         """
         Get the expected day of week
@@ -1,6 +1,9 @@
 from datetime import date, timedelta
 
+from contrib.db.routers import choose_replica, use_replica
 from contrib.rest_framework.authentication import SimpleTokenAuthentication
+from contrib.rest_framework.parsers import CBORParser, MessagePackParser
+from contrib.rest_framework.renderers import CBORRenderer, MessagePackRenderer
 from datapunt_api.pagination import HALCursorPagination
 from datapunt_api.rest import DatapuntViewSetWritable
 from django.db.models import DateTimeField, ExpressionWrapper, F, Sum
@@ -8,12 +11,16 @@ from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django_filters.filterset import filterset_factory
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
+from metrics import PASSAGE_CREATE_PHASE_DURATION, PASSAGE_VALIDATION_ERRORS, timed
 from passage.case_converters import to_snakecase
 from passage.expressions import HoursInterval
-from rest_framework import exceptions, generics, mixins, viewsets
+from passage.freshness import DELAY_BUCKETS, percentile
+from rest_framework import exceptions, generics, mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from tracing import span
 from writers import CSVExport
 
 from . import models, serializers
@@ -72,23 +79,59 @@ class PassageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
 
     pagination_class = PassagePager
 
-    # override create to convert request.data from camelcase to snakecase.
+    # Gateways may send (and accept) MessagePack or CBOR instead of JSON
+    parser_classes = [
+        *api_settings.DEFAULT_PARSER_CLASSES,
+        MessagePackParser,
+        CBORParser,
+    ]
+    renderer_classes = [
+        *api_settings.DEFAULT_RENDERER_CLASSES,
+        MessagePackRenderer,
+        CBORRenderer,
+    ]
+
+    # override create to convert request.data from camelcase to snakecase,
+    # and to measure the time spent in each phase.
     def create(self, request, *args, **kwargs):
-        tmp = {to_snakecase(k): v for k, v in request.data.items()}
-        request.data.clear()
-        request.data.update(tmp)
-        return super().create(request, *args, **kwargs)
-
-    @action(methods=['get'], detail=False, url_path='export-taxi')
-    def export_taxi(self, request, *args, **kwargs):
-        # 1. Get the iterator of the QuerySet
-        qs = (
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('parse')):
+            with span('parse'):
+                data = request.data
+            with span('key_conversion'):
+                tmp = {to_snakecase(k): v for k, v in data.items()}
+                data.clear()
+                data.update(tmp)
+
+        serializer = self.get_serializer(data=request.data)
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('validate')), span('validate'):
+            valid = serializer.is_valid()
+        if not valid:
+            PASSAGE_VALIDATION_ERRORS.inc()
+            raise exceptions.ValidationError(serializer.errors)
+
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('insert')), span('insert'):
+            self.perform_create(serializer)
+
+        with timed(PASSAGE_CREATE_PHASE_DURATION.labels('serialize')):
+            with span('serialize'):
+                data = serializer.data
+        headers = self.get_success_headers(data)
+        return Response(data, status=status.HTTP_201_CREATED, headers=headers)
+
+    @staticmethod
+    def get_export_taxi_queryset():
+        return (
             models.PassageHourAggregation.objects.annotate(datum=F('date'))
             .values('datum')
             .annotate(aantal_taxi_passages=Sum('count'))
             .filter(taxi_indicator=True)
         )
 
+    @action(methods=['get'], detail=False, url_path='export-taxi')
+    def export_taxi(self, request, *args, **kwargs):
+        # 1. Get the iterator of the QuerySet, it's streamed from a replica
+        qs = self.get_export_taxi_queryset().using(choose_replica())
+
         # 2. Create the instance of our CSVExport class
         csv_export = CSVExport()
 
@@ -100,7 +143,7 @@ class PassageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         #  header=['datum', 'aantal_taxi_passages'],
         #  )
 
-        return csv_export.export("export", qs.iterator(), streaming=True)
+        return csv_export.export("export", qs.iterator(), streaming=True, name='taxi')
 
     @action(
         methods=['get'],
@@ -110,7 +153,19 @@ class PassageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         permission_classes=[IsAuthenticated],
     )
     def export(self, request, *args, **kwargs):
-        # 1. Get the iterator of the QuerySet
+        # 1. Get the iterator of the QuerySet, it's streamed from a replica
+        qs = self.get_export_queryset(request.GET).using(choose_replica())
+
+        # 2. Create the instance of our CSVExport class
+        csv_export = CSVExport()
+
+        # 3. Export (download) the file
+        return csv_export.export(
+            "export", qs.iterator(), streaming=True, name='hour_aggregation'
+        )
+
+    @staticmethod
+    def get_export_queryset(params):
         previous_week = timezone.now() - timedelta(days=timezone.now().weekday(), weeks=1)
         year = previous_week.year
         week = previous_week.isocalendar()[1]
@@ -118,12 +173,12 @@ class PassageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
         Filter = filterset_factory(
             models.PassageHourAggregation, fields=['year', 'week']
         )
-        qs = Filter(request.GET).qs
+        qs = Filter(params).qs
 
         # If no date has been given, we return the data of last week
         # Since the last week of the year can contain days of both years
         # we will search in both years.
-        if not request.GET.get('year') and not request.GET.get('week'):
+        if not params.get('year') and not params.get('week'):
             monday = previous_week
             sunday = monday + timedelta(days=6)
             qs = qs.filter(date__gte=monday, date__lte=sunday)
@@ -138,9 +193,60 @@ class PassageViewSet(mixins.CreateModelMixin, viewsets.GenericViewSet):
             .annotate(sum=Sum("count"))
             .order_by("bucket")
         )
+        return qs
 
-        # 2. Create the instance of our CSVExport class
-        csv_export = CSVExport()
-
-        # 3. Export (download) the file
-        return csv_export.export("export", qs.iterator(), streaming=True)
+    @action(
+        methods=['get'],
+        detail=False,
+        url_path='camera-lag',
+        authentication_classes=[SimpleTokenAuthentication],
+        permission_classes=[IsAuthenticated],
+    )
+    @use_replica()
+    def camera_lag(self, request, *args, **kwargs):
+        """
+        List the cameras by lag (time since their last passage was received)
+        and the ingest delay distribution of the last `days` days.
+        """
+        try:
+            days = int(request.GET.get('days', 1))
+        except ValueError:
+            raise exceptions.ValidationError({'days': 'A valid integer is required.'})
+
+        now = timezone.now()
+        cameras = [
+            {
+                'camera_id': camera.camera_id,
+                'camera_naam': camera.camera_naam,
+                'last_passage_at': camera.last_passage_at,
+                'last_created_at': camera.last_created_at,
+                'lag_seconds': (now - camera.last_created_at).total_seconds(),
+            }
+            for camera in models.CameraFreshness.objects.order_by('last_created_at')
+        ]
+
+        counts = dict(
+            models.IngestDelay.objects.filter(
+                date__gt=now.date() - timedelta(days=days)
+            )
+            .values_list('le')
+            .annotate(Sum('count'))
+        )
+        buckets = [(le, counts.get(le, 0)) for le in DELAY_BUCKETS]
+
+        def le_label(le):
+            return '+Inf' if le == float('inf') else le
+
+        return Response(
+            {
+                'cameras': cameras,
+                'ingest_delay': {
+                    'buckets': [
+                        {'le': le_label(le), 'count': count} for le, count in buckets
+                    ],
+                    'p50': le_label(percentile(buckets, 0.5)),
+                    'p95': le_label(percentile(buckets, 0.95)),
+                    'p99': le_label(percentile(buckets, 0.99)),
+                },
+            }
+        )
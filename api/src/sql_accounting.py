@@ -0,0 +1,95 @@
+"""
+Count the queries and database time of requests and management commands.
+
+Uses the execute wrappers of Django, so unlike the debug toolbar it also
+works with DEBUG off. Queries slower than SQL_SLOW_QUERY_MS are logged with
+their parameters, and with their plan when SQL_SLOW_QUERY_EXPLAIN is set.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from metrics import COMMAND_DB_DURATION, COMMAND_DB_QUERIES
+from psycopg2.sql import Composable
+
+log = logging.getLogger(__name__)
+
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+
+def explain(connection, sql, params):
+    # Use the psycopg2 cursor, so the EXPLAIN itself isn't accounted for
+    with connection.connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def log_slow_query(connection, sql, params, many, duration):
+    if isinstance(sql, Composable):
+        sql = sql.as_string(connection.connection)
+
+    message = f'Slow query ({duration * 1000:.1f} ms): {sql}; params: {params}'
+    if (
+        settings.SQL_SLOW_QUERY_EXPLAIN
+        and not many
+        and sql.lstrip().lower().startswith(EXPLAINABLE)
+    ):
+        try:
+            message += f'\n{explain(connection, sql, params)}'
+        except Exception as e:
+            message += f'\nEXPLAIN failed: {e}'
+    log.warning(message)
+
+
+class QueryStats:
+    """Execute wrapper that counts the queries and the time spent on them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.count += 1
+                self.duration += duration
+            if duration * 1000 >= settings.SQL_SLOW_QUERY_MS:
+                log_slow_query(context['connection'], sql, params, many, duration)
+
+
+@contextmanager
+def track_queries(stats=None):
+    """
+    Account the queries on all connections of the current thread.
+
+    A stats object can be shared by several threads, to get the totals
+    of a job that runs in a thread pool.
+    """
+    stats = stats or QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+@contextmanager
+def track_command(command, stats=None):
+    """Account the queries of a management command, logs and exports the totals."""
+    with track_queries(stats) as stats:
+        try:
+            yield stats
+        finally:
+            log.info(
+                f'{command}: {stats.count} queries, '
+                f'{stats.duration:.3f} seconds in the database'
+            )
+            COMMAND_DB_QUERIES.labels(command).inc(stats.count)
+            COMMAND_DB_DURATION.labels(command).inc(stats.duration)
@@ -0,0 +1,174 @@
+"""
+Request scoped tracing without a collector.
+
+The spans of a request are kept in memory and only written when the request
+was slow (TRACING_LATENCY_THRESHOLD_MS) or sampled (TRACING_SAMPLE_RATE), see
+middleware/tracing.py. Traces are appended to TRACING_DIR in the OTLP JSON
+format, one trace per line, which the file receiver of the OpenTelemetry
+collector (and e.g. otel-desktop-viewer) can read.
+
+Outside of a traced request span() is a cheap no-op.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+
+SERVICE_NAME = 'iotsignals'
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+_local = threading.local()
+
+
+def new_id(size):
+    return os.urandom(size).hex()
+
+
+def attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    def __init__(
+        self, trace, name, parent_id=None, kind=SPAN_KIND_INTERNAL, **attributes
+    ):
+        self.trace = trace
+        self.name = name
+        self.span_id = new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start = time.time_ns()
+        self.end = None
+
+    def finish(self, end=None):
+        self.end = end or time.time_ns()
+
+    def as_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end or time.time_ns()),
+            'attributes': [
+                {'key': key, 'value': attribute_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace:
+    """The spans of one request, the first one is the root span."""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = new_id(16)
+        self.root = Span(self, name, kind=SPAN_KIND_SERVER, **attributes)
+        self.spans = [self.root]
+        self.stack = [self.root]
+
+    @property
+    def duration_ms(self):
+        return ((self.root.end or time.time_ns()) - self.root.start) / 1e6
+
+    def as_otlp(self):
+        return {
+            'resourceSpans': [
+                {
+                    'resource': {
+                        'attributes': [
+                            {
+                                'key': 'service.name',
+                                'value': attribute_value(SERVICE_NAME),
+                            },
+                            {
+                                'key': 'process.pid',
+                                'value': attribute_value(os.getpid()),
+                            },
+                        ]
+                    },
+                    'scopeSpans': [
+                        {
+                            'scope': {'name': __name__},
+                            'spans': [span.as_otlp() for span in self.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def activate(trace):
+    """Make trace the current trace of this thread."""
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record a span, as child of the innermost open span of the current trace."""
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+
+    child = Span(trace, name, trace.stack[-1].span_id, **attributes)
+    trace.spans.append(child)
+    trace.stack.append(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        trace.stack.remove(child)
+
+
+def add_span(name, start, end, **attributes):
+    """
+    Record a span that has already finished, with the start and end in ns.
+
+    For phases that can't be wrapped in a with block, like the iteration
+    of a streaming response.
+    """
+    trace = current_trace()
+    if trace is None:
+        return
+    child = Span(trace, name, trace.stack[-1].span_id, **attributes)
+    child.start = start
+    child.finish(end)
+    trace.spans.append(child)
+
+
+def export(trace):
+    os.makedirs(settings.TRACING_DIR, exist_ok=True)
+    path = os.path.join(
+        settings.TRACING_DIR, f'traces-{datetime.now():%Y%m%d}-{os.getpid()}.jsonl'
+    )
+    line = json.dumps(trace.as_otlp(), separators=(',', ':')) + '\n'
+    # One write per trace, so the lines of the threads don't interleave
+    with open(path, 'a') as f:
+        f.write(line)
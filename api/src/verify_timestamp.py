@@ -4,7 +4,7 @@ from django.utils import timezone
 
 log = logging.getLogger(__name__)
 
-def verify_timestamp(timestamp, app):
-    latest_is_recent = timezone.now() - timestamp < timezone.timedelta(hours=1)
-    assert latest_is_recent, f'Last record was more than an hour ago. Please check the status of the providor ({app})'
+def verify_timestamp(timestamp, app, max_age=timezone.timedelta(hours=1)):
+    latest_is_recent = timezone.now() - timestamp < max_age
+    assert latest_is_recent, f'Last record was more than {max_age} ago. Please check the status of the providor ({app})'
     log.info('Timestamp OK')
@@ -3,6 +3,8 @@ import time
 from itertools import chain
 
 from django.http import HttpResponse, StreamingHttpResponse
+from metrics import EXPORT_BYTES, EXPORT_ROWS
+from tracing import add_span
 
 
 class CSVBuffer:
@@ -32,7 +34,38 @@ class CSVExport:
         except StopIteration:
             return
 
-    def export(self, filename, iterator, serializer=None, header=None, streaming=False):
+    @staticmethod
+    def count(lines, name):
+        """Count the exported lines (including the header) and bytes while streaming.
+
+        The time until the first line (running the query) and of the rest of
+        the export are traced as the query and stream spans.
+        """
+        rows = EXPORT_ROWS.labels(name)
+        size = EXPORT_BYTES.labels(name)
+        rows_seen = 0
+        start = first = time.time_ns()
+        try:
+            for line in lines:
+                if not rows_seen:
+                    first = time.time_ns()
+                    add_span('query', start, first, export=name)
+                rows_seen += 1
+                rows.inc()
+                size.inc(len(line.encode()))
+                yield line
+        finally:
+            add_span('stream', first, time.time_ns(), export=name, rows=rows_seen)
+
+    def export(
+        self,
+        filename,
+        iterator,
+        serializer=None,
+        header=None,
+        streaming=False,
+        name=None,
+    ):
         # 1. Create our writer object with the pseudo buffer
         writer = csv.writer(CSVBuffer())
 
@@ -43,7 +76,7 @@ class CSVExport:
         cls = StreamingHttpResponse if streaming else HttpResponse
 
         response = cls(
-            self.serializer(iterator),
+            self.count(self.serializer(iterator), name or filename),
             content_type="text/csv",
         )
 
@@ -1,27 +1,104 @@
 """
-This is a (much needed) load test for this repo. These are some example usages:
+Load test scenarios for the passage API. Every user class is a scenario, and
+declares the SLOs of its requests in `slos`. At the end of a headless run the
+SLOs are checked: the verdict is printed (and written to --slo-report as
+CSV), and the exit code is 1 when one of them was missed. These are some
+example usages:
 
-locust --host=http://127.0.0.1:8001 --headless --users 250 --hatch-rate 25 --run-time 30s
+locust --host=http://127.0.0.1:8001 --headless --users 250 --spawn-rate 25 --run-time 30s
+locust --host=http://127.0.0.1:8001 --headless --users 50 CameraBurst HealthProbe
+
+The thresholds are meant for the load of api/deploy/docker-run-loadtest.sh.
 """
-from uuid import uuid4
-import datetime, time
-from locust import HttpUser, TaskSet, task, between
+import csv
+import datetime
+import gzip
+import json
+import os
+import random
+import time
+from typing import NamedTuple
+from uuid import UUID, uuid4, uuid5
+
+from locust import HttpUser, between, constant_pacing, events, task
+from locust.exception import StopUser
+from locust.runners import WorkerRunner
+
+import zstandard
 
 
 PASSAGE_ENDPOINT_URL = "/v0/milieuzone/passage/"
+EXPORT_ENDPOINT_URL = "/v0/milieuzone/passage/export/"
+HEALTH_ENDPOINT_URL = "/status/health"
+
+AUTHORIZATION_TOKEN = os.getenv("AUTHORIZATION_TOKEN", "insecure")
+
+HELPERTABLE = os.path.join(
+    os.path.dirname(__file__), "api", "src", "passage", "helpertable.csv"
+)
+# The same camera ids as passage/generator.py
+CAMERA_NAMESPACE = UUID("2d4cfd8f-3b4b-4b6e-9d59-3a2b8f1c0e01")
+
+
+class SLO(NamedTuple):
+    p95: float  # ms
+    p99: float  # ms
+    error_rate: float = 0.01
+    min_rps: float = 0
+
 
+class BurstProfile(NamedTuple):
+    passages: tuple  # (min, max) passages in a burst
+    pause: tuple  # (min, max) seconds between bursts
+    weight: int
 
-def get_dt_with_tz_info():
+
+# How busy the road in front of a camera is
+BURST_PROFILES = {
+    "highway": BurstProfile(passages=(5, 30), pause=(1, 3), weight=2),
+    "city": BurstProfile(passages=(1, 8), pause=(2, 8), weight=5),
+    "quiet": BurstProfile(passages=(1, 2), pause=(10, 30), weight=3),
+}
+
+
+def get_dt_with_tz_info(dt=None):
     # Calculate the offset taking into account daylight saving time
     utc_offset_sec = time.altzone if time.localtime().tm_isdst else time.timezone
     utc_offset = datetime.timedelta(seconds=-utc_offset_sec)
-    return datetime.datetime.now().replace(tzinfo=datetime.timezone(offset=utc_offset)).isoformat()
+    dt = dt or datetime.datetime.now()
+    return dt.replace(tzinfo=datetime.timezone(offset=utc_offset)).isoformat()
+
 
+def load_cameras():
+    try:
+        with open(HELPERTABLE, newline="") as f:
+            rows = list(csv.DictReader(f))
+    except OSError:
+        # Not next to the api sources, the default camera only
+        return [{}]
+    return [
+        {
+            "camera_id": str(uuid5(CAMERA_NAMESPACE, row["camera_naam"])),
+            "camera_naam": row["camera_naam"],
+            "camera_kijkrichting": float(row["camera_kijkrichting"]),
+            "rijrichting": int(row["rijrichting"]),
+            "straat": row["order_naam"] or None,
+            "camera_locatie": {
+                "type": "Point",
+                "coordinates": [float(row["longitude"]), float(row["latitude"])],
+            },
+        }
+        for row in rows
+    ]
 
-def create_message():
-    return {
+
+CAMERAS = load_cameras()
+
+
+def create_message(camera=None, passage_at=None):
+    message = {
         "id": str(uuid4()),
-        "passage_at": get_dt_with_tz_info(),
+        "passage_at": get_dt_with_tz_info(passage_at),
         "created_at": get_dt_with_tz_info(),
         "version": "1",
         "straat": None,
@@ -66,12 +143,228 @@ def create_message():
         "electric": None,
         "versit_klasse": "LPABEUR3"
     }
+    message.update(camera or {})
+    return message
+
+
+class BurstUser(HttpUser):
+    """
+    A camera with a burst profile. Abstract, the tasks of a base class are
+    tasks of its subclasses too.
+    """
+
+    abstract = True
+
+    def on_start(self):
+        self.camera = random.choice(CAMERAS)
+        profiles = list(BURST_PROFILES.values())
+        self.profile = random.choices(profiles, [p.weight for p in profiles])[0]
+
+    def wait_time(self):
+        return random.uniform(*self.profile.pause)
+
+
+class CameraBurst(BurstUser):
+    """A camera that sends the passages of a group of cars at once."""
+
+    weight = 20
+    slos = {
+        ("POST", "passage [burst]"): SLO(
+            p95=250, p99=1000, error_rate=0.001, min_rps=50
+        ),
+    }
+
+    @task
+    def burst(self):
+        for _ in range(random.randint(*self.profile.passages)):
+            self.client.post(
+                PASSAGE_ENDPOINT_URL,
+                json=create_message(self.camera),
+                name="passage [burst]",
+            )
+
+
+class CompressedBurst(BurstUser):
+    """
+    A camera like CameraBurst, that compresses its passages with gzip or zstd.
+    Compare with "passage [burst]" for the throughput, the compression ratio
+    is in the iotsignals_request_body_bytes_total metric of the API.
+    """
+
+    weight = 4
+    slos = {
+        ("POST", "passage [burst gzip]"): SLO(p95=250, p99=1000, error_rate=0.001),
+        ("POST", "passage [burst zstd]"): SLO(p95=250, p99=1000, error_rate=0.001),
+    }
+    compressors = {
+        "gzip": gzip.compress,
+        "zstd": zstandard.ZstdCompressor().compress,
+    }
+
+    def on_start(self):
+        super().on_start()
+        self.encoding = random.choice(list(self.compressors))
+
+    @task
+    def burst(self):
+        compress = self.compressors[self.encoding]
+        for _ in range(random.randint(*self.profile.passages)):
+            body = json.dumps(create_message(self.camera)).encode()
+            self.client.post(
+                PASSAGE_ENDPOINT_URL,
+                data=compress(body),
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": self.encoding,
+                },
+                name=f"passage [burst {self.encoding}]",
+            )
 
 
-class CarsBehaviour(HttpUser):
+class DuplicateRetry(HttpUser):
+    """A camera that sends a passage again, because the first response was lost."""
+
+    weight = 2
+    wait_time = between(1, 5)
+    slos = {
+        ("POST", "passage [first]"): SLO(p95=250, p99=1000, error_rate=0.001),
+        ("POST", "passage [retry]"): SLO(p95=250, p99=1000, error_rate=0.001),
+    }
+
+    @task
+    def retry(self):
+        message = create_message(random.choice(CAMERAS))
+        self.client.post(PASSAGE_ENDPOINT_URL, json=message, name="passage [first]")
+        with self.client.post(
+            PASSAGE_ENDPOINT_URL,
+            json=message,
+            name="passage [retry]",
+            catch_response=True,
+        ) as response:
+            if response.status_code == 409:
+                response.success()
+            else:
+                response.failure(f"Expected 409, got {response.status_code}")
+
+
+class BulkIngest(HttpUser):
+    """A camera that comes back online and sends its backlog of the last hour."""
+
+    weight = 1
+    wait_time = between(10, 30)
+    backlog = 200
+    slos = {
+        ("POST", "passage [bulk]"): SLO(p95=500, p99=2000, error_rate=0.001),
+    }
+
+    @task
+    def bulk(self):
+        camera = random.choice(CAMERAS)
+        now = datetime.datetime.now()
+        for n in range(self.backlog, 0, -1):
+            passage_at = now - datetime.timedelta(seconds=n * 3600 / self.backlog)
+            self.client.post(
+                PASSAGE_ENDPOINT_URL,
+                json=create_message(camera, passage_at),
+                name="passage [bulk]",
+            )
+
+
+class WeeklyExport(HttpUser):
+    """The weekly export, downloaded while the passages keep coming in."""
+
     weight = 1
-    wait_time = between(0, 1)
+    wait_time = between(10, 30)
+    slos = {
+        ("GET", "export [week]"): SLO(p95=30000, p99=60000, error_rate=0),
+    }
+
+    def on_start(self):
+        if not AUTHORIZATION_TOKEN:
+            raise StopUser()
+
+    @task
+    def export(self):
+        year, week, _ = datetime.date.today().isocalendar()
+        self.client.get(
+            EXPORT_ENDPOINT_URL,
+            params={"year": year, "week": week},
+            headers={"Authorization": f"Token {AUTHORIZATION_TOKEN}"},
+            name="export [week]",
+        )
+
+
+class HealthProbe(HttpUser):
+    """The liveness probe of the orchestrator, once a second."""
+
+    weight = 1
+    wait_time = constant_pacing(1)
+    slos = {
+        ("GET", "health"): SLO(p95=100, p99=250, error_rate=0, min_rps=1),
+    }
+
+    @task
+    def health(self):
+        self.client.get(HEALTH_ENDPOINT_URL, name="health")
+
+
+def check_slos(environment):
+    """Return (scenario, request, metric, value, threshold, passed) per SLO."""
+    results = []
+    for user_class in environment.user_classes:
+        scenario = user_class.__name__
+        for (method, name), slo in getattr(user_class, "slos", {}).items():
+            request = f"{method} {name}"
+            entry = environment.stats.entries.get((name, method))
+            if entry is None or not entry.num_requests:
+                # A scenario that didn't run hasn't met its SLOs either
+                results.append((scenario, request, "requests", 0, 1, False))
+                continue
+            p95 = entry.get_response_time_percentile(0.95)
+            p99 = entry.get_response_time_percentile(0.99)
+            errors = round(entry.fail_ratio, 4)
+            rps = round(entry.total_rps, 1)
+            checks = [
+                ("p95 ms", p95, slo.p95, p95 <= slo.p95),
+                ("p99 ms", p99, slo.p99, p99 <= slo.p99),
+                ("error rate", errors, slo.error_rate, errors <= slo.error_rate),
+                ("rps", rps, slo.min_rps, rps >= slo.min_rps),
+            ]
+            results += [(scenario, request) + check for check in checks]
+    return results
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    parser.add_argument(
+        "--slo-report", default="", help="Write the SLO verdict to this CSV file"
+    )
+
+
+@events.quitting.add_listener
+def verdict(environment, **kwargs):
+    options = environment.parsed_options
+    # Only the master has the totals, and the web UI has no verdict
+    if isinstance(environment.runner, WorkerRunner) or not options.headless:
+        return
+
+    results = check_slos(environment)
+    failed = [result for result in results if not result[-1]]
+
+    row = "{:<16} {:<24} {:<11} {:>10} {:>10}  {}"
+    print()
+    print(row.format("scenario", "request", "metric", "value", "slo", ""))
+    for scenario, request, metric, value, threshold, passed in results:
+        status = "ok" if passed else "FAILED"
+        print(row.format(scenario, request, metric, value, threshold, status))
+    print(f"\nVerdict: {'FAIL' if failed else 'PASS'} ({len(failed)} SLOs missed)\n")
+
+    if options.slo_report:
+        with open(options.slo_report, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["scenario", "request", "metric", "value", "slo", "passed"])
+            writer.writerows(results)
 
-    @task(1)
-    def post_cars(self):
-        self.client.post(PASSAGE_ENDPOINT_URL, json=create_message())
+    # Keep the exit code of locust itself when the SLOs pass
+    if failed:
+        environment.process_exit_code = 1